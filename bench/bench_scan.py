@@ -0,0 +1,243 @@
+"""
+End-to-end benchmark of scan_rs232.py
+
+Starts a local OPC UA stand-in and N simulated pty scanners, runs the real
+service against them and measures scans/sec, scan-to-ACK latency, CPU and RSS
+of the service process for every N. Results are written as JSON so runs of
+different builds can be compared.
+
+Usage:
+    python bench/bench_scan.py --scanners 1,2,4,8,16,32,64 --duration 20 --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sim import PtyScanner, OpcStandIn
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+#-------------------------------------------------------------------------------------------------------------------
+# Process statistics from /proc
+#-------------------------------------------------------------------------------------------------------------------
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+def process_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------------------------------------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+    return values[idx]
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+def prepare_service_dir(work_dir, scanner_configs, runtime):
+    """Copy of the service with its own conf/scan_rs232.json, the script reads config next to itself"""
+    shutil.copy2(os.path.join(REPO_DIR, "scan_rs232.py"), work_dir)
+    os.makedirs(os.path.join(work_dir, "conf"))
+    shutil.copy2(os.path.join(REPO_DIR, "conf", "conf.py"), os.path.join(work_dir, "conf"))
+    shutil.copy2(os.path.join(REPO_DIR, "conf", "verze.json"), os.path.join(work_dir, "conf"))
+
+    config = {
+        # wait_until_listening() waits for the INFO line "Listening for barcodes"
+        "log_level": "INFO",
+        "log_retention_days": 1,
+        "metrics_port": 0,
+        "runtime": runtime,
+        "scanner_configurations": scanner_configs,
+    }
+    with open(os.path.join(work_dir, "conf", "scan_rs232.json"), "w") as f:
+        json.dump(config, f, indent=4)
+
+def wait_until_listening(output_path, count, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(output_path, errors="replace") as f:
+            if f.read().count("Listening for barcodes") >= count:
+                return True
+        time.sleep(0.1)
+    return False
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# One benchmark run with N scanners
+#-------------------------------------------------------------------------------------------------------------------
+def drive_scanner(scanner, idx, rate, stop_at, ack_timeout, latencies, counters, lock):
+    """Scan like an operator: next barcode after the ACK (or timeout), at most `rate` scans per second"""
+    interval = 1.0 / rate if rate > 0 else 0.0
+    seq = 0
+    while time.monotonic() < stop_at:
+        scanner.drain_acks()
+        sent = scanner.scan(f"B{idx:03d}-{seq:07d}")
+        acked = scanner.wait_ack(ack_timeout)
+        with lock:
+            counters['sent'] += 1
+            if acked is None:
+                counters['timeouts'] += 1
+            else:
+                latencies.append(acked - sent)
+        seq += 1
+
+        pause = sent + interval - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+def run_once(n, args):
+    server = OpcStandIn(n, endpoint=args.endpoint, beep_count=0, ack_delay=args.ack_delay)
+    server.start()
+    scanners = [PtyScanner(f"Scanner-{idx + 1}") for idx in range(n)]
+    work_dir = tempfile.mkdtemp(prefix="bench_scan_")
+    service = None
+
+    try:
+        prepare_service_dir(work_dir, [server.scanner_config(idx, scanner.port) for idx, scanner in enumerate(scanners)], args.runtime)
+        output_path = os.path.join(work_dir, "service.out")
+        with open(output_path, "w") as output:
+            service = subprocess.Popen(
+                [sys.executable, os.path.join(work_dir, "scan_rs232.py"), "--no-remote"],
+                cwd=work_dir, stdout=output, stderr=subprocess.STDOUT
+            )
+
+        if not wait_until_listening(output_path, n, args.startup_timeout):
+            raise RuntimeError(f"Service did not open {n} port(s) within {args.startup_timeout} s, see {output_path}")
+        time.sleep(args.warmup)
+
+        latencies = []
+        counters = {'sent': 0, 'timeouts': 0}
+        lock = threading.Lock()
+
+        cpu_start = process_cpu_seconds(service.pid)
+        start = time.monotonic()
+        stop_at = start + args.duration
+        drivers = [
+            threading.Thread(target=drive_scanner, args=(scanner, idx, args.rate, stop_at, args.ack_timeout, latencies, counters, lock), daemon=True)
+            for idx, scanner in enumerate(scanners)
+        ]
+        for driver in drivers:
+            driver.start()
+
+        rss_peak = 0
+        while any(driver.is_alive() for driver in drivers):
+            rss_peak = max(rss_peak, process_rss_kb(service.pid))
+            time.sleep(0.2)
+        elapsed = time.monotonic() - start
+        cpu_seconds = process_cpu_seconds(service.pid) - cpu_start
+
+        ms = [latency * 1000.0 for latency in latencies]
+        return {
+            "scanners": n,
+            "duration_s": round(elapsed, 3),
+            "scans_sent": counters['sent'],
+            "scans_acked": len(latencies),
+            "ack_timeouts": counters['timeouts'],
+            "scans_per_sec": round(len(latencies) / elapsed, 2),
+            "latency_ms": {
+                "p50": _round(percentile(ms, 50)),
+                "p90": _round(percentile(ms, 90)),
+                "p99": _round(percentile(ms, 99)),
+                "max": _round(max(ms) if ms else None),
+                "mean": _round(sum(ms) / len(ms) if ms else None),
+            },
+            "cpu_percent": round(100.0 * cpu_seconds / elapsed, 2),
+            "rss_peak_kb": rss_peak,
+        }
+    finally:
+        # Also after a failed start, a service left running would open the ptys of the next run
+        if service is not None:
+            service.send_signal(2)
+            try:
+                service.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                service.kill()
+                service.wait()
+        for scanner in scanners:
+            scanner.close()
+        server.stop()
+        if args.keep:
+            print(f"Service directory kept: {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of scan_rs232.py with simulated scanners")
+    parser.add_argument("--scanners", default="1,2,4,8,16,32,64", help="Comma separated scanner counts (default: 1,2,4,8,16,32,64)")
+    parser.add_argument("--rate", type=float, default=5.0, help="Maximum scans per second per scanner (default: 5)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per scanner count (default: 20)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds between port opening and measurement (default: 2)")
+    parser.add_argument("--ack-timeout", type=float, default=5.0, help="Seconds a simulated scanner waits for the ACK (default: 5)")
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Seconds the OPC stand-in waits before confirming (default: 0)")
+    parser.add_argument("--startup-timeout", type=float, default=60.0, help="Seconds to wait for the service to open its ports (default: 60)")
+    parser.add_argument("--endpoint", default="opc.tcp://127.0.0.1:4840", help="Endpoint of the OPC stand-in, the server_url of the benchmarked scanners")
+    parser.add_argument("--runtime", choices=("threads", "asyncio"), default="threads", help="Runtime of the service (default: threads)")
+    parser.add_argument("--output", help="Write results to this JSON file (default: stdout)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary service directories")
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "rate": args.rate,
+            "duration": args.duration,
+            "ack_delay": args.ack_delay,
+            "runtime": args.runtime,
+        },
+        "runs": [],
+    }
+
+    for n in [int(value) for value in args.scanners.split(",") if value.strip()]:
+        print(f"Running {n} scanner(s)...", file=sys.stderr)
+        run = run_once(n, args)
+        print(f"  {run['scans_per_sec']} scans/s, p50 {run['latency_ms']['p50']} ms, p99 {run['latency_ms']['p99']} ms, "
+              f"CPU {run['cpu_percent']} %, RSS {run['rss_peak_kb']} kB", file=sys.stderr)
+        results["runs"].append(run)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
+#-------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,179 @@
+"""
+Simulated scanners and a local OPC UA server stand-in for benchmarks and soak runs.
+
+PtyScanner replaces a /dev/ttyS* scanner with a pseudo terminal pair: the
+service opens the slave side (PtyScanner.port), the simulator injects
+barcodes on the master side and timestamps the ACK (0x06) bytes it gets back.
+unplug()/plug() close and recreate the pair like a pulled USB cable; with
+`link` the port is a stable symlink (like /dev/serial/by-id/...) that goes
+away on unplug() and points to the new pair after plug().
+
+OpcStandIn is a python-opcua Server exposing the default ns=1;i=1000xx nodes
+of N scanners (same layout as conf.get_scanner_configurations) and confirming
+every barcode by setting its barcode_response_node to True.
+"""
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+from opcua import Server, ua
+
+ACK = 0x06
+
+#-------------------------------------------------------------------------------------------------------------------
+# Simulated scanner on a pty pair
+#-------------------------------------------------------------------------------------------------------------------
+class PtyScanner:
+    """One simulated scanner, the service opens `port` like a real serial port"""
+    def __init__(self, name="Scanner", link=None):
+        self.name = name
+        self.link = link
+        self.master_fd = self.slave_fd = None
+        self.plug()
+
+        self._acks = []
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_loop, name=f"{name}-pty", daemon=True)
+        self._thread.start()
+
+    def plug(self):
+        """Create a new pty pair, the service can open `port` again"""
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        if self.link:
+            tmp = self.link + ".tmp"
+            os.symlink(self.device, tmp)
+            os.replace(tmp, self.link)
+        self.port = self.link or self.device
+
+    def unplug(self):
+        """Close the pty pair, the service gets an I/O error and the device node goes away"""
+        if self.link:
+            try:
+                os.unlink(self.link)
+            except FileNotFoundError:
+                pass
+        fds, self.master_fd, self.slave_fd = (self.master_fd, self.slave_fd), None, None
+        for fd in fds:
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            master_fd = self.master_fd
+            if master_fd is None:
+                self._stop.wait(0.05)
+                continue
+            try:
+                readable, _, _ = select.select([master_fd], [], [], 0.2)
+                if not readable:
+                    continue
+                data = os.read(master_fd, 1024)
+            except (OSError, ValueError):
+                # Unplugged meanwhile, or the service closed its side of the pair
+                self._stop.wait(0.05)
+                continue
+            now = time.monotonic()
+            with self._cond:
+                self._acks.extend(now for byte in data if byte == ACK)
+                self._cond.notify_all()
+
+    def scan(self, barcode, terminator="\r\n"):
+        """Send a barcode, returns the monotonic send time"""
+        sent = time.monotonic()
+        os.write(self.master_fd, (barcode + terminator).encode("utf-8"))
+        return sent
+
+    def wait_ack(self, timeout):
+        """Wait for the next ACK byte, returns its monotonic receive time or None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._acks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._acks.pop(0)
+
+    def drain_acks(self):
+        with self._cond:
+            self._acks.clear()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.unplug()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Local OPC UA server stand-in
+#-------------------------------------------------------------------------------------------------------------------
+class OpcStandIn:
+    """
+    Local OPC UA server with the nodes of `scanners` scanners.
+
+    Every non-empty value written to a barcode_node is confirmed by setting the
+    matching barcode_response_node to True after `ack_delay` seconds.
+    """
+    def __init__(self, scanners, endpoint="opc.tcp://127.0.0.1:4840", beep_count=0, ack_delay=0.0):
+        self.endpoint = endpoint
+        self.ack_delay = ack_delay
+        self.barcodes_received = 0
+        self._lock = threading.Lock()
+
+        self.server = Server()
+        self.server.set_endpoint(endpoint)
+        objects = self.server.get_objects_node()
+
+        self.nodes = []
+        self._response_by_barcode = {}
+        for idx in range(scanners):
+            base = 100001 + idx * 5
+            nodes = {
+                'barcode_node': objects.add_variable(ua.NodeId(base, 1), f"barcode_{idx + 1}", ua.Variant("", ua.VariantType.String)),
+                'barcode_response_node': objects.add_variable(ua.NodeId(base + 1, 1), f"barcode_response_{idx + 1}", ua.Variant(False, ua.VariantType.Boolean)),
+                'barcode_beep_count': objects.add_variable(ua.NodeId(base + 2, 1), f"barcode_beep_count_{idx + 1}", ua.Variant(beep_count, ua.VariantType.Int32)),
+                'barcode_health_check': objects.add_variable(ua.NodeId(base + 3, 1), f"barcode_health_check_{idx + 1}", ua.Variant(0, ua.VariantType.Int32)),
+                'barcode_health_check_message': objects.add_variable(ua.NodeId(base + 4, 1), f"barcode_health_check_message_{idx + 1}", ua.Variant("", ua.VariantType.String)),
+            }
+            for node in nodes.values():
+                node.set_writable()
+            self.nodes.append(nodes)
+            self._response_by_barcode[nodes['barcode_node'].nodeid] = nodes['barcode_response_node']
+
+        self._subscription = None
+
+    def scanner_config(self, idx, port):
+        """Scanner entry for scan_rs232.json pointing at this server's nodes"""
+        config = {'port': port, 'baudrate': 9600, 'timeout': 1.0, 'server_url': self.endpoint}
+        config.update({key: node.nodeid.to_string() for key, node in self.nodes[idx].items()})
+        return config
+
+    def start(self):
+        self.server.start()
+        self._subscription = self.server.create_subscription(5, self)
+        self._subscription.subscribe_data_change([nodes['barcode_node'] for nodes in self.nodes])
+
+    def stop(self):
+        self.server.stop()
+
+    def datachange_notification(self, node, val, data):
+        response = self._response_by_barcode.get(node.nodeid)
+        if response is None or not val:
+            return
+        with self._lock:
+            self.barcodes_received += 1
+        if self.ack_delay > 0:
+            threading.Timer(self.ack_delay, response.set_value, args=(True,)).start()
+        else:
+            response.set_value(True)
+#-------------------------------------------------------------------------------------------------------------------
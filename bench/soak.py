@@ -0,0 +1,444 @@
+"""
+Soak run of scan_rs232.py against simulated scanners, started with `scan_rs232.py --soak HOURS`.
+
+The pty scanners and the OPC UA stand-in (see sim.py) run in a separate
+process, so everything measured in the service process belongs to the
+service: every `interval` seconds the monitor takes a tracemalloc snapshot
+and counts open file descriptors, threads and RSS. At the end a JSON report
+lists every allocation site (file:line) whose size kept growing, together
+with the allocation traceback, next to the scan counters of the drivers.
+
+A series counts as growing when it ends at least `min_growth` above the
+first sample, grew in both halves of the run and at least 80 % of its
+changes between two samples were increases. Caches that fill up and stay
+flat are therefore not reported, leaks that grow with every scan are.
+"""
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+soak_frames = 10                # frames kept per allocation, the report shows where a growing site is called from
+soak_min_growth = 16 * 1024     # bytes an allocation site has to grow by before it is reported
+soak_min_rss_growth = 1024      # kB the RSS of the process has to grow by before it is reported
+soak_rising_share = 0.8         # share of the changes between samples that have to be increases
+soak_top_sites = 20             # biggest growing sites listed in the report whether flagged or not
+soak_ack_timeout = 5.0          # seconds a simulated scanner waits for the ACK
+soak_replug_delay = 1.0         # seconds a simulated scanner stays unplugged
+soak_warmup = 60.0              # seconds of service start-up left out of the report, at most a quarter of the run
+
+#-------------------------------------------------------------------------------------------------------------------
+# Synthetic scanners - runs in its own process
+#-------------------------------------------------------------------------------------------------------------------
+class FixedConfig:
+    """Config watcher of a soak run, the synthetic scanners never change"""
+    def poll(self):
+        return None
+
+def _drive_scanner(scanner, idx, rate, stop, counters, latencies, lock):
+    """Scan like an operator: next barcode after the ACK (or timeout), at most `rate` scans per second"""
+    interval = 1.0 / rate if rate > 0 else 0.0
+    seq = 0
+    while not stop.is_set():
+        scanner.drain_acks()
+        try:
+            sent = scanner.scan(f"S{idx:03d}-{seq:09d}")
+        except (OSError, TypeError):
+            # Unplugged right now, the master side is closed or None
+            stop.wait(0.1)
+            continue
+        acked = scanner.wait_ack(soak_ack_timeout)
+        with lock:
+            counters['sent'] += 1
+            if acked is None:
+                counters['timeouts'] += 1
+            else:
+                latencies.append(acked - sent)
+        seq += 1
+
+        pause = sent + interval - time.monotonic()
+        if pause > 0:
+            stop.wait(pause)
+
+def _replug_scanners(scanners, every, stop, counters, lock):
+    """Pull and reconnect the scanners one after another like a loose USB cable"""
+    idx = 0
+    while not stop.wait(every):
+        scanner = scanners[idx % len(scanners)]
+        scanner.unplug()
+        stop.wait(soak_replug_delay)
+        scanner.plug()
+        with lock:
+            counters['unplugs'] += 1
+        idx += 1
+
+def _percentile_ms(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(pct / 100.0 * len(values)))] * 1000.0, 3)
+
+def _wait_parent(conn):
+    """Next message of the parent, None once the parent is gone"""
+    parent = multiprocessing.parent_process()
+    while not conn.poll(0):
+        multiprocessing.connection.wait([conn, parent.sentinel])
+        if not parent.is_alive():
+            return None
+    return conn.recv()
+
+def drive(conn, scanner_count, rate, endpoint, unplug_every):
+    """
+    Child process: OPC stand-in and `scanner_count` pty scanners until the parent sends "stop" or exits.
+
+    Sends the scanner entries for the service first and the scan counters last.
+    """
+    # Ctrl+C reaches the whole process group, the parent ends the drivers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from bench.sim import OpcStandIn, PtyScanner
+
+    link_dir = tempfile.mkdtemp(prefix="scan_rs232_soak_")
+    server = OpcStandIn(scanner_count, endpoint=endpoint)
+    server.start()
+    scanners = [PtyScanner(f"Soak-{idx + 1}", link=os.path.join(link_dir, f"scanner{idx + 1}")) for idx in range(scanner_count)]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    counters = {'sent': 0, 'timeouts': 0, 'unplugs': 0}
+    latencies = []
+    threads = [
+        threading.Thread(target=_drive_scanner, args=(scanner, idx, rate, stop, counters, latencies, lock), name=f"Drive-{idx + 1}", daemon=True)
+        for idx, scanner in enumerate(scanners)
+    ]
+    if unplug_every > 0:
+        threads.append(threading.Thread(target=_replug_scanners, args=(scanners, unplug_every, stop, counters, lock), name="Replug", daemon=True))
+
+    try:
+        conn.send([server.scanner_config(idx, scanner.port) for idx, scanner in enumerate(scanners)])
+        # The service needs a moment to open the ports, scans sent before that would only time out
+        if _wait_parent(conn) == "go":
+            for thread in threads:
+                thread.start()
+            if _wait_parent(conn) is None:
+                return
+    except (EOFError, OSError):
+        return
+    finally:
+        stop.set()
+        for thread in threads:
+            if thread.is_alive():
+                thread.join()
+        for scanner in scanners:
+            scanner.close()
+        server.stop()
+        shutil.rmtree(link_dir, ignore_errors=True)
+
+    with lock:
+        conn.send({
+            'sent': counters['sent'],
+            'acked': len(latencies),
+            'timeouts': counters['timeouts'],
+            'unplugs': counters['unplugs'],
+            'opc_barcodes_received': server.barcodes_received,
+            'latency_ms': {
+                'p50': _percentile_ms(latencies, 50),
+                'p99': _percentile_ms(latencies, 99),
+                'max': _percentile_ms(latencies, 100),
+            },
+        })
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Resource monitor - runs in the service process
+#-------------------------------------------------------------------------------------------------------------------
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+def _growth(first, mid, last, rises, falls, min_growth):
+    """True for a series that ends min_growth above its start, grew in both halves and rose far more often than it fell"""
+    if last - first < min_growth or not first < mid < last:
+        return False
+    return rises >= soak_rising_share * (rises + falls)
+
+class SoakMonitor:
+    """
+    Periodic tracemalloc snapshots and fd/thread/RSS counts of this process.
+
+    Tracing starts after `warmup`, once the sessions are open and the imports
+    done, so the snapshots only hold what was allocated since then and is still
+    alive - that is where a leak shows, and it keeps every sample cheap. Per
+    allocation site only [first, mid, last, rises, falls] is kept, so the
+    monitor itself does not grow with the length of the run.
+    """
+    def __init__(self, interval, duration, warmup=soak_warmup):
+        self.interval = interval
+        self.duration = duration
+        self.warmup = min(warmup, duration / 4)
+        self.samples = []
+        self.sites = {}
+        self._mid_taken = False
+        self._started = None
+        self._tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="SoakMonitor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        if self._stop.wait(self.warmup):
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(soak_frames)
+            self._tracing = True
+        self.sample()
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    def sample(self):
+        elapsed = time.monotonic() - self._started
+        traced, _ = tracemalloc.get_traced_memory()
+        stats = self.snapshot().statistics('lineno')
+        self.samples.append({
+            'elapsed_s': round(elapsed, 1),
+            'rss_kb': _rss_kb(),
+            'fds': _open_fds(),
+            'threads': threading.active_count(),
+            'traced_kb': traced // 1024,
+        })
+
+        sizes = {str(stat.traceback[0]): stat.size for stat in stats}
+        first_sample = len(self.samples) == 1
+        for site in sizes.keys() - self.sites.keys():
+            # A site that appears after the first sample started from nothing
+            start = sizes[site] if first_sample else 0
+            self.sites[site] = [start, 0, start, 0, 0]
+        for site, series in self.sites.items():
+            size = sizes.get(site, 0)
+            if size > series[2]:
+                series[3] += 1
+            elif size < series[2]:
+                series[4] += 1
+            series[2] = size
+
+        if not self._mid_taken and elapsed >= (self.warmup + self.duration) / 2:
+            self._mid_taken = True
+            for series in self.sites.values():
+                series[1] = series[2]
+
+    def stop(self, final_sample=False):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if final_sample and tracemalloc.is_tracing():
+            self.sample()
+
+    def close(self):
+        if self._tracing:
+            tracemalloc.stop()
+
+    def report(self, min_growth=soak_min_growth):
+        """Growth of the process totals and of the allocation sites, biggest growth first"""
+        samples = self.samples
+        totals = {}
+        for key in ('rss_kb', 'fds', 'threads', 'traced_kb'):
+            series = [sample[key] for sample in samples]
+            if not series:
+                continue
+            mid = series[len(series) // 2]
+            rises = sum(1 for a, b in zip(series, series[1:]) if b > a)
+            falls = sum(1 for a, b in zip(series, series[1:]) if b < a)
+            # fds and threads must not grow at all, the RSS also moves with the allocator and gets more room
+            limit = {'fds': 1, 'threads': 1, 'rss_kb': soak_min_rss_growth}.get(key, max(1, min_growth // 1024))
+            totals[key] = {
+                'first': series[0],
+                'last': series[-1],
+                'max': max(series),
+                'growing': len(series) >= 4 and _growth(series[0], mid, series[-1], rises, falls, limit),
+            }
+
+        growing = []
+        for site, (first, mid, last, rises, falls) in self.sites.items():
+            if last > first:
+                growing.append({
+                    'site': site,
+                    'first_kb': round(first / 1024, 1),
+                    'mid_kb': round(mid / 1024, 1),
+                    'last_kb': round(last / 1024, 1),
+                    'growth_kb': round((last - first) / 1024, 1),
+                    'rises': rises,
+                    'falls': falls,
+                    'growing': len(samples) >= 4 and self._mid_taken and _growth(first, mid, last, rises, falls, min_growth),
+                })
+        growing.sort(key=lambda item: item['growth_kb'], reverse=True)
+        return totals, growing
+
+    def tracebacks(self, sites):
+        """Traceback of the biggest allocation at each of `sites`, most recent call last"""
+        if not sites or not tracemalloc.is_tracing():
+            return {}
+        found = {}
+        for stat in self.snapshot().statistics('traceback'):
+            # Frames go from the oldest to the allocating one
+            site = str(stat.traceback[-1])
+            if site in sites and site not in found:
+                found[site] = stat.traceback.format()
+        return found
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Soak run
+#-------------------------------------------------------------------------------------------------------------------
+def free_endpoint(host="127.0.0.1"):
+    """OPC UA endpoint on a port nobody listens on right now"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return f"opc.tcp://{host}:{sock.getsockname()[1]}"
+
+def run_soak(run_service, request_stop, log, hours, scanners=4, rate=1.0, interval=60.0, unplug_every=0.0,
+             endpoint=None, report_path=None, info=None, startup_timeout=60.0):
+    """
+    Serve `scanners` synthetic scanners for `hours` and write the growth report.
+
+    Args:
+        run_service: Called with the scanner entries and a config watcher, blocks until request_stop() is called
+        request_stop: Ends run_service, called after `hours` (Ctrl+C ends the run earlier)
+        log: log_and_print of the service
+        endpoint: Endpoint of the OPC stand-in (default: a free local port)
+        report_path: JSON report, nothing is written if None
+        info: Extra fields of the report (version, runtime, ...)
+
+    Returns:
+        dict: The report
+    """
+    duration = hours * 3600.0
+    if endpoint is None:
+        endpoint = free_endpoint()
+    monitor = SoakMonitor(interval, duration)
+    monitor.start()
+
+    ctx = multiprocessing.get_context("spawn")
+    conn, child_conn = ctx.Pipe()
+    driver = ctx.Process(target=drive, args=(child_conn, scanners, rate, endpoint, unplug_every), name="SoakDriver", daemon=True)
+    driver.start()
+    child_conn.close()
+
+    if not conn.poll(startup_timeout):
+        driver.kill()
+        raise RuntimeError(f"Simulated scanners did not start within {startup_timeout} s")
+    scanner_configs = conn.recv()
+
+    log(f"Soak run: {scanners} synthetic scanner(s) at {rate} scans/s for {hours} h, sample every {interval} s, "
+        f"{'replug every ' + str(unplug_every) + ' s' if unplug_every > 0 else 'no replugging'}", funkce="Soak")
+
+    stopping = threading.Event()
+    send_lock = threading.Lock()
+
+    def start_driving():
+        # Scanning starts once the ports are open, the monitor baseline is taken with the service running
+        if not stopping.wait(min(5.0, interval)):
+            with send_lock:
+                if not stopping.is_set():
+                    conn.send("go")
+
+    def finish():
+        # The last sample is taken from the running service, not from what is left after shutdown
+        monitor.stop(final_sample=True)
+        request_stop()
+
+    started = datetime.now()
+    timer = threading.Timer(duration, finish)
+    timer.daemon = True
+    timer.start()
+    threading.Thread(target=start_driving, name="SoakStart", daemon=True).start()
+    try:
+        run_service(scanner_configs, FixedConfig())
+    finally:
+        timer.cancel()
+        monitor.stop()
+        try:
+            with send_lock:
+                stopping.set()
+                conn.send("stop")
+            counters = conn.recv() if conn.poll(30.0) else {}
+        except (EOFError, OSError):
+            counters = {}
+        driver.join(10.0)
+        if driver.is_alive():
+            driver.kill()
+
+    totals, growing = monitor.report()
+    flagged = [item for item in growing if item['growing']]
+    tracebacks = monitor.tracebacks({item['site'] for item in flagged})
+    for item in flagged:
+        item['traceback'] = tracebacks.get(item['site'], [])
+    monitor.close()
+
+    report = {
+        'started': started.isoformat(timespec="seconds"),
+        'duration_s': round((datetime.now() - started).total_seconds(), 1),
+        'parameters': {
+            'hours': hours,
+            'scanners': scanners,
+            'rate': rate,
+            'interval': interval,
+            'unplug_every': unplug_every,
+            'min_growth_kb': soak_min_growth // 1024,
+        },
+        'info': info or {},
+        'scans': counters,
+        'totals': totals,
+        'growing_sites': flagged,
+        'top_growth': growing[:soak_top_sites],
+        'samples': monitor.samples,
+    }
+    if len(monitor.samples) < 4:
+        report['verdict'] = "too short"
+    elif flagged or any(total['growing'] for total in totals.values()):
+        report['verdict'] = "growth"
+    else:
+        report['verdict'] = "ok"
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    log(f"Soak run finished after {report['duration_s']} s: {counters.get('acked', 0)}/{counters.get('sent', 0)} scans confirmed, "
+        f"{len(monitor.samples)} samples, verdict {report['verdict']}{', report ' + report_path if report_path else ''}", funkce="Soak")
+    for key, total in totals.items():
+        if total['growing']:
+            log(f"{key} kept growing: {total['first']} -> {total['last']}", funkce="Soak", type_of_log="WARNING")
+    for item in flagged:
+        log(f"Allocations at {item['site']} kept growing: {item['first_kb']} kB -> {item['last_kb']} kB", funkce="Soak", type_of_log="WARNING")
+    return report
+#-------------------------------------------------------------------------------------------------------------------
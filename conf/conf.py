@@ -3,17 +3,29 @@ import os
 import sys
 import socket
 import ssl
-import urllib.request
-import urllib.error
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 _config = None
 _version = None
 _remote_config = None
+_remote_cache = None
+
+_api_lock = threading.Lock()
+_api_connections = []       # idle keep-alive connections to the API
+_ssl_contexts = {}
+_refresh_thread = None
+_refresh_stop = threading.Event()
 
 # Remote API configuration
-API_BASE_URL = "https://api.oczsvalitcvat.zb.if.atcsg.net"
+API_BASE_URL = os.environ.get("SCAN_RS232_API_URL", "https://api.oczsvalitcvat.zb.if.atcsg.net")
+API_MAX_CONNECTIONS = 2     # one per concurrent request, kept open between refreshes
 DEVICE_NAME = socket.gethostname()  # Auto-detect hostname, or set manually
 
+DEFAULT_SERVER_URL = "opc.tcp://0.0.0.0:4840"
+
 #-------------------------------------------------------------------------------------------------------------------
 # Path Functions
 #-------------------------------------------------------------------------------------------------------------------
@@ -32,15 +44,36 @@ def get_conf_path():
 #-------------------------------------------------------------------------------------------------------------------
 # Local Config Functions
 #-------------------------------------------------------------------------------------------------------------------
+def get_config_path():
+    """Return the path to scan_rs232.json"""
+    return os.path.join(get_conf_path(), "scan_rs232.json")
+
+
 def get_config():
     """Load scanner configuration from scan_rs232.json"""
     global _config
     if _config is None:  # load only once
-        config_path = os.path.join(get_conf_path(), "scan_rs232.json")
-        with open(config_path, "r") as f:
+        with open(get_config_path(), "r") as f:
             _config = json.load(f)
     return _config
 
+
+def reload_config():
+    """
+    Re-read scan_rs232.json after it changed on disk.
+
+    The cached config is replaced only when the new file parses, so a broken
+    or half-written file leaves the running configuration in place.
+
+    Raises:
+        OSError, ValueError: If the file cannot be read or is not valid JSON
+    """
+    global _config
+    with open(get_config_path(), "r") as f:
+        config = json.load(f)
+    _config = config
+    return _config
+
 #-------------------------------------------------------------------------------------------------------------------
 # Version Functions
 #-------------------------------------------------------------------------------------------------------------------
@@ -59,6 +92,49 @@ def get_version():
 #-------------------------------------------------------------------------------------------------------------------
 # Scanner Configuration Functions
 #-------------------------------------------------------------------------------------------------------------------
+def scanner_with_defaults(scanner_config, idx=0, root=None):
+    """
+    Complete one scanner entry
+
+    Args:
+        scanner_config: Entry of scanner_configurations
+        idx: Position of the entry in the list (default node ids)
+        root: Top level of scan_rs232.json, its server_url, standby_server_urls and opc_redundancy apply to every scanner without its own
+    """
+    if not isinstance(root, dict):
+        # Old list-style files have no top level
+        root = {}
+    standby_server_urls = scanner_config.get('standby_server_urls', root.get('standby_server_urls', []))
+    if isinstance(standby_server_urls, str):
+        standby_server_urls = [standby_server_urls]
+    return {
+        'port': scanner_config.get('port', '/dev/ttyS0'),
+        'baudrate': scanner_config.get('baudrate', 9600),
+        'timeout': scanner_config.get('timeout', 10),
+        'rtscts': scanner_config.get('rtscts', False),
+        'dsrdtr': scanner_config.get('dsrdtr', False),
+        'barcode_node': scanner_config.get('barcode_node', f'ns=1;i={100001 + idx * 5}'),
+        'barcode_response_node': scanner_config.get('barcode_response_node', f'ns=1;i={100002 + idx * 5}'),
+        'barcode_beep_count': scanner_config.get('barcode_beep_count', f'ns=1;i={100003 + idx * 5}'),
+        'barcode_health_check': scanner_config.get('barcode_health_check', f'ns=1;i={100004 + idx * 5}'),
+        'barcode_health_check_message': scanner_config.get('barcode_health_check_message', f'ns=1;i={100005 + idx * 5}'),
+        'ack_timeout': scanner_config.get('ack_timeout', 2.0),
+        'frame_terminator': scanner_config.get('frame_terminator', '\n'),
+        'frame_prefix': scanner_config.get('frame_prefix', ''),
+        'frame_length': scanner_config.get('frame_length', 0),
+        'aim_id': scanner_config.get('aim_id', False),
+        'encoding': scanner_config.get('encoding', 'utf-8'),
+        'duplicate_window': scanner_config.get('duplicate_window', 0),
+        'duplicate_cache_size': scanner_config.get('duplicate_cache_size', 64),
+        'duplicate_response': scanner_config.get('duplicate_response', 'ack'),
+        'scan_queue_size': scanner_config.get('scan_queue_size', 16),
+        'scan_queue_policy': scanner_config.get('scan_queue_policy', 'block'),
+        'worker': scanner_config.get('worker', 0),
+        'server_url': scanner_config.get('server_url', root.get('server_url', DEFAULT_SERVER_URL)),
+        'standby_server_urls': list(standby_server_urls),
+        'opc_redundancy': scanner_config.get('opc_redundancy', root.get('opc_redundancy', 'failover')).lower()
+    }
+
 def get_scanner_configurations():
     """Get list of scanner configurations with defaults"""
     config = get_config()
@@ -71,23 +147,7 @@ def get_scanner_configurations():
         else:
             scanner_configs = [config]
     
-    scanners = []
-    for idx, scanner_config in enumerate(scanner_configs):
-        scanner = {
-            'port': scanner_config.get('port', '/dev/ttyS0'),
-            'baudrate': scanner_config.get('baudrate', 9600),
-            'timeout': scanner_config.get('timeout', 10),
-            'rtscts': scanner_config.get('rtscts', False),
-            'dsrdtr': scanner_config.get('dsrdtr', False),
-            'barcode_node': scanner_config.get('barcode_node', f'ns=1;i={100001 + idx * 5}'),
-            'barcode_response_node': scanner_config.get('barcode_response_node', f'ns=1;i={100002 + idx * 5}'),
-            'barcode_beep_count': scanner_config.get('barcode_beep_count', f'ns=1;i={100003 + idx * 5}'),
-            'barcode_health_check': scanner_config.get('barcode_health_check', f'ns=1;i={100004 + idx * 5}'),
-            'barcode_health_check_message': scanner_config.get('barcode_health_check_message', f'ns=1;i={100005 + idx * 5}')
-        }
-        scanners.append(scanner)
-    
-    return scanners
+    return [scanner_with_defaults(scanner_config, idx, config) for idx, scanner_config in enumerate(scanner_configs)]
 
 #-------------------------------------------------------------------------------------------------------------------
 # Log Configuration Functions
@@ -102,6 +162,202 @@ def get_log_retention_days():
     config = get_config()
     return config.get('log_retention_days', 30)
 
+def get_log_format():
+    """Get log file format from config: 'text' (default) or 'json' (one JSON object per line)"""
+    config = get_config()
+    return config.get('log_format', 'text').lower()
+
+def get_log_console():
+    """Get whether log messages are echoed to the console, default True"""
+    config = get_config()
+    return bool(config.get('log_console', True))
+
+#-------------------------------------------------------------------------------------------------------------------
+# Runtime Configuration Functions
+#-------------------------------------------------------------------------------------------------------------------
+def get_server_url():
+    """Get OPC UA server of the scanners without their own server_url, default opc.tcp://0.0.0.0:4840"""
+    config = get_config()
+    return config.get('server_url', DEFAULT_SERVER_URL)
+
+def get_runtime():
+    """Get scanner runtime from config: 'threads' (default) or 'asyncio'"""
+    config = get_config()
+    return config.get('runtime', 'threads').lower()
+
+def get_workers():
+    """Get number of worker processes the serial ports are spread over, default 1 (all ports in this process)"""
+    config = get_config()
+    return max(1, int(config.get('workers', 1)))
+
+#-------------------------------------------------------------------------------------------------------------------
+# Metrics Configuration Functions
+#-------------------------------------------------------------------------------------------------------------------
+def get_metrics_port():
+    """Get port of the local Prometheus metrics endpoint, default 9105 (0 disables it)"""
+    config = get_config()
+    return int(config.get('metrics_port', 9105))
+
+def get_scan_trace():
+    """Get whether every scan is written to the rolling trace file log/scan_rs232_trace.csv, default True"""
+    config = get_config()
+    return bool(config.get('scan_trace', True))
+
+def get_profile_window():
+    """Get longest duration in seconds of a profile started with SIGUSR2, default 30"""
+    config = get_config()
+    return float(config.get('profile_window', 30))
+
+def get_scan_socket():
+    """Get path of the Unix socket publishing every scan to local processes, '' (default) disables it"""
+    config = get_config()
+    path = config.get('scan_socket', '')
+    if path and not os.path.isabs(path):
+        path = os.path.join(get_script_path(), path)
+    return path
+
+#-------------------------------------------------------------------------------------------------------------------
+# Remote API Connection
+#-------------------------------------------------------------------------------------------------------------------
+def _get_ssl_context(verify_ssl):
+    """Return the SSL context for the API, created once per verify_ssl setting"""
+    with _api_lock:
+        if verify_ssl not in _ssl_contexts:
+            ssl_context = ssl.create_default_context()
+            if not verify_ssl:
+                # For self-signed or internal certificates
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+            _ssl_contexts[verify_ssl] = ssl_context
+        return _ssl_contexts[verify_ssl]
+
+
+def _get_api_connection(timeout, verify_ssl):
+    """
+    Take an idle keep-alive connection to the API or open a new one.
+
+    Returns:
+        tuple: (connection, True if the connection was reused)
+    """
+    url = urllib.parse.urlsplit(API_BASE_URL)
+
+    with _api_lock:
+        while _api_connections:
+            connection = _api_connections.pop()
+            if (connection.host, connection.port) != (url.hostname, url.port or connection.default_port):
+                connection.close()
+                continue
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+
+    if url.scheme == "http":
+        return http.client.HTTPConnection(url.hostname, url.port, timeout=timeout), False
+    return http.client.HTTPSConnection(url.hostname, url.port, timeout=timeout, context=_get_ssl_context(verify_ssl)), False
+
+
+def _release_api_connection(connection):
+    """Keep the connection open for the next request"""
+    with _api_lock:
+        if len(_api_connections) < API_MAX_CONNECTIONS:
+            _api_connections.append(connection)
+            return
+    connection.close()
+
+
+def _get_remote_cache():
+    """Load the ETag/Last-Modified cache of API responses from remote_cache.json"""
+    global _remote_cache
+    if _remote_cache is None:
+        try:
+            with open(os.path.join(get_conf_path(), "remote_cache.json"), "r") as f:
+                _remote_cache = json.load(f)
+        except (OSError, ValueError):
+            _remote_cache = {}
+    return _remote_cache
+
+
+def _save_remote_cache():
+    cache_path = os.path.join(get_conf_path(), "remote_cache.json")
+    tmp_path = cache_path + ".tmp"
+    with _api_lock:
+        data = json.dumps(_remote_cache, indent=4)
+    with open(tmp_path, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, cache_path)
+
+
+def _api_get(path, timeout=10, verify_ssl=False):
+    """
+    GET a JSON document from the remote API.
+
+    The request is conditional on the ETag/Last-Modified of the cached
+    response; on 304 Not Modified the cached document is returned. A kept
+    alive connection that the server closed meanwhile is retried once on a
+    new one.
+
+    Args:
+        path: Path and query, relative to API_BASE_URL
+        timeout: Socket timeout in seconds
+        verify_ssl: Verify SSL certificate
+
+    Returns:
+        dict: Parsed JSON document
+    """
+    url = urllib.parse.urlsplit(API_BASE_URL)
+    target = url.path.rstrip("/") + path
+
+    with _api_lock:
+        cached = _get_remote_cache().get(path)
+
+    headers = {
+        'Accept': 'application/json',
+        'User-Agent': 'at_scanner/1.0'
+    }
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    while True:
+        connection, reused = _get_api_connection(timeout, verify_ssl)
+        try:
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+            break
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            if reused:
+                continue
+            raise
+
+    if response.will_close:
+        connection.close()
+    else:
+        _release_api_connection(connection)
+
+    if response.status == 304 and cached:
+        return cached['body']
+    if response.status != 200:
+        raise Exception(f"HTTP {response.status}: {response.reason}")
+
+    data = json.loads(body.decode('utf-8'))
+
+    with _api_lock:
+        _remote_cache[path] = {
+            'etag': response.getheader('ETag'),
+            'last_modified': response.getheader('Last-Modified'),
+            'body': data
+        }
+    try:
+        _save_remote_cache()
+    except OSError as e:
+        print(f"Failed to save remote config cache: {e}")
+    return data
+
 #-------------------------------------------------------------------------------------------------------------------
 # Remote Config Functions
 #-------------------------------------------------------------------------------------------------------------------
@@ -125,40 +381,9 @@ def fetch_remote_config(device_name=None, timeout=10, verify_ssl=False):
     if device_name is None:
         device_name = DEVICE_NAME
     
-    url = f"{API_BASE_URL}/getConfigScanner?name={device_name}"
-    
     try:
-        # Create SSL context
-        if verify_ssl:
-            ssl_context = ssl.create_default_context()
-        else:
-            # For self-signed or internal certificates
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Create request with headers
-        request = urllib.request.Request(
-            url,
-            headers={
-                'Accept': 'application/json',
-                'User-Agent': 'at_scanner/1.0'
-            }
-        )
-        
-        # Make the request
-        with urllib.request.urlopen(request, timeout=timeout, context=ssl_context) as response:
-            if response.status == 200:
-                data = response.read().decode('utf-8')
-                _remote_config = json.loads(data)
-                return _remote_config
-            else:
-                raise Exception(f"HTTP {response.status}: {response.reason}")
-                
-    except urllib.error.HTTPError as e:
-        raise Exception(f"HTTP Error {e.code}: {e.reason}")
-    except urllib.error.URLError as e:
-        raise Exception(f"URL Error: {e.reason}")
+        _remote_config = _api_get(f"/getConfigScanner?name={urllib.parse.quote(device_name)}", timeout, verify_ssl)
+        return _remote_config
     except json.JSONDecodeError as e:
         raise Exception(f"JSON decode error: {e}")
     except Exception as e:
@@ -188,40 +413,9 @@ def fetch_remote_root_config(device_name=None, timeout=10, verify_ssl=False):
     if device_name is None:
         device_name = DEVICE_NAME
     
-    url = f"{API_BASE_URL}/getConfigRoot?name={device_name}"
-    
     try:
-        # Create SSL context
-        if verify_ssl:
-            ssl_context = ssl.create_default_context()
-        else:
-            # For self-signed or internal certificates
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Create request with headers
-        request = urllib.request.Request(
-            url,
-            headers={
-                'Accept': 'application/json',
-                'User-Agent': 'at_scanner/1.0'
-            }
-        )
-        
-        # Make the request
-        with urllib.request.urlopen(request, timeout=timeout, context=ssl_context) as response:
-            if response.status == 200:
-                data = response.read().decode('utf-8')
-                _remote_config = json.loads(data)
-                return _remote_config
-            else:
-                raise Exception(f"HTTP {response.status}: {response.reason}")
-                
-    except urllib.error.HTTPError as e:
-        raise Exception(f"HTTP Error {e.code}: {e.reason}")
-    except urllib.error.URLError as e:
-        raise Exception(f"URL Error: {e.reason}")
+        _remote_config = _api_get(f"/getConfigRoot?name={urllib.parse.quote(device_name)}", timeout, verify_ssl)
+        return _remote_config
     except json.JSONDecodeError as e:
         raise Exception(f"JSON decode error: {e}")
     except Exception as e:
@@ -271,27 +465,51 @@ def update_local_config_from_remote(device_name=None, timeout=10, verify_ssl=Fal
         bool: True if successful, False otherwise
     """
     try:
-        remote_config = fetch_remote_config(device_name, timeout, verify_ssl)
-        remote_root_config = fetch_remote_root_config(device_name, timeout, verify_ssl)
+        # Both documents are requested at the same time, so an unreachable API costs one timeout, not two
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            scanner_future = executor.submit(fetch_remote_config, device_name, timeout, verify_ssl)
+            root_future = executor.submit(fetch_remote_root_config, device_name, timeout, verify_ssl)
+            remote_config = scanner_future.result()
+            remote_root_config = root_future.result()
+
+        config_path = get_config_path()
+
+        remote_data = {
+            "log_level": remote_root_config["log_level"],
+            "log_retention_days": int(remote_root_config["log_retention_days"]),  # Convert to int
+            "scanner_configurations": remote_config["scanner_configurations"]
+        }
+        # OPC servers may come with either document, the scanner entries can also name their own
+        for key in ("server_url", "standby_server_urls", "opc_redundancy"):
+            for document in (remote_config, remote_root_config):
+                if key in document:
+                    remote_data[key] = document[key]
+                    break
 
-        config_path = os.path.join(get_conf_path(), "scan_rs232.json")
+        # Only the keys the API owns are replaced, local settings (runtime, workers, ...) stay as they are
+        try:
+            with open(config_path, "r") as f:
+                local_data = json.load(f)
+        except (OSError, ValueError):
+            local_data = None
+        final_data = dict(local_data) if isinstance(local_data, dict) else {}
+        final_data.update(remote_data)
+        if final_data == local_data:
+            return True
         
         # Backup existing config
         backup_path = config_path + ".backup"
         if os.path.exists(config_path):
             import shutil
             shutil.copy2(config_path, backup_path)
-        
-
-        final_data = {
-            "log_level": remote_root_config["log_level"],
-            "log_retention_days": int(remote_root_config["log_retention_days"]),  # Convert to int
-            "scanner_configurations": remote_config["scanner_configurations"]
-        }
 
 
-        with open(config_path, "w") as f:
+        # Write next to the file and swap it in, a running service reloads
+        # scan_rs232.json when it changes and must never see it half-written
+        tmp_path = config_path + ".tmp"
+        with open(tmp_path, "w") as f:
             json.dump(final_data, f, indent=4)
+        os.replace(tmp_path, config_path)
         
         # Clear cached config so it reloads
         global _config
@@ -304,6 +522,49 @@ def update_local_config_from_remote(device_name=None, timeout=10, verify_ssl=Fal
         print(f"Failed to update local config: {e}")
         return False
 
+#-------------------------------------------------------------------------------------------------------------------
+# Background Refresh of Local Config
+#-------------------------------------------------------------------------------------------------------------------
+def start_remote_config_refresh(interval=None, device_name=None, timeout=10, verify_ssl=False):
+    """
+    Keep scan_rs232.json in sync with the remote API from a background thread.
+
+    The first refresh runs immediately, later ones every interval seconds.
+    The caller goes on with the local config; changes written to the file
+    are picked up by whoever watches it.
+
+    Args:
+        interval: Seconds between refreshes (default: 'remote_refresh_interval' from config, 300; 0 refreshes once)
+        device_name: Device/machine name (default: hostname)
+        timeout: Request timeout in seconds (default: 10)
+        verify_ssl: Verify SSL certificate (default: False)
+    """
+    global _refresh_thread
+
+    if interval is None:
+        try:
+            interval = float(get_config().get('remote_refresh_interval', 300))
+        except (OSError, ValueError):
+            interval = 300.0
+
+    def run():
+        while True:
+            update_local_config_from_remote(device_name, timeout, verify_ssl)
+            if interval <= 0 or _refresh_stop.wait(interval):
+                return
+
+    if _refresh_thread is None:
+        _refresh_stop.clear()
+        _refresh_thread = threading.Thread(target=run, name="RemoteConfigRefresh", daemon=True)
+        _refresh_thread.start()
+
+
+def stop_remote_config_refresh():
+    """Stop the background refresh; a request in flight is abandoned with its daemon thread"""
+    global _refresh_thread
+    _refresh_stop.set()
+    _refresh_thread = None
+
 #-------------------------------------------------------------------------------------------------------------------
 # Main
 #-------------------------------------------------------------------------------------------------------------------
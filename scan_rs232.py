@@ -1,366 +1,3950 @@
+import time
+_process_start = time.perf_counter()    # reference point of the startup profile
+
 import serial
 import json
 import sys
 import threading
-import time
 import os
 import logging
-import inspect
+import select
+import argparse
+import asyncio
+import sqlite3
+import bisect
+import contextlib
+import collections
+import queue
+import atexit
+import signal
+import hashlib
+import socket
+import struct
+import traceback
+import csv
+import io
+import multiprocessing
+import multiprocessing.connection
+import concurrent.futures
+
+from datetime import datetime, timezone
+from logging.handlers import TimedRotatingFileHandler, RotatingFileHandler, QueueHandler, QueueListener
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from conf.conf import get_scanner_configurations, scanner_with_defaults, get_server_url, get_log_level, get_log_retention_days, get_version, get_runtime, get_metrics_port, get_log_format, get_log_console, get_workers, get_scan_socket, get_profile_window, get_scan_trace, get_config_path, reload_config, update_local_config_from_remote, start_remote_config_refresh, stop_remote_config_refresh
+
+global_barcode = ""
+server_url = "opc.tcp://0.0.0.0:4840"
+
+health_check_interval = 10.0        # seconds between writes of the health check counter
+config_reload_interval = 2.0        # seconds between checks of scan_rs232.json for changes
+restart_backoff_min = 1.0           # seconds before the first restart of a dead scanner or worker process
+restart_backoff_max = 60.0          # upper limit of the restart delay, it doubles with every failed start
+restart_healthy_after = 60.0        # seconds a restarted scanner has to keep running to reset its delay
+worker_stop_timeout = 10.0          # seconds worker processes get to stop before they are terminated
+port_reopen_min = 0.5               # seconds before the first attempt to reopen a missing or lost serial port
+port_reopen_max = 30.0              # upper limit of the reopen delay, it doubles with every failed attempt
+port_poll_interval = 0.5            # seconds between checks whether the device node of a missing port appeared
+profile_sample_interval = 0.01      # seconds between two stack samples of the SIGUSR2 profiler
+trace_max_bytes = 10 * 1024 * 1024  # size of the scan trace file before it is rolled over
+trace_backup_count = 5              # rolled over scan trace files kept next to the current one
+
+ACK = bytes([0x06])
+BEL = bytes([0x07])
+NAK = bytes([0x15])
+beep_interval = 0.5                 # seconds after each BEL byte before the next one
+
+journal_path = None                 # SQLite file of the journal, default data/scan_journal.sqlite3
+journal_max_rows = 10000            # oldest undelivered barcodes are dropped above this size
+journal_trim_every = 100            # appends between two checks of the journal size
+journal_retry_interval = 5.0        # seconds between attempts to forward journaled barcodes
+journal_compact_interval = 300.0    # seconds between checkpoints/vacuums of the journal file
+
+logger_name = os.path.splitext(os.path.basename(__file__))[0]
+logger = logging.getLogger(logger_name)
+
+#-------------------------------------------------------------------------------------------------------------------
+# Metrics - Prometheus text format on a local HTTP endpoint
+#-------------------------------------------------------------------------------------------------------------------
+metrics_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metric_help = {
+    'scanner_stage_seconds': ('histogram', 'Duration of one stage of a scan (serial_read, opc_write, ack_wait, beep, health_check)'),
+    'scanner_scans_total': ('counter', 'Barcodes read from the scanner'),
+    'scanner_ack_timeouts_total': ('counter', 'Barcodes not confirmed by the PLC within ack_timeout'),
+    'scanner_rejected_total': ('counter', 'Barcodes a connected OPC server refused to write, dropped from the journal'),
+    'scanner_duplicates_total': ('counter', 'Repeated scans answered locally without going to OPC'),
+    'scanner_queue_depth': ('gauge', 'Barcodes read from the port and waiting for the OPC handshake'),
+    'scanner_queue_dropped_total': ('counter', 'Barcodes dropped or rejected because the scan queue was full'),
+    'scanner_port_connected': ('gauge', '1 while the serial port of the scanner is open, 0 while it is missing or lost'),
+    'scanner_port_recovery_seconds': ('histogram', 'Time from losing the serial port to reading from it again'),
+    'opc_errors_total': ('counter', 'Failed OPC UA requests and rejected node writes'),
+    'scan_subscribers': ('gauge', 'Local processes connected to the scan fan-out socket'),
+    'scan_events_dropped_total': ('counter', 'Scan records not sent to a local subscriber that stopped reading'),
+    'supervisor_worker_restarts_total': ('counter', 'Worker processes restarted after they exited on their own'),
+}
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms rendered in the Prometheus text format"""
+    def __init__(self, buckets=metrics_buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}         # (name, labels) -> value
+        self._histograms = {}       # (name, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Set a gauge, rendered like a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+
+        lines = []
+        for name in sorted({key[0] for key in counters} | {key[0] for key in histograms}):
+            metric_type, help_text = _metric_help.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (key_name, labels), histogram in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+metrics = Metrics()
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve the metrics on http://host:port/metrics from a daemon thread, returns the server or None"""
+    try:
+        httpd = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as ex:
+        log_and_print(funkce="start_metrics_server", text=f"Metrics endpoint on {host}:{port} not started: {ex}", type_of_log="WARNING")
+        return None
+
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="Metrics", daemon=True).start()
+    log_and_print(f"Metrics available on http://{host}:{port}/metrics")
+    return httpd
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Shutdown signalling
+#-------------------------------------------------------------------------------------------------------------------
+class WakeupEvent:
+    """
+    threading.Event that can also be waited for with select() next to a
+    serial port, so blocked readers wake up immediately when it is set
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._read_fd, self._write_fd = os.pipe()
+
+    def set(self):
+        if not self._event.is_set():
+            self._event.set()
+            os.write(self._write_fd, b"\0")
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def fileno(self):
+        return self._read_fd
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+shutdown_event = WakeupEvent()
+
+def request_shutdown():
+    """Stop all scanner threads, waking the ones blocked on their serial port"""
+    shutdown_event.set()
+
+def _shutdown_signal(signum, frame):
+    """SIGINT/SIGTERM handler, the main loop notices shutdown_event and stops everything in order"""
+    request_shutdown()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Startup profile
+#-------------------------------------------------------------------------------------------------------------------
+class StartupProfile:
+    """
+    Wall-clock phases of the service start, printed with --startup-profile.
+
+    Phases run concurrently, so each one is reported with its start offset
+    from the import of this module and its own duration. Recording ends once
+    every scanner reported ready and the first OPC connect attempt finished;
+    later restarts and reconnects are not profiled.
+    """
+    def __init__(self, started):
+        self.started = started
+        self._phases = []           # (name, start, end) in perf_counter seconds
+        self._ready = 0
+        self._finished = False
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name, start, end):
+        with self._condition:
+            if not self._finished:
+                self._phases.append((name, start, end))
+                self._condition.notify_all()
+
+    def scanner_ready(self, scanner_name):
+        """Called once the scanner reads its port and is registered at the OPC server"""
+        now = time.perf_counter()
+        with self._condition:
+            if not self._finished:
+                self._phases.append((f"{scanner_name} ready", now, now))
+                self._ready += 1
+                self._condition.notify_all()
+
+    def wait_ready(self, count, timeout=None, phases=("OPC connect",)):
+        """Wait until count scanners are ready and the given phases were recorded, then stop recording"""
+        def ready():
+            recorded = {phase[0] for phase in self._phases}
+            return self._ready >= count and all(name in recorded for name in phases)
+
+        with self._condition:
+            result = self._condition.wait_for(ready, timeout)
+            self._finished = True
+        return result
+
+    def report(self):
+        with self._condition:
+            phases = sorted(self._phases, key=lambda phase: phase[1])
+            end = max((phase[2] for phase in phases), default=self.started)
+
+        lines = [f"Startup profile: {(end - self.started) * 1000:.1f} ms until the last phase ended"]
+        lines.append(f"  {'phase':<36}{'start ms':>10}{'took ms':>10}")
+        for name, start, stop in phases:
+            lines.append(f"  {name:<36}{(start - self.started) * 1000:>10.1f}{(stop - start) * 1000:>10.1f}")
+        return "\n".join(lines)
+
+startup_profile = StartupProfile(_process_start)
+
+def report_startup(scanner_count, print_profile=False, timeout=60.0):
+    """Wait for all scanners to come up and log how long the start took"""
+    ready = startup_profile.wait_ready(scanner_count, timeout)
+    if not ready:
+        log_and_print(f"Not all scanners were ready within {timeout:.0f} s of the start", type_of_log="WARNING")
+    if print_profile:
+        log_and_print(startup_profile.report())
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Diagnostics - SIGUSR1 dumps all thread stacks, SIGUSR2 starts/stops the sampling profiler
+#-------------------------------------------------------------------------------------------------------------------
+def dump_stacks():
+    """Log the current stack of every thread, named, so a scanner stuck in OPC or on its port is easy to spot"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f"--- {names.get(ident, ident)} ---\n{''.join(traceback.format_stack(frame))}")
+    log_and_print(f"Stacks of {len(parts)} thread(s):\n" + "\n".join(parts), type_of_log="WARNING")
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every profile_sample_interval seconds
+    and writes them as collapsed stacks (thread;file:function;... count), the
+    input of flamegraph.pl and speedscope.
+
+    Nothing runs until toggle(); a profile stops by itself after `window`
+    seconds, so a forgotten one does not keep sampling.
+    """
+    def __init__(self, directory, window=30.0, interval=None):
+        self.directory = directory
+        self.window = window
+        self.interval = profile_sample_interval if interval is None else interval
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    def toggle(self):
+        """Start a profile, or stop the running one and write it"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._stop.set()
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="SamplingProfiler", daemon=True)
+            self._thread.start()
+
+    def _run(self, stop):
+        log_and_print(f"Profiling for up to {self.window:.0f} s, send SIGUSR2 again to stop earlier")
+        own = threading.get_ident()
+        stacks = collections.Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + self.window
+
+        while not stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(frames))] += 1
+            samples += 1
+
+        path = os.path.join(self.directory, f"{logger_name}_profile_{multiprocessing.current_process().name}_{actual_date_time()}.folded")
+        try:
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as ex:
+            log_and_print(funkce="SamplingProfiler", text=f"Profile not written: {ex}", type_of_log="ERROR")
+            return
+        log_and_print(f"Profile of {time.monotonic() - started:.1f} s ({samples} samples) written to {path}")
+
+def install_diagnostics(log_dir, on_signal=None):
+    """
+    SIGUSR1 dumps the thread stacks, SIGUSR2 starts/stops a profile into log_dir.
+    on_signal(signum) is called as well, the supervisor passes the signal on to its workers.
+    """
+    profiler = SamplingProfiler(log_dir, get_profile_window())
+    signals = queue.SimpleQueue()
+
+    def diagnostics():
+        while True:
+            signum = signals.get()
+            try:
+                if signum == signal.SIGUSR1:
+                    dump_stacks()
+                else:
+                    profiler.toggle()
+                if on_signal is not None:
+                    on_signal(signum)
+            except Exception as ex:
+                log_and_print(funkce="install_diagnostics", text=str(ex), type_of_log="ERROR")
+
+    threading.Thread(target=diagnostics, name="Diagnostics", daemon=True).start()
+
+    def handler(signum, frame):
+        # Runs in the main thread between two bytecodes, possibly while it holds a lock (logging, the
+        # profiler), so it only queues the signal; SimpleQueue.put is reentrant, the Diagnostics thread does the work
+        signals.put(signum)
+
+    signal.signal(signal.SIGUSR1, handler)
+    signal.signal(signal.SIGUSR2, handler)
+    return profiler
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Pooled OPC UA session
+#-------------------------------------------------------------------------------------------------------------------
+opc_timeout = 4                     # seconds to wait for an answer to one OPC UA service request
+opc_keepalive_interval = 5.0        # seconds between keep-alive reads of the server state
+opc_reconnect_backoff_min = 0.5     # first reconnect delay in seconds, doubled after every failed attempt
+opc_reconnect_backoff_max = 30.0    # upper limit of the reconnect delay in seconds
+opc_subscription_period = 10        # publishing and sampling interval of monitored items in milliseconds
+opc_parallel_writers = 16           # threads writing barcodes of 'parallel' scanners to all their servers at once
+
+_opc_sessions = {}
+_opc_sessions_lock = threading.Lock()
+
+# opcua is the slowest import of the service and the asyncio runtime does not need it at all
+Client = None
+ua = None
+_opcua_lock = threading.Lock()
+
+def _load_opcua():
+    """Import opcua on first use, returns its ua module"""
+    global Client, ua, _connection_status_codes
+
+    if ua is None:
+        with _opcua_lock:
+            if ua is None:
+                with startup_profile.phase("import opcua"):
+                    from opcua import Client as opcua_client, ua as opcua_ua
+                _connection_status_codes = _status_codes(opcua_ua)
+                Client = opcua_client
+                ua = opcua_ua
+    return ua
+
+def _node_key(nodeid):
+    return _load_opcua().NodeId.from_string(nodeid) if isinstance(nodeid, str) else nodeid
+
+# Scanner config entries holding a NodeId
+scanner_node_keys = ('barcode_node', 'barcode_response_node', 'barcode_beep_count', 'barcode_health_check', 'barcode_health_check_message')
+
+class NodeRegistry:
+    """
+    Configured nodes of one OPC session, resolved once instead of on every call.
+
+    Node strings are parsed to NodeIds once. After a connect the session
+    registers them at the server (RegisterNodes) and reads their DataType in
+    one request each, so writes use the registered NodeId and the Variant type
+    the server declares. Registrations belong to the session and are dropped
+    on disconnect; unknown nodes and types fall back to parsing and guessing.
+    """
+    def __init__(self, ua_loader):
+        self._ua_loader = ua_loader
+        self._entries = {}          # node string -> [NodeId or None until parsed, registered NodeId or None, VariantType or None]
+        self._lock = threading.Lock()
+
+    def add(self, nodeids):
+        """Add node strings, cheap enough to call before the OPC library is loaded"""
+        with self._lock:
+            for nodeid in nodeids:
+                self._entries.setdefault(nodeid, [None, None, None])
+
+    def pending(self):
+        """Node strings and NodeIds not registered in the current session"""
+        ua_module = self._ua_loader()
+        with self._lock:
+            for nodeid, entry in self._entries.items():
+                if entry[0] is None:
+                    entry[0] = ua_module.NodeId.from_string(nodeid)
+            return [(nodeid, entry[0]) for nodeid, entry in self._entries.items() if entry[1] is None]
+
+    def update(self, nodeids, registered, datatypes):
+        ua_module = self._ua_loader()
+        with self._lock:
+            for nodeid, registered_id, datatype in zip(nodeids, registered, datatypes):
+                entry = self._entries[nodeid]
+                entry[1] = registered_id
+                entry[2] = _variant_type_of_datatype(datatype, ua_module)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry[1] = entry[2] = None
+
+    def nodeid(self, nodeid):
+        """NodeId to use in requests for the node string"""
+        entry = self._entries.get(nodeid)
+        if entry is None or entry[0] is None:
+            parsed = self._ua_loader().NodeId.from_string(nodeid)
+            with self._lock:
+                entry = self._entries.setdefault(nodeid, [None, None, None])
+                entry[0] = parsed
+        return entry[1] or entry[0]
+
+    def variant_type(self, nodeid, value):
+        """Variant type declared by the server, isinstance() guess if it is not known"""
+        entry = self._entries.get(nodeid)
+        if entry is not None and entry[2] is not None:
+            return entry[2]
+        return _variant_type(value, self._ua_loader())
+
+    def declared_type(self, nodeid):
+        """VariantType declared by the server, None if it is not known"""
+        entry = self._entries.get(nodeid)
+        return entry[2] if entry is not None else None
+
+_scalar_datatype_ids = range(1, 22)     # Boolean .. LocalizedText, the built-in DataTypes a value is written as directly
+
+def _variant_type_of_datatype(datatype, ua_module):
+    """
+    VariantType of a concrete built-in DataType NodeId (ns=0;i=1..21 share their numbers), else None
+
+    Abstract and container types (Structure, DataValue, BaseDataType, DiagnosticInfo)
+    are left to the isinstance() guess of the written value.
+    """
+    if datatype is None or datatype.NamespaceIndex != 0 or datatype.Identifier not in _scalar_datatype_ids:
+        return None
+    try:
+        return ua_module.VariantType(datatype.Identifier)
+    except ValueError:
+        return None
+
+class OpcSession:
+    """
+    Long-lived OPC UA session shared by all scanner threads.
+
+    A background thread connects to the server, keeps the session alive and
+    reconnects with exponential backoff when the connection is lost. Reads and
+    writes then cost a single service request instead of a connect/disconnect.
+    Data change subscriptions are kept on one OPC UA subscription and created
+    again after every reconnect.
+    """
+    def __init__(self, url, timeout=None, keepalive_interval=None, backoff_min=None, backoff_max=None):
+        self.url = url
+        self.timeout = opc_timeout if timeout is None else timeout
+        self.keepalive_interval = opc_keepalive_interval if keepalive_interval is None else keepalive_interval
+        self.backoff_min = opc_reconnect_backoff_min if backoff_min is None else backoff_min
+        self.backoff_max = opc_reconnect_backoff_max if backoff_max is None else backoff_max
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._monitored = {}            # NodeId -> list of data change callbacks
+        self._handles = {}              # NodeId -> monitored item handle in the current subscription
+        self._subscription = None
+        self._subscription_lock = threading.Lock()
+
+        self.registry = NodeRegistry(_load_opcua)
+        self._registry_lock = threading.Lock()
+
+    def start(self):
+        """Start the background thread maintaining the session"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"OPC-{self.url}", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and close the session"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+        self._disconnect()
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def get_client(self, wait=None):
+        """
+        Return the connected client
+
+        Args:
+            wait: Seconds to wait for the session to come up (default: request timeout)
+
+        Raises:
+            ConnectionError: If the server is not connected within `wait` seconds
+        """
+        if not self._connected.wait(self.timeout if wait is None else wait):
+            raise ConnectionError(f"OPC server {self.url} is not connected")
+        client = self._client
+        if client is None:
+            raise ConnectionError(f"OPC server {self.url} is not connected")
+        return client
+
+    def invalidate(self, reason=None):
+        """Mark the session as broken, the background thread reconnects it"""
+        with self._lock:
+            if not self._connected.is_set():
+                return
+            self._connected.clear()
+        log_and_print(funkce="OpcSession", text=f"{self.url} - connection lost: {reason}", type_of_log="WARNING")
+        self._wakeup.set()
+
+    def subscribe(self, nodeid, callback):
+        """
+        Call callback(value) on every data change of nodeid
+
+        The callback runs in the OPC receiving thread and must return quickly.
+        """
+        key = _node_key(nodeid)
+        with self._lock:
+            self._monitored.setdefault(key, []).append(callback)
+
+        if self._connected.is_set():
+            try:
+                self._monitor([key])
+            except Exception as ex:
+                log_and_print(funkce="OpcSession", text=f"{self.url} - subscribe {nodeid} - {ex}", type_of_log="ERROR")
+                _handle_opc_error(self, ex)
+
+    def unsubscribe(self, nodeid, callback):
+        """Remove a callback registered with subscribe()"""
+        key = _node_key(nodeid)
+        with self._lock:
+            callbacks = self._monitored.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callbacks:
+                return
+            self._monitored.pop(key, None)
+
+        with self._subscription_lock:
+            handle = self._handles.pop(key, None)
+            if handle is not None and self._subscription is not None:
+                try:
+                    self._subscription.unsubscribe(handle)
+                except Exception:
+                    pass
+
+    def is_subscribed(self, nodeid):
+        """True when data changes of nodeid are currently being delivered"""
+        key = _node_key(nodeid)
+        return self._connected.is_set() and key in self._handles
+
+    def datachange_notification(self, node, val, data):
+        for callback in list(self._monitored.get(node.nodeid, ())):
+            callback(val)
+
+    def register_nodes(self, nodeids):
+        """Add nodes to the registry, they are resolved now if connected, otherwise on connect"""
+        self.registry.add(nodeids)
+
+        if self._connected.is_set():
+            try:
+                self._resolve_nodes()
+            except Exception as ex:
+                log_and_print(funkce="OpcSession", text=f"{self.url} - register nodes - {ex}", type_of_log="ERROR")
+                _handle_opc_error(self, ex)
+
+    def _resolve_nodes(self):
+        with self._registry_lock:
+            pending = self.registry.pending()
+            client = self._client
+            if not pending or client is None:
+                return
+
+            parsed = [nodeid for _, nodeid in pending]
+            registered = client.uaclient.register_nodes(parsed)
+            results = client.uaclient.get_attributes(parsed, ua.AttributeIds.DataType)
+            datatypes = [result.Value.Value if result.StatusCode.is_good() else None for result in results]
+            self.registry.update([node for node, _ in pending], registered, datatypes)
+
+    def _monitor(self, keys):
+        with self._subscription_lock:
+            keys = [key for key in keys if key not in self._handles]
+            if not keys:
+                return
+
+            client = self._client
+            if client is None:
+                raise ConnectionError(f"OPC server {self.url} is not connected")
+            if self._subscription is None:
+                self._subscription = client.create_subscription(opc_subscription_period, self)
+
+            results = self._subscription.subscribe_data_change([client.get_node(key) for key in keys])
+            for key, result in zip(keys, results):
+                if isinstance(result, ua.StatusCode):
+                    log_and_print(funkce="OpcSession", text=f"{self.url} - subscribe {key.to_string()} - {result}", type_of_log="ERROR")
+                else:
+                    self._handles[key] = result
+
+    def _connect(self):
+        _load_opcua()
+        client = Client(self.url, timeout=self.timeout)
+        client.connect()
+        with self._lock:
+            self._client = client
+
+        # Before the session is announced, so the first requests already use the registry
+        try:
+            self._resolve_nodes()
+        except Exception as ex:
+            # Not fatal, requests then use the parsed NodeIds and guessed types
+            log_and_print(funkce="OpcSession", text=f"{self.url} - register nodes - {ex}", type_of_log="WARNING")
+        self._connected.set()
+
+        with self._lock:
+            keys = list(self._monitored)
+        if keys:
+            self._monitor(keys)
+
+    def _disconnect(self):
+        with self._subscription_lock:
+            self._subscription = None
+            self._handles.clear()
+        self.registry.clear()
+        with self._lock:
+            client = self._client
+            self._client = None
+            self._connected.clear()
+        if client is not None:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def _keepalive(self):
+        # Cheap read of the server state, fails fast if the session is gone
+        self._client.get_node(ua.NodeId(ua.ObjectIds.Server_ServerStatus_State)).get_value()
+
+    def _run(self):
+        backoff = self.backoff_min
+
+        while not self._stop.is_set():
+            if not self._connected.is_set():
+                self._disconnect()
+                try:
+                    with startup_profile.phase("OPC connect"):
+                        self._connect()
+                    log_and_print(funkce="OpcSession", text=f"{self.url} - connected")
+                    backoff = self.backoff_min
+                except Exception as ex:
+                    log_and_print(funkce="OpcSession", text=f"{self.url} - {ex} (retry in {backoff:.1f} s)", type_of_log="ERROR")
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            self._wakeup.wait(self.keepalive_interval)
+            self._wakeup.clear()
+
+            if self._stop.is_set():
+                break
+
+            if self._connected.is_set():
+                try:
+                    self._keepalive()
+                except Exception as ex:
+                    self.invalidate(ex)
+
+        self._disconnect()
+
+def get_opc_session(url=None):
+    """Return the shared session for `url` (default: server_url), creating and starting it on first use"""
+    if url is None:
+        url = server_url
+
+    with _opc_sessions_lock:
+        session = _opc_sessions.get(url)
+        if session is None:
+            session = OpcSession(url)
+            _opc_sessions[url] = session
+            session.start()
+    return session
+
+def close_opc_sessions():
+    """Close all pooled sessions"""
+    global _opc_writers
+
+    with _opc_sessions_lock:
+        sessions = list(_opc_sessions.values())
+        _opc_sessions.clear()
+        writers, _opc_writers = _opc_writers, None
+    # Writes to a slow standby server still running finish first, they are bounded by opc_timeout
+    if writers is not None:
+        writers.shutdown(wait=True)
+    for session in sessions:
+        session.stop()
+
+#-------------------------------------------------------------------------------------------------------------------
+# OPC servers of one scanner - server_url, standby servers and redundancy
+#-------------------------------------------------------------------------------------------------------------------
+opc_redundancy_modes = ("failover", "parallel")
+
+_opc_writers = None
+
+def _get_opc_writers():
+    """Thread pool of the parallel writes, created on first use"""
+    global _opc_writers
+
+    with _opc_sessions_lock:
+        if _opc_writers is None:
+            _opc_writers = concurrent.futures.ThreadPoolExecutor(max_workers=opc_parallel_writers, thread_name_prefix="OPC-write")
+        return _opc_writers
+
+def nodes_by_server(scanners_config):
+    """Configured nodes of all scanners grouped by the URL of every server they are written to"""
+    nodes = {}
+    for scanner_cfg in scanners_config:
+        for url in scanner_server_urls(scanner_cfg):
+            nodes.setdefault(url, []).extend(scanner_cfg[key] for key in scanner_node_keys)
+    return nodes
+
+def scanner_server_urls(scanner_config):
+    """server_url of the scanner followed by its standby_server_urls, each URL once"""
+    urls = []
+    for url in [scanner_config.get('server_url') or server_url] + list(scanner_config.get('standby_server_urls') or []):
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+class OpcEndpoints:
+    """
+    OPC UA servers of one scanner, each on its own pooled session.
+
+    With opc_redundancy 'failover' a barcode goes to the first connected
+    server (server_url, then standby_server_urls in order). With 'parallel'
+    it is written to every connected server at the same time, the scanner
+    goes on as soon as one write succeeded and takes the first ACK of any
+    server, so a slow or failing server does not hold it up.
+    """
+    def __init__(self, scanner_config, get_session=None):
+        self.mode = scanner_config.get('opc_redundancy', 'failover')
+        if self.mode not in opc_redundancy_modes:
+            raise ValueError(f"Unknown opc_redundancy '{self.mode}', expected one of {', '.join(opc_redundancy_modes)}")
+        if get_session is None:
+            get_session = get_opc_session
+        self.sessions = [get_session(url) for url in scanner_server_urls(scanner_config)]
+        self.primary = self.sessions[0]
+        self._writes = {}               # last write(): Future (parallel) or bool -> session
+
+    def is_connected(self):
+        return any(session.is_connected() for session in self.sessions)
+
+    def connected(self):
+        return [session for session in self.sessions if session.is_connected()]
+
+    def write(self, hodnoty, ack_waiter=None):
+        """
+        Write node values like zapis_do_opc_davka
+
+        Args:
+            ack_waiter: AckWaiter armed for exactly the servers the values go to, right before they are written
+
+        Returns:
+            list: Sessions the values were written to, empty if none. In 'parallel'
+                  mode only the first successful one, the other writes finish in the background.
+        """
+        sessions = self.connected()
+        self._writes = {}
+        if self.mode == "failover" or len(sessions) < 2:
+            for session in sessions:
+                if ack_waiter is not None:
+                    ack_waiter.arm([session])
+                if zapis_do_opc_davka(hodnoty, session):
+                    self._writes = {True: session}
+                    return [session]
+            return []
+
+        if ack_waiter is not None:
+            ack_waiter.arm(sessions)
+        self._writes = {_get_opc_writers().submit(zapis_do_opc_davka, hodnoty, session): session for session in sessions}
+        for write in concurrent.futures.as_completed(self._writes):
+            if write.result():
+                return [self._writes[write]]
+        return []
+
+    def written(self):
+        """Every session the last write() reached, the parallel writes still running are waited for"""
+        return [session for write, session in self._writes.items() if write is True or write.result()]
+
+    def reset(self, nodeid):
+        """Set nodeid back to False on every server the last barcode was written to"""
+        for session in self.written():
+            zapis_do_opc(nodeid, False, session)
+
+    def write_all(self, hodnoty):
+        """Write node values to every connected server, e.g. the health check message"""
+        for session in self.connected():
+            zapis_do_opc_davka(hodnoty, session)
+
+# Status codes meaning the session or channel is gone, not that the node itself is bad
+_connection_status_names = (
+    "BadSessionIdInvalid",
+    "BadSessionClosed",
+    "BadSecureChannelIdInvalid",
+    "BadSecureChannelClosed",
+    "BadConnectionClosed",
+    "BadServerNotConnected",
+    "BadCommunicationError",
+    "BadTimeout",
+)
+_connection_status_codes = ()           # resolved by _load_opcua() or the asyncua session
+
+def _status_codes(ua_module):
+    return tuple(getattr(ua_module.StatusCodes, name) for name in _connection_status_names)
+
+# Transport errors: socket errors, ConnectionError of a closed session, a request without answer
+_connection_errors = (OSError, EOFError, concurrent.futures.TimeoutError, asyncio.TimeoutError)
+
+def _handle_opc_error(session, ex):
+    """
+    Invalidate the session when the error means the connection is broken
+
+    A node level status or a value that cannot be encoded (ValueError,
+    struct.error, ...) only fails the request, the session stays up.
+    """
+    metrics.inc("opc_errors_total", server=session.url)
+
+    # Status code errors of opcua and asyncua both carry the code in ex.code
+    code = getattr(ex, "code", None)
+    if isinstance(code, int):
+        lost = code in _connection_status_codes
+    else:
+        lost = isinstance(ex, _connection_errors)
+    if lost:
+        session.invalidate(ex)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Zapis do OPC serveru
+#-------------------------------------------------------------------------------------------------------------------
+def _variant_type(value, ua_module=None):
+    if ua_module is None:
+        ua_module = _load_opcua()
+
+    if isinstance(value, bool):
+        return ua_module.VariantType.Boolean
+    elif isinstance(value, int):
+        return ua_module.VariantType.Int32
+    elif isinstance(value, float):
+        return ua_module.VariantType.Double
+    elif isinstance(value, str):
+        return ua_module.VariantType.String
+    else:
+        raise ValueError("Unsupported type")
+
+def zapis_do_opc(nodeidrun, value, session=None):
+    log_and_print(funkce="zapis_do_opc", text="Začátek", type_of_log="DEBUG")
+
+    if session is None:
+        session = get_opc_session()
+
+    try:
+        client = session.get_client()
+        node = client.get_node(session.registry.nodeid(nodeidrun))
+
+        if value != '':
+            node.set_value(ua.DataValue(ua.Variant(value, session.registry.variant_type(nodeidrun, value))))
+            log_and_print("%s", value, funkce="zapis_do_opc", type_of_log="DEBUG")
+    except Exception as ex:
+        log_and_print(funkce="zapis_do_opc", text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+        _handle_opc_error(session, ex)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Zapis vice hodnot do OPC serveru jednim pozadavkem
+#-------------------------------------------------------------------------------------------------------------------
+def source_timestamp(scan):
+    """SourceTimestamp of a scanned barcode value, the time its frame was complete"""
+    return datetime.fromtimestamp(scan.scanned_at, timezone.utc)
+
+def _hodnoty(hodnoty):
+    """(nodeid, value[, source timestamp]) tuples as (nodeid, value, timestamp or None), empty strings skipped"""
+    return [(item[0], item[1], item[2] if len(item) > 2 else None) for item in hodnoty if item[1] != '']
+
+def zapis_do_opc_davka(hodnoty, session=None):
+    """
+    Write several node/value pairs in one OPC UA Write service call
+
+    The values are sent in the given order, so e.g. the response node can be
+    reset before the barcode itself is written. Empty strings are skipped,
+    same as in zapis_do_opc.
+
+    Args:
+        hodnoty: List of (nodeid, value) or (nodeid, value, source timestamp) tuples
+        session: OPC session (default: shared session for server_url)
+
+    Returns:
+        bool: True if every value was written
+    """
+    log_and_print(funkce="zapis_do_opc_davka", text="Začátek", type_of_log="DEBUG")
+
+    if session is None:
+        session = get_opc_session()
+
+    hodnoty = _hodnoty(hodnoty)
+    if not hodnoty:
+        return True
+
+    try:
+        # A connected client means opcua is loaded
+        client = session.get_client()
+
+        registry = session.registry
+        nodeids = [registry.nodeid(nodeidrun) for nodeidrun, _, _ in hodnoty]
+        datavalues = [ua.DataValue(ua.Variant(value, registry.variant_type(nodeidrun, value)), sourceTimestamp=timestamp) for nodeidrun, value, timestamp in hodnoty]
+        results = client.uaclient.set_attributes(nodeids, datavalues)
+    except Exception as ex:
+        log_and_print(funkce="zapis_do_opc_davka", text=", ".join(nodeidrun for nodeidrun, _, _ in hodnoty) + " - " + str(ex), type_of_log="ERROR")
+        _handle_opc_error(session, ex)
+        return False
+
+    ok = True
+    for (nodeidrun, value, _), result in zip(hodnoty, results):
+        if result.is_good():
+            log_and_print("%s = %s", nodeidrun, value, funkce="zapis_do_opc_davka", type_of_log="DEBUG")
+        else:
+            log_and_print(funkce="zapis_do_opc_davka", text=f"{nodeidrun} - {result}", type_of_log="ERROR")
+            metrics.inc("opc_errors_total", server=session.url)
+            ok = False
+    return ok
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Cteni z OPC serveru
+#-------------------------------------------------------------------------------------------------------------------
+def cteni_z_opc(nodeidrun, session=None):
+    log_and_print(funkce="cteni_z_opc", text="Začátek", type_of_log="DEBUG")
+
+    if session is None:
+        session = get_opc_session()
+
+    ret = None
+
+    try:
+        client = session.get_client()
+        node = client.get_node(session.registry.nodeid(nodeidrun))
+
+        ret = node.get_value()
+        log_and_print("%s", ret, funkce="cteni_z_opc", type_of_log="DEBUG")
+    except Exception as ex:
+        log_and_print(funkce="cteni_z_opc", text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+        _handle_opc_error(session, ex)
+
+    return ret
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Cteni vice hodnot z OPC serveru jednim pozadavkem
+#-------------------------------------------------------------------------------------------------------------------
+def cteni_z_opc_davka(nodeids, session=None):
+    """
+    Read several nodes in one OPC UA Read service call
+
+    Returns:
+        list: Values in the order of nodeids, None where the read failed
+    """
+    if session is None:
+        session = get_opc_session()
+
+    try:
+        client = session.get_client()
+        results = client.uaclient.get_attributes([session.registry.nodeid(nodeidrun) for nodeidrun in nodeids], ua.AttributeIds.Value)
+    except Exception as ex:
+        log_and_print(funkce="cteni_z_opc_davka", text=", ".join(nodeids) + " - " + str(ex), type_of_log="ERROR")
+        _handle_opc_error(session, ex)
+        return [None] * len(nodeids)
+
+    values = []
+    for nodeidrun, result in zip(nodeids, results):
+        if result.StatusCode.is_good():
+            values.append(result.Value.Value)
+        else:
+            log_and_print(funkce="cteni_z_opc_davka", text=f"{nodeidrun} - {result.StatusCode}", type_of_log="ERROR")
+            metrics.inc("opc_errors_total", server=session.url)
+            values.append(None)
+    return values
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Health check - one heartbeat for all scanners
+#-------------------------------------------------------------------------------------------------------------------
+# Counter wraps to 0 at the end of the positive range of the node's integer type
+_counter_limits = {'SByte': 2**7, 'Byte': 2**8, 'Int16': 2**15, 'UInt16': 2**16, 'Int32': 2**31, 'UInt32': 2**32, 'Int64': 2**63, 'UInt64': 2**64}
+
+def _next_counter(counter, variant_type):
+    """Next health check value, an unknown type wraps like Int32"""
+    return (counter + 1) % _counter_limits.get(getattr(variant_type, "name", None), 2**31)
+
+class HeartbeatScheduler:
+    """
+    Increments the barcode_health_check counters of all scanners from one thread.
+
+    Beats follow the monotonic clock (start + k * interval), so the cadence does
+    not drift with scans or OPC calls. Counters are kept locally and read from
+    the server only once; every beat writes all nodes of a session in one
+    batched write. A scanner may also pass a status callback, its text is
+    written to the health check message node whenever it changes.
+    """
+    def __init__(self, interval=None):
+        self.interval = health_check_interval if interval is None else interval
+        self._nodes = {}            # (nodeid, session) -> [session, scanner_name, counter or None, message node, status callback, last status]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="Heartbeat", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def register(self, nodeid, session, scanner_name="Scanner", message_node=None, status=None):
+        """A scanner with standby servers registers its health check node once per session"""
+        with self._lock:
+            self._nodes[(nodeid, session)] = [session, scanner_name, None, message_node, status, None]
+
+    def unregister(self, nodeid):
+        """Stop beating nodeid on all sessions"""
+        with self._lock:
+            for key in [key for key in self._nodes if key[0] == nodeid]:
+                del self._nodes[key]
+
+    def _run(self):
+        next_beat = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_beat - time.monotonic())):
+            try:
+                self._beat()
+            except Exception as ex:
+                log_and_print(funkce="HeartbeatScheduler", text=str(ex), type_of_log="ERROR")
+
+            # Keep the phase, beats missed during a long stall are skipped instead of bunched up
+            next_beat += self.interval
+            now = time.monotonic()
+            if next_beat <= now:
+                next_beat += ((now - next_beat) // self.interval + 1) * self.interval
+
+    def _beat(self):
+        by_session = {}
+        with self._lock:
+            for (nodeid, _), (session, scanner_name, counter, message_node, status, last_status) in self._nodes.items():
+                by_session.setdefault(session, []).append((nodeid, scanner_name, counter, message_node, status, last_status))
+
+        for session, entries in by_session.items():
+            if not session.is_connected():
+                continue
+
+            start = time.perf_counter()
+
+            unknown = [entry[0] for entry in entries if entry[2] is None]
+            current = dict(zip(unknown, cteni_z_opc_davka(unknown, session))) if unknown else {}
+
+            counters = []
+            statuses = []
+            for nodeid, _, counter, message_node, status, last_status in entries:
+                if counter is None:
+                    counter = current.get(nodeid)
+                if isinstance(counter, int):
+                    counters.append((nodeid, _next_counter(counter, session.registry.declared_type(nodeid))))
+                if status is not None and message_node:
+                    text = status()
+                    if text != last_status:
+                        statuses.append((nodeid, message_node, text))
+
+            writes = counters + [(message_node, text) for _, message_node, text in statuses]
+            written = set(writes)
+            if writes and not zapis_do_opc_davka(writes, session):
+                # One bad node must not stop the heartbeat of the other scanners on the session
+                written = {write for write in writes if session.is_connected() and zapis_do_opc_davka([write], session)}
+            if written:
+                with self._lock:
+                    for nodeid, value in counters:
+                        if (nodeid, session) in self._nodes and (nodeid, value) in written:
+                            self._nodes[(nodeid, session)][2] = value
+                    for nodeid, message_node, text in statuses:
+                        if (nodeid, session) in self._nodes and (message_node, text) in written:
+                            self._nodes[(nodeid, session)][5] = text
+
+            duration = time.perf_counter() - start
+            for _, scanner_name, *_ in entries:
+                metrics.observe("scanner_stage_seconds", duration, scanner=scanner_name, stage="health_check")
+
+_heartbeat = None
+
+def get_heartbeat_scheduler():
+    """Return the shared heartbeat scheduler, creating and starting it on first use"""
+    global _heartbeat
+
+    with _opc_sessions_lock:
+        if _heartbeat is None:
+            _heartbeat = HeartbeatScheduler()
+            _heartbeat.start()
+    return _heartbeat
+
+def close_heartbeat_scheduler():
+    global _heartbeat
+
+    with _opc_sessions_lock:
+        heartbeat = _heartbeat
+        _heartbeat = None
+    if heartbeat is not None:
+        heartbeat.stop()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Cekani na potvrzeni z PLC
+#-------------------------------------------------------------------------------------------------------------------
+class AckWaiter:
+    """
+    Wakes a scanner thread when the PLC confirms a barcode on its barcode_response_node
+
+    A scanner with standby servers subscribes callback(session) on each of
+    them, `session` then tells which server confirmed first. Only the
+    servers the current barcode was written to (see arm) can confirm it, a
+    late ACK of an earlier barcode from another server is ignored.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = {}
+        self._sessions = None
+        self.session = None
+
+    def notify(self, value, session=None):
+        if value is not True:
+            return
+        sessions = self._sessions
+        if sessions is not None and session is not None and session not in sessions:
+            return
+        if not self._event.is_set():
+            self.session = session
+        self._event.set()
+
+    def callback(self, session):
+        """Data change callback for `session`, the same object every time so it can be unsubscribed"""
+        callback = self._callbacks.get(session)
+        if callback is None:
+            callback = self._callbacks[session] = lambda value: self.notify(value, session)
+        return callback
+
+    def arm(self, sessions=None):
+        """Forget earlier confirmations, call before the barcode is written to `sessions` (default: any server)"""
+        self._sessions = None if sessions is None else frozenset(sessions)
+        self.session = None
+        self._event.clear()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+def cekani_na_potvrzeni(barcode_response_node, ack_waiter, ack_timeout, sessions=None):
+    """
+    Wait until the PLC sets barcode_response_node to True
+
+    Uses the data change subscription when it is active on one of the
+    sessions and falls back to polling the node of every session every
+    100 ms otherwise.
+
+    Args:
+        sessions: Sessions the barcode was written to (default: shared session for server_url)
+
+    Returns:
+        bool: True if confirmed within ack_timeout seconds
+    """
+    if not sessions:
+        sessions = [get_opc_session()]
+
+    if any(session.is_subscribed(barcode_response_node) for session in sessions):
+        return ack_waiter.wait(ack_timeout)
+
+    deadline = time.monotonic() + ack_timeout
+    while True:
+        for session in sessions:
+            if cteni_z_opc(barcode_response_node, session) is True:
+                ack_waiter.session = session
+                return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Local scan fan-out - every scan and its outcome for processes on the same gateway
+#-------------------------------------------------------------------------------------------------------------------
+# One record per SOCK_SEQPACKET packet, little endian:
+#
+#   offset  size  field
+#        0     1  version          SCAN_RECORD_VERSION
+#        1     1  outcome          SCAN_ACK .. SCAN_DROPPED
+#        2     2  name_len         bytes of the scanner name
+#        4     2  port_len         bytes of the serial port
+#        6     2  barcode_len      bytes of the barcode
+#        8     8  scanned_at       float64, Unix time the frame was complete
+#       16     8  decided_at       float64, Unix time of the outcome
+#       24     -  scanner name, port and barcode, UTF-8, lengths above
+SCAN_RECORD = struct.Struct("<BBHHHdd")
+SCAN_RECORD_VERSION = 1
+
+SCAN_ACK = 1                # confirmed by the PLC, ACK sent to the scanner
+SCAN_NOT_CONFIRMED = 2      # written to OPC, no confirmation within ack_timeout
+SCAN_JOURNALED = 3          # OPC not available, the forwarder sends a second record once it is delivered
+SCAN_DUPLICATE = 4          # repeated scan answered locally (duplicate_window)
+SCAN_DROPPED = 5            # dropped or rejected because the scan queue was full
+
+scan_outcomes = {True: SCAN_ACK, False: SCAN_NOT_CONFIRMED, None: SCAN_JOURNALED}
+
+def pack_scan_record(scanner_name, port, barcode, outcome, scanned_at, decided_at):
+    name, port, barcode = (value.encode("utf-8") for value in (scanner_name, port, barcode))
+    return SCAN_RECORD.pack(SCAN_RECORD_VERSION, outcome, len(name), len(port), len(barcode), scanned_at, decided_at) + name + port + barcode
+
+def unpack_scan_record(data):
+    """
+    Decode one record read from the fan-out socket
+
+    Returns:
+        dict: scanner, port, barcode, outcome, scanned_at, decided_at
+    """
+    version, outcome, name_len, port_len, barcode_len, scanned_at, decided_at = SCAN_RECORD.unpack_from(data)
+    if version != SCAN_RECORD_VERSION:
+        raise ValueError(f"Unknown scan record version {version}")
+    text = memoryview(data)[SCAN_RECORD.size:]
+    return {
+        'scanner': bytes(text[:name_len]).decode("utf-8"),
+        'port': bytes(text[name_len:name_len + port_len]).decode("utf-8"),
+        'barcode': bytes(text[name_len + port_len:name_len + port_len + barcode_len]).decode("utf-8"),
+        'outcome': outcome,
+        'scanned_at': scanned_at,
+        'decided_at': decided_at,
+    }
+
+class ScanPublisher:
+    """
+    Unix domain socket (SOCK_SEQPACKET) that sends every scan record to all
+    connected local subscribers.
+
+    Sending never blocks a scanner: a subscriber with a full socket buffer
+    misses the record (scan_events_dropped_total), a closed one is removed.
+    Without start() or without subscribers publish() does nothing.
+    """
+    def __init__(self):
+        self.path = None
+        self._server = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    def start(self, path):
+        """Listen on the socket path, returns False if it cannot be created"""
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            # A socket file left behind by a killed process would make bind() fail
+            if os.path.exists(path):
+                os.unlink(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            server.bind(path)
+            server.listen(16)
+        except OSError as ex:
+            server.close()
+            log_and_print(funkce="ScanPublisher", text=f"Scan socket {path} not started: {ex}", type_of_log="WARNING")
+            return False
+
+        self.path = path
+        self._server = server
+        self._stop = WakeupEvent()
+        self._thread = threading.Thread(target=self._accept, name="ScanPublisher", daemon=True)
+        self._thread.start()
+        log_and_print(f"Scan records available on unix socket {path}")
+        return True
+
+    def _accept(self):
+        while True:
+            readable, _, _ = select.select([self._server, self._stop.fileno()], [], [])
+            if self._stop.is_set():
+                return
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                continue
+            conn.setblocking(False)
+            with self._lock:
+                self._subscribers.append(conn)
+                metrics.set("scan_subscribers", len(self._subscribers))
+
+    def publish(self, scanner_name, port, scan, outcome):
+        if not self._subscribers:
+            return
+        record = pack_scan_record(scanner_name, port, scan.barcode, outcome, scan.scanned_at, time.time())
+        with self._lock:
+            for conn in list(self._subscribers):
+                try:
+                    conn.send(record, socket.MSG_DONTWAIT | socket.MSG_NOSIGNAL)
+                except BlockingIOError:
+                    metrics.inc("scan_events_dropped_total")
+                except OSError:
+                    self._subscribers.remove(conn)
+                    conn.close()
+            metrics.set("scan_subscribers", len(self._subscribers))
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            for conn in self._subscribers:
+                conn.close()
+            self._subscribers.clear()
+        self._server.close()
+        self._stop.close()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+scan_publisher = ScanPublisher()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Scan trace - one CSV line per scan with the duration of each stage, for offline jitter analysis
+#-------------------------------------------------------------------------------------------------------------------
+scan_outcome_names = {SCAN_ACK: "ack", SCAN_NOT_CONFIRMED: "not_confirmed", SCAN_JOURNALED: "journaled", SCAN_DUPLICATE: "duplicate", SCAN_DROPPED: "dropped"}
+
+class ScanTracer:
+    """
+    Rolling trace file (trace_max_bytes x trace_backup_count) with the columns
+
+        time        local time of the frame, ISO 8601 with microseconds
+        scanner     scanner name
+        port        serial port
+        outcome     ack, not_confirmed, journaled, duplicate or dropped
+        frame_us    first byte arrival -> frame complete
+        write_us    frame complete -> OPC write acknowledged (includes the scan queue)
+        ack_us      OPC write -> PLC confirmation observed, ACK sent to the scanner
+        beep_us     ACK -> last BEL byte sent
+        barcode     the barcode
+
+    Stages a scan did not reach are empty. Lines are written by a
+    QueueListener thread, finish() only formats and queues one line.
+    """
+    def __init__(self):
+        self.path = None
+        self._logger = logging.getLogger(f"{logger_name}.trace")
+        self._logger.propagate = False
+        self._listener = None
+
+    def start(self, path):
+        file_handler = RotatingFileHandler(path, maxBytes=trace_max_bytes, backupCount=trace_backup_count)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        trace_queue = queue.SimpleQueue()
+        self._logger.addHandler(QueueHandler(trace_queue))
+        self._logger.setLevel(logging.INFO)
+        self._listener = QueueListener(trace_queue, file_handler)
+        self._listener.start()
+        self.path = path
+        log_and_print(f"Scan trace written to {path}")
+
+    def finish(self, scanner_name, port, scan, outcome):
+        if self._listener is None:
+            return
+
+        def us(start, end):
+            return "" if start is None or end is None else round((end - start) * 1e6)
+
+        line = io.StringIO()
+        csv.writer(line, lineterminator="").writerow((
+            datetime.fromtimestamp(scan.scanned_at).isoformat(timespec="microseconds"),
+            scanner_name,
+            port,
+            scan_outcome_names.get(outcome, outcome),
+            us(scan.arrived, scan.framed),
+            us(scan.framed, scan.written),
+            us(scan.written, scan.acked),
+            us(scan.acked, scan.beeped),
+            scan.barcode,
+        ))
+        self._logger.info(line.getvalue())
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+scan_tracer = ScanTracer()
+
+def scan_done(scanner_name, port, scan, outcome):
+    """Final outcome of a scan, goes to the local subscribers and the trace file"""
+    scan_publisher.publish(scanner_name, port, scan, outcome)
+    scan_tracer.finish(scanner_name, port, scan, outcome)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Store-and-forward journal
+#-------------------------------------------------------------------------------------------------------------------
+class BarcodeJournal:
+    """
+    On-disk journal of scanned barcodes (SQLite in WAL mode).
+
+    Every scan is appended before it is written to OPC and deleted once the
+    write succeeded. Barcodes that could not be written stay in the journal
+    until the ScanForwarder delivers them. The journal is bounded to max_rows,
+    the oldest entries are dropped first. The size is checked every
+    trim_every appends, so it can exceed max_rows by that much meanwhile.
+
+    Worker processes share the file, so each one only counts and trims the
+    ports it appended to or read from; max_rows applies per process.
+    """
+    def __init__(self, path, max_rows=None, trim_every=None):
+        self.path = path
+        self.max_rows = journal_max_rows if max_rows is None else max_rows
+        self.trim_every = journal_trim_every if trim_every is None else trim_every
+        self._appends = 0
+        self._ports = set()         # ports served by this process, the only ones trimmed here
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "port TEXT NOT NULL, "
+            "barcode TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_port ON scans (port, id)")
+
+    def append(self, port, barcode, created=None):
+        """Store a barcode scanned at Unix time `created` (default now), returns the id of the new entry"""
+        with self._lock:
+            self._ports.add(port)
+            entry_id = self._conn.execute(
+                "INSERT INTO scans (port, barcode, created) VALUES (?, ?, ?)", (port, barcode, time.time() if created is None else created)
+            ).lastrowid
+
+            self._appends += 1
+            if self._appends >= self.trim_every:
+                self._trim()
+        return entry_id
+
+    def trim(self):
+        """Drop the oldest entries above max_rows"""
+        with self._lock:
+            self._trim()
+
+    def _trim(self):
+        self._appends = 0
+        if not self._ports:
+            return
+        ports = tuple(self._ports)
+        where = f"port IN ({', '.join('?' * len(ports))})"
+        count = self._conn.execute(f"SELECT COUNT(*) FROM scans WHERE {where}", ports).fetchone()[0]
+        if count > self.max_rows:
+            self._conn.execute(
+                f"DELETE FROM scans WHERE id IN (SELECT id FROM scans WHERE {where} ORDER BY id LIMIT ?)", ports + (count - self.max_rows,)
+            )
+            log_and_print(funkce="BarcodeJournal", text=f"Journal full, dropped {count - self.max_rows} oldest barcode(s)", type_of_log="WARNING")
+
+    def delete(self, entry_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM scans WHERE id = ?", (entry_id,))
+
+    def has_older(self, port, entry_id):
+        """True when an undelivered barcode of the port was journaled before entry_id"""
+        with self._lock:
+            return bool(self._conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM scans WHERE port = ? AND id < ?)", (port, entry_id)
+            ).fetchone()[0])
+
+    def oldest(self, port):
+        """Oldest undelivered (id, barcode, created) of a port or None"""
+        with self._lock:
+            self._ports.add(port)
+            return self._conn.execute(
+                "SELECT id, barcode, created FROM scans WHERE port = ? ORDER BY id LIMIT 1", (port,)
+            ).fetchone()
+
+    def compact(self):
+        """Trim the journal, fold the WAL back into the database file and release free pages"""
+        with self._lock:
+            self._trim()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA incremental_vacuum")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ScanForwarder:
+    """
+    Background thread that drains the journal to OPC in scan order once the
+    server is reachable again. Scanner threads register their nodes and ACK
+    waiter here and never wait for a dead server themselves.
+    """
+    def __init__(self, journal):
+        self.journal = journal
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ScanForwarder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def register(self, port, target):
+        """
+        Args:
+            port: Serial port, key of the journal entries
+            target: dict with scanner_config, scanner_name, endpoints, ack_waiter and handshake_lock
+        """
+        with self._lock:
+            self._targets[port] = target
+        self.wake()
+
+    def unregister(self, port):
+        with self._lock:
+            self._targets.pop(port, None)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        last_compact = time.monotonic()
+
+        while not self._stop.is_set():
+            self._wakeup.wait(journal_retry_interval)
+            self._wakeup.clear()
+
+            with self._lock:
+                targets = list(self._targets.items())
+            for port, target in targets:
+                self._drain(port, target)
+
+            if time.monotonic() - last_compact >= journal_compact_interval:
+                try:
+                    self.journal.compact()
+                except Exception as ex:
+                    log_and_print(funkce="ScanForwarder", text=f"Journal compaction failed: {ex}", type_of_log="WARNING")
+                last_compact = time.monotonic()
+
+    def _drain(self, port, target):
+        scanner_config = target['scanner_config']
+        endpoints = target['endpoints']
+
+        while not self._stop.is_set() and endpoints.is_connected():
+            # The scanner thread holds the lock during its own handshake
+            with target['handshake_lock']:
+                entry = self.journal.oldest(port)
+                if entry is None:
+                    return
+                entry_id, barcode, created = entry
+                scan = Scan(barcode, created)
+                potrvzeni = predani_do_opc(entry_id, scan, scanner_config, target['scanner_name'], endpoints, target['ack_waiter'], self.journal)
+                if potrvzeni is None:
+                    return
+                if potrvzeni:
+                    endpoints.reset(scanner_config['barcode_response_node'])
+
+            scan_done(target['scanner_name'], port, scan, scan_outcomes[potrvzeni])
+            log_and_print(f"{target['scanner_name']}: Forwarded journaled barcode {barcode} ({time.time() - created:.1f} s old), ACK {potrvzeni}")
+
+_scan_journal = None
+_scan_forwarder = None
+
+def get_scan_forwarder():
+    """Return the shared forwarder of the barcode journal, creating and starting it on first use"""
+    global _scan_journal, _scan_forwarder
+
+    with _opc_sessions_lock:
+        if _scan_forwarder is None:
+            _scan_journal = BarcodeJournal(journal_path or os.path.join(get_script_path(), "data", "scan_journal.sqlite3"))
+            _scan_forwarder = ScanForwarder(_scan_journal)
+            _scan_forwarder.start()
+    return _scan_forwarder
+
+def close_scan_forwarder():
+    global _scan_journal, _scan_forwarder
+
+    with _opc_sessions_lock:
+        forwarder, journal = _scan_forwarder, _scan_journal
+        _scan_forwarder = _scan_journal = None
+    if forwarder is not None:
+        forwarder.stop()
+        journal.close()
+
+def predani_do_opc(entry_id, scan, scanner_config, scanner_name, endpoints, ack_waiter, journal):
+    """
+    Write a journaled scan to OPC and wait for the PLC confirmation
+
+    The barcode value carries the scan time as its SourceTimestamp. It goes
+    to the servers of `endpoints` (OpcEndpoints), ack_waiter.session tells
+    which one confirmed it.
+
+    Returns:
+        True/False: Barcode written, confirmed or not within ack_timeout.
+                    False also when a connected server rejected the write, the
+                    barcode is then dropped from the journal, it would block the port.
+        None: No server reachable, the barcode stays in the journal
+    """
+    barcode_response_node = scanner_config['barcode_response_node']
+
+    with metrics.timer("scanner_stage_seconds", scanner=scanner_name, stage="opc_write"):
+        written = endpoints.write([(barcode_response_node, False), (scanner_config['barcode_node'], scan.barcode, source_timestamp(scan))], ack_waiter)
+    if not written:
+        # A lost connection invalidates the session, a node level error (BadNotWritable, BadTypeMismatch, ...) does not
+        if not endpoints.is_connected():
+            return None
+        journal.delete(entry_id)
+        log_and_print(f"{scanner_name}: Barcode {scan.barcode} rejected by the OPC server, dropped from journal", type_of_log="ERROR")
+        metrics.inc("scanner_rejected_total", scanner=scanner_name)
+        return False
+    journal.delete(entry_id)
+
+    start = scan.written = time.monotonic()
+    potrvzeni = cekani_na_potvrzeni(barcode_response_node, ack_waiter, scanner_config['ack_timeout'], written)
+    if potrvzeni:
+        scan.acked = time.monotonic()
+    metrics.observe("scanner_stage_seconds", time.monotonic() - start, scanner=scanner_name, stage="ack_wait")
+    if not potrvzeni:
+        metrics.inc("scanner_ack_timeouts_total", scanner=scanner_name)
+
+    log_and_print("%s: Čekání na potvrzení: %.1f ms", scanner_name, (time.monotonic() - start) * 1000, type_of_log="DEBUG")
+    return potrvzeni
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Log and print taxt and messages at the same time
+#-------------------------------------------------------------------------------------------------------------------
+_log_levels = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+def log_and_print(text: str, *args, funkce: str=None, type_of_log: str="INFO"):
+    """
+    Log a message to the log file and the console
+
+    Records only go onto the logging queue, the file and console are written
+    by the listener thread (see setup_logging). Nothing is formatted when the
+    level is disabled; pass %-style args to defer formatting on hot paths.
+    """
+    level = _log_levels.get(type_of_log, logging.INFO)
+    if not logger.isEnabledFor(level):
+        return
+
+    if args:
+        text = text % args
+
+    if funkce is not None:
+        text = funkce + " : " + text
+
+    logger.log(level, text)
+#------------------------------------------------------------------------------------------------------------------- 
+
+#------------------------------------------------------------------------------------------------------------------- 
+# Get the current date and time in the format YYYY_MM_DD__HH_MM_SS
+#------------------------------------------------------------------------------------------------------------------- 
+def actual_date_time():
+    """
+    Returns the current date and time in the format YYYY_MM_DD__HH_MM_SS
+    """
+    curr_time = datetime.now()
+    return curr_time.strftime('%Y_%m_%d__%H_%M_%S_%f')
+#------------------------------------------------------------------------------------------------------------------- 
+
+#-------------------------------------------------------------------------------------------------------------------
+# Logging pipeline - scan threads never wait for the console or the disk
+#-------------------------------------------------------------------------------------------------------------------
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def setup_logging(handlers):
+    """
+    Attach the handlers to the logger through a queue
+
+    The logger only gets a QueueHandler; a QueueListener thread formats the
+    records and writes them to the handlers. The listener is flushed and
+    stopped at interpreter exit.
+    """
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Return the path of the script
+# This function is used to get the directory of the script, which is useful for loading configuration
+#-------------------------------------------------------------------------------------------------------------------
+def get_script_path():
+    return os.path.dirname(os.path.realpath(sys.argv[0]))
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Function to clean up old log files
+#-------------------------------------------------------------------------------------------------------------------
+def cleanup_old_logs(log_dir, days_to_keep=30):
+    """
+    Delete log files older than specified number of days
+    
+    Args:
+        log_dir: Directory containing log files
+        days_to_keep: Number of days to keep log files (default: 30)
+    """
+    try:
+        from datetime import timedelta
+        
+        if not os.path.exists(log_dir):
+            return
+        
+        # Calculate the cutoff date
+        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        cutoff_timestamp = cutoff_date.timestamp()
+        
+        deleted_count = 0
+        
+        # Iterate through all files in log directory
+        for filename in os.listdir(log_dir):
+            if filename.endswith(('.log', '.folded')):
+                file_path = os.path.join(log_dir, filename)
+                
+                # Get file modification time
+                file_mtime = os.path.getmtime(file_path)
+                
+                # Delete if older than cutoff date
+                if file_mtime < cutoff_timestamp:
+                    try:
+                        os.remove(file_path)
+                        deleted_count += 1
+                        log_and_print(funkce="cleanup_old_logs", text=f"Deleted old log file: {filename}", type_of_log="DEBUG")
+                    except Exception as e:
+                        log_and_print(funkce="cleanup_old_logs", text=f"Failed to delete {filename}: {e}", type_of_log="WARNING")
+        
+        if deleted_count > 0:
+            log_and_print(funkce="cleanup_old_logs", text=f"Cleaned up {deleted_count} old log file(s)", type_of_log="INFO")
+            
+    except Exception as e:
+        log_and_print(funkce="cleanup_old_logs", text=f"Error during log cleanup: {e}", type_of_log="ERROR")
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Function to load configuration from JSON file
+#-------------------------------------------------------------------------------------------------------------------
+def load_config(config_file=None):
+    """Load configuration from JSON file with default values"""
+    if config_file is None:
+        script_dir = get_script_path()
+        # First try conf subdirectory, then script directory (backward compatibility)
+        config_file = os.path.join(script_dir, 'conf', 'scan_rs232.json')
+        if not os.path.exists(config_file):
+            config_file = os.path.join(script_dir, 'scan_rs232.json')
+    
+    try:
+        with open(config_file) as f:
+            config_data = json.load(f)
+            
+            # Extract scanner configurations and log retention days
+            scanner_configs = config_data.get('scanner_configurations', [])
+            log_retention_days = config_data.get('log_retention_days', 30)
+            log_level = config_data.get('log_level', 'INFO').upper()
+            
+            # If scanner_configurations key doesn't exist, check if it's direct array or single object (backward compatibility)
+            if not scanner_configs:
+                if isinstance(config_data, list):
+                    scanner_configs = config_data
+                else:
+                    scanner_configs = [config_data]
+            
+            scanners = []
+            for idx, scanner_config in enumerate(scanner_configs):
+                scanner = {
+                    'port': scanner_config.get('port', '/dev/ttyS0'),
+                    'baudrate': scanner_config.get('baudrate', 9600),
+                    'timeout': scanner_config.get('timeout', 10),
+                    'rtscts': scanner_config.get('rtscts', False),
+                    'dsrdtr': scanner_config.get('dsrdtr', False),
+                    'barcode_node': scanner_config.get('barcode_node', f'ns=1;i={100001 + idx * 5}'),
+                    'barcode_response_node': scanner_config.get('barcode_response_node', f'ns=1;i={100002 + idx * 5}'),
+                    'barcode_beep_count': scanner_config.get('barcode_beep_count', f'ns=1;i={100003 + idx * 5}'),
+                    'barcode_health_check': scanner_config.get('barcode_health_check', f'ns=1;i={100004 + idx * 5}'),
+                    'barcode_health_check_message': scanner_config.get('barcode_health_check_message', f'ns=1;i={100005 + idx * 5}')
+                }
+                scanners.append(scanner)
+            
+            log_and_print(funkce="load_config", text=f"Configuration loaded: {len(scanners)} scanner(s) from {config_file}", type_of_log="DEBUG")
+            return {
+                'scanners': scanners,
+                'log_retention_days': log_retention_days,
+                'log_level': log_level
+            }
+    except FileNotFoundError:
+        log_and_print(funkce="load_config", text=f"Config file not found: {config_file}", type_of_log="WARNING")
+        log_and_print(funkce="load_config", text="Using default configuration values", type_of_log="INFO")
+        return {
+            'log_level': 'INFO',
+            'scanners': [{
+                'port': '/dev/ttyS0',
+                'baudrate': 9600,
+                'timeout': 10,
+                'rtscts': False,
+                'dsrdtr': False,
+                'barcode_node': 'ns=1;i=100001',
+                'barcode_response_node': 'ns=1;i=100002',
+                'barcode_beep_count': 'ns=1;i=100003',
+                'barcode_health_check': 'ns=1;i=100004',
+                'barcode_health_check_message': 'ns=1;i=100005'
+            }],
+            'log_retention_days': 30          
+        }
+    except json.JSONDecodeError as e:
+        log_and_print(funkce="load_config", text=f"Error decoding JSON config: {e}", type_of_log="ERROR")
+        sys.exit(1)
+    except Exception as e:
+        log_and_print(funkce="load_config", text=f"Error reading configuration: {e}", type_of_log="ERROR")
+        sys.exit(1)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Odesilani potvrzeni a pipnuti do scanneru
+#-------------------------------------------------------------------------------------------------------------------
+class SerialOutputScheduler:
+    """
+    Sends ACK/BEL/NAK byte sequences to a scanner from a background thread.
+
+    Each sequence is a list of (bytes, pause in seconds after them). Sequences
+    go out in the order they were queued, except urgent ones (ACK, NAK) which
+    are sent at once, even in the middle of the beeps of an earlier scan. The
+    read path can take the next scan while the scanner is still beeping.
+    """
+    def __init__(self, ser, scanner_name="Scanner"):
+        self.ser = ser
+        self.scanner_name = scanner_name
+        self._cond = threading.Condition()
+        self._urgent = collections.deque()
+        self._sequences = collections.deque()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{scanner_name}-output", daemon=True)
+        self._thread.start()
+
+    def send(self, sequence, urgent=False, done=None):
+        """done(time.monotonic() or None if not sent) is called from the output thread after the sequence"""
+        with self._cond:
+            (self._urgent if urgent else self._sequences).append((sequence, done))
+            self._cond.notify()
+
+    def ack(self):
+        self.send([(ACK, 0)], urgent=True)
+
+    def nak(self):
+        self.send([(NAK, 0)], urgent=True)
+
+    def beep(self, count, done=None):
+        if count > 0:
+            self.send([(BEL, beep_interval)] * (count - 1) + [(BEL, 0)], done=done)
+        elif done is not None:
+            done(None)
+
+    def close(self, timeout=None):
+        """Stop sending, queued sequences and running pauses are dropped"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._urgent or self._sequences or self._closed):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                urgent = list(self._urgent)
+                self._urgent.clear()
+                sequence = None if urgent else self._sequences.popleft()
+
+            for item in urgent:
+                self._play(*item)
+            if sequence is not None:
+                self._play(*sequence)
+
+    def _play(self, sequence, done=None):
+        start = time.perf_counter()
+        for data, pause in sequence:
+            try:
+                self.ser.write(data)
+            except Exception as ex:
+                log_and_print(f"{self.scanner_name}: Error writing to serial port: {ex}", type_of_log="ERROR")
+                if done is not None:
+                    done(None)
+                return
+            if pause and not self._pause(pause):
+                if done is not None:
+                    done(None)
+                return
+
+        if done is not None:
+            done(time.monotonic())
+        if any(data == BEL for data, _ in sequence):
+            metrics.observe("scanner_stage_seconds", time.perf_counter() - start, scanner=self.scanner_name, stage="beep")
+
+    def _pause(self, seconds):
+        """Wait between two steps while still sending urgent sequences, False when closed"""
+        deadline = time.monotonic() + seconds
+        while True:
+            with self._cond:
+                if self._closed:
+                    return False
+                remaining = deadline - time.monotonic()
+                if not self._urgent:
+                    if remaining <= 0:
+                        return True
+                    self._cond.wait(remaining)
+                urgent = list(self._urgent)
+                self._urgent.clear()
+
+            for item in urgent:
+                self._play(*item)
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Pripojeni serioveho portu - missing ports and unplugged USB-serial scanners are reopened
+#-------------------------------------------------------------------------------------------------------------------
+class SerialPortHandle:
+    """
+    Serial port of one scanner that can be lost and opened again.
+
+    The output side keeps the same handle for the life of the scanner, writes
+    are dropped while the port is detached.
+    """
+    def __init__(self):
+        self.ser = None
+
+    def attach(self, ser):
+        self.ser = ser
+
+    def detach(self):
+        ser, self.ser = self.ser, None
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    def write(self, data):
+        ser = self.ser
+        if ser is None:
+            return 0
+        return ser.write(data)
+
+def _otevri_port(scanner_config, timeout):
+    # Zde to chce nastavit práva pro skupinu dialout
+    # sudo usermod -a -G dialout $USER
+    # viz poznamky.txt -> Připojení scanneru
+    # Momentálnš rtscts a dsrdtr ponechat false
+    return serial.Serial(scanner_config['port'], baudrate=scanner_config['baudrate'], timeout=timeout, rtscts=scanner_config['rtscts'], dsrdtr=scanner_config['dsrdtr'])
+
+def _zastaveno(stop_event):
+    return shutdown_event.is_set() or (stop_event is not None and stop_event.is_set())
+
+def cekani_na_port(path, delay, stop_event=None):
+    """
+    Wait before the next attempt to open a port, cut short when its device node
+    (/dev/ttyUSB*, /dev/serial/by-id/...) appears
+
+    Returns:
+        bool: False if shutdown or stop of this scanner was requested meanwhile
+    """
+    deadline = time.monotonic() + delay
+    fds = [shutdown_event.fileno()]
+    if stop_event is not None:
+        fds.append(stop_event.fileno())
+
+    present = os.path.exists(path)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        readable, _, _ = select.select(fds, [], [], min(port_poll_interval, remaining))
+        if readable:
+            return False
+        appeared = not present and os.path.exists(path)
+        if appeared:
+            return True
+        present = os.path.exists(path)
+
+def otevreni_portu(scanner_config, scanner_name, timeout, stop_event=None):
+    """
+    Open the serial port of a scanner, retrying with exponential backoff until it can be opened
+
+    Returns:
+        serial.Serial: Opened port, None if shutdown or stop of this scanner was requested first
+    """
+    pPort = scanner_config['port']
+    backoff = RestartBackoff(port_reopen_min, port_reopen_max, float('inf'))
+    attempt = 0
+    while not _zastaveno(stop_event):
+        try:
+            return _otevri_port(scanner_config, timeout)
+        except serial.SerialException as e:
+            delay = backoff.failed()
+            # Only the first failure is an error, an unplugged scanner would fill the log with retries
+            log_and_print(f"{scanner_name} ({pPort}): Error opening serial port: {e}, retrying in {delay:.1f} s", type_of_log="ERROR" if attempt == 0 else "DEBUG")
+            attempt += 1
+            if not cekani_na_port(pPort, delay, stop_event):
+                break
+    return None
+
+async def otevreni_portu_async(scanner_config, scanner_name, stop_event=None):
+    """Same as otevreni_portu() for the asyncio runtime, the port is opened non-blocking"""
+    pPort = scanner_config['port']
+    backoff = RestartBackoff(port_reopen_min, port_reopen_max, float('inf'))
+    attempt = 0
+    while not _zastaveno(stop_event):
+        try:
+            # timeout=0 makes read() return whatever is buffered without blocking the loop
+            return _otevri_port(scanner_config, 0)
+        except serial.SerialException as e:
+            delay = backoff.failed()
+            log_and_print(f"{scanner_name} ({pPort}): Error opening serial port: {e}, retrying in {delay:.1f} s", type_of_log="ERROR" if attempt == 0 else "DEBUG")
+            attempt += 1
+
+        deadline = time.monotonic() + delay
+        present = os.path.exists(pPort)
+        while not _zastaveno(stop_event) and time.monotonic() < deadline:
+            await asyncio.sleep(min(port_poll_interval, max(0.0, deadline - time.monotonic())))
+            if not present and os.path.exists(pPort):
+                break
+            present = os.path.exists(pPort)
+    return None
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Cekani na data ze serioveho portu
+#-------------------------------------------------------------------------------------------------------------------
+def cekani_na_data(ser, timeout, stop_event=None):
+    """
+    Block until the serial port has data, shutdown or stop of this scanner is requested or timeout expires
+
+    Returns:
+        bool: True if data can be read from the port
+    """
+    if ser.in_waiting:
+        return True
+
+    fds = [ser.fileno(), shutdown_event.fileno()]
+    if stop_event is not None:
+        fds.append(stop_event.fileno())
+    readable, _, _ = select.select(fds, [], [], timeout)
+    return ser.fileno() in readable
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Potlaceni opakovanych skenu
+#-------------------------------------------------------------------------------------------------------------------
+class DuplicateFilter:
+    """
+    Barcodes confirmed by the PLC in the last `window` seconds, at most `max_size` of them.
+
+    A barcode scanned again within the window of its confirmed scan is a
+    duplicate; the window is not extended by the duplicates themselves.
+    """
+    def __init__(self, window, max_size=64):
+        self.window = window
+        self.max_size = max(1, int(max_size))
+        self._seen = collections.OrderedDict()      # barcode -> monotonic time of the confirmed scan
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, barcode):
+        with self._lock:
+            seen = self._seen.get(barcode)
+            if seen is None:
+                return False
+            if time.monotonic() - seen >= self.window:
+                del self._seen[barcode]
+                return False
+            self._seen.move_to_end(barcode)
+            return True
+
+    def record(self, barcode):
+        with self._lock:
+            self._seen[barcode] = time.monotonic()
+            self._seen.move_to_end(barcode)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+def duplicate_filter(scanner_config):
+    """DuplicateFilter of the scanner, None when duplicate_window is not set"""
+    window = float(scanner_config.get('duplicate_window', 0) or 0)
+    if window <= 0:
+        return None
+    return DuplicateFilter(window, scanner_config.get('duplicate_cache_size', 64))
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Fronta nactenych kodu pred predanim do OPC
+#-------------------------------------------------------------------------------------------------------------------
+class Scan:
+    """
+    One framed barcode on its way from the serial port to OPC and the local subscribers.
+
+    scanned_at is the Unix time of the frame (SourceTimestamp of the barcode
+    value), the trace points are time.monotonic() values or None until reached.
+    """
+    __slots__ = ('barcode', 'scanned_at', 'arrived', 'framed', 'written', 'acked', 'beeped')
+
+    def __init__(self, barcode, scanned_at=None, arrived=None):
+        self.barcode = barcode
+        self.scanned_at = time.time() if scanned_at is None else scanned_at
+        # A scan restored from the journal has no trace of its own
+        self.framed = time.monotonic() if scanned_at is None else None
+        self.arrived = self.framed if arrived is None else arrived
+        self.written = self.acked = self.beeped = None
+
+class ScanQueue:
+    """
+    Bounded queue of scans (Scan) between the serial reader and the OPC handshake of one scanner.
+
+    When the handshake falls behind and the queue is full, the policy decides:
+        block        the reader waits, further scans stay in the buffer of the port
+        drop_oldest  the oldest waiting barcode is dropped for the new one
+        reject       the new barcode is refused, the scanner gets NAK
+    """
+    policies = ("block", "drop_oldest", "reject")
+
+    def __init__(self, maxsize=16, policy="block"):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown scan_queue_policy '{policy}', expected one of {', '.join(self.policies)}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def offer(self, scan):
+        """
+        Queue the scan without waiting
+
+        Returns:
+            tuple: (True if queued, dropped or rejected Scan or None); a full 'block' queue returns (False, None)
+        """
+        with self._condition:
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                if self.policy == "block":
+                    return False, None
+                self.dropped += 1
+                if self.policy == "reject":
+                    return False, scan
+                dropped = self._items.popleft()
+            self._items.append(scan)
+            self._condition.notify_all()
+            return True, dropped
+
+    def put(self, scan, stop_event=None):
+        """
+        Queue the scan, with the 'block' policy wait for space
+
+        Returns:
+            Scan: Dropped or rejected scan, None if nothing was lost
+        """
+        with self._condition:
+            while True:
+                queued, dropped = self.offer(scan)
+                if queued or dropped is not None:
+                    return dropped
+                if self._closed or (stop_event is not None and stop_event.is_set()):
+                    # Over the limit, but kept for drain() instead of lost
+                    self._items.append(scan)
+                    return None
+                self._condition.wait(0.25)
+
+    def take(self):
+        """Next scan without waiting, None if the queue is empty"""
+        with self._condition:
+            if not self._items:
+                return None
+            scan = self._items.popleft()
+            self._condition.notify_all()
+            return scan
+
+    def get(self):
+        """Wait for the next scan, None once the queue is closed"""
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            scan = self._items.popleft()
+            self._condition.notify_all()
+            return scan
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def drain(self):
+        """Remove and return the scans still waiting"""
+        with self._condition:
+            items = list(self._items)
+            self._items.clear()
+            self._condition.notify_all()
+            return items
+
+    def status(self):
+        """Text for the health check message node"""
+        return f"Running - queue {len(self._items)}/{self.maxsize}, dropped {self.dropped}"
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Rozdeleni dat ze scanneru na carove kody
+#-------------------------------------------------------------------------------------------------------------------
+class BarcodeFramer:
+    """
+    Incremental splitter of the serial byte stream into barcodes.
+
+    feed() takes everything read from the port at once and returns all
+    complete frames, so a scanner dumping its batch memory is drained in a
+    few reads. A frame starts at frame_prefix (bytes before it are noise) and
+    ends at frame_terminator, or after frame_length bytes when that is set.
+    An AIM symbology identifier (']' + 2 characters) is stripped when aim_id
+    is on. Frames are decoded from a memoryview of the buffer, invalid bytes
+    become U+FFFD instead of raising.
+    """
+    def __init__(self, scanner_config, timeout=None):
+        self.terminator = scanner_config.get('frame_terminator', '\n').encode('latin-1')
+        self.prefix = scanner_config.get('frame_prefix', '').encode('latin-1')
+        self.length = int(scanner_config.get('frame_length', 0) or 0)
+        self.aim_id = scanner_config.get('aim_id', False)
+        self.encoding = scanner_config.get('encoding', 'utf-8')
+        self.timeout = scanner_config['timeout'] if timeout is None else timeout
+
+        if not self.terminator and not self.length:
+            raise ValueError(f"{scanner_config['port']}: frame_terminator or frame_length has to be set")
+
+        self._buffer = bytearray()
+        self._partial_since = 0.0
+        self.arrivals = []      # monotonic arrival of the first byte of each barcode of the last feed()/flush()
+
+    def feed(self, data):
+        """
+        Returns:
+            list: Barcodes completed by data, in the order they were scanned
+        """
+        if not data:
+            self.arrivals = []
+            return []
+        now = time.monotonic()
+        if not self._buffer:
+            self._partial_since = now
+        first_arrival = self._partial_since
+        self._buffer += data
+
+        frames = []
+        buffer = self._buffer
+        pos = 0
+        with memoryview(buffer) as view:
+            while True:
+                start = pos
+                if self.prefix:
+                    start = buffer.find(self.prefix, pos)
+                    if start < 0:
+                        # Keep a possible beginning of the prefix, drop the noise before it
+                        pos = max(pos, len(buffer) - len(self.prefix) + 1)
+                        break
+                    start += len(self.prefix)
+
+                if self.length:
+                    end = start + self.length
+                    if end > len(buffer):
+                        break
+                    next_pos = end
+                    if self.terminator and buffer.startswith(self.terminator, end):
+                        next_pos += len(self.terminator)
+                else:
+                    end = buffer.find(self.terminator, start)
+                    if end < 0:
+                        break
+                    next_pos = end + len(self.terminator)
+
+                # Only the first frame can have started in an earlier read
+                frames.append((self._decode(view[start:end]), first_arrival if not frames else now))
+                pos = next_pos
+
+        # One move of the remaining bytes per read, not per frame
+        if pos:
+            del buffer[:pos]
+            self._partial_since = now
+        frames = [(frame, arrived) for frame, arrived in frames if frame]
+        self.arrivals = [arrived for _, arrived in frames]
+        return [frame for frame, _ in frames]
+
+    def pending_timeout(self):
+        """Seconds until an unterminated frame is flushed, None when nothing is pending"""
+        if not self._buffer:
+            return None
+        return max(0.0, self._partial_since + self.timeout - time.monotonic())
+
+    def reset(self):
+        """Drop an unterminated frame, used when the port was lost in the middle of it"""
+        self._buffer.clear()
+
+    def flush(self):
+        """Take an unterminated frame as is once the port timeout passed, same as readline()"""
+        self.arrivals = []
+        if not self._buffer or self.pending_timeout() > 0:
+            return []
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        if self.prefix:
+            start = data.find(self.prefix)
+            if start < 0:
+                return []
+            data = data[start + len(self.prefix):]
+        frame = self._decode(data)
+        if not frame:
+            return []
+        self.arrivals = [self._partial_since]
+        return [frame]
+
+    def _decode(self, data):
+        barcode = str(data, self.encoding, 'replace').strip()
+        if self.aim_id and barcode.startswith(']') and len(barcode) >= 3:
+            barcode = barcode[3:]
+        return barcode
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Function to read from the serial port and process scanned barcodes
+#-------------------------------------------------------------------------------------------------------------------
+def read(scanner_config, scanner_name="Scanner", stop_event=None):
+    pPort = scanner_config['port']
+    pTimeout = scanner_config['timeout']
+    barcode_response_node = scanner_config['barcode_response_node']
+    barcode_beep_count = scanner_config['barcode_beep_count']
+    barcode_health_check = scanner_config['barcode_health_check']
+    barcode_health_check_message = scanner_config['barcode_health_check_message']
+
+    try:
+        framer = BarcodeFramer(scanner_config)
+    except ValueError as e:
+        log_and_print(f"{scanner_name}: Invalid framing configuration: {e}", type_of_log="ERROR")
+        return
+    duplicates = duplicate_filter(scanner_config)
+    duplicate_response = scanner_config.get('duplicate_response', 'ack')
+
+    try:
+        scan_queue = ScanQueue(scanner_config.get('scan_queue_size', 16), scanner_config.get('scan_queue_policy', 'block'))
+        endpoints = OpcEndpoints(scanner_config)
+    except ValueError as e:
+        log_and_print(f"{scanner_name}: {e}", type_of_log="ERROR")
+        return
+
+    # The port is opened in the read loop below and opened again whenever it is lost
+    port = SerialPortHandle()
+    output = SerialOutputScheduler(port, scanner_name)
+
+    def status():
+        return scan_queue.status() if port.ser is not None else f"Waiting for port {pPort}"
+
+    # Every server of the scanner gets its nodes, the ACK subscription and the health check
+    ack_waiter = AckWaiter()
+    heartbeat = get_heartbeat_scheduler()
+    for session in endpoints.sessions:
+        session.register_nodes([scanner_config[key] for key in scanner_node_keys])
+        session.subscribe(barcode_response_node, ack_waiter.callback(session))
+        heartbeat.register(barcode_health_check, session, scanner_name, barcode_health_check_message, status)
+
+    forwarder = get_scan_forwarder()
+    journal = forwarder.journal
+    handshake_lock = threading.Lock()
+    forwarder.register(pPort, {
+        'scanner_config': scanner_config,
+        'scanner_name': scanner_name,
+        'endpoints': endpoints,
+        'ack_waiter': ack_waiter,
+        'handshake_lock': handshake_lock,
+    })
+
+    # The handshake thread stops the reader through this event when it fails
+    own_stop_event = stop_event is None
+    if own_stop_event:
+        stop_event = WakeupEvent()
+    handshake_errors = []
+
+    def traced_beep(scan, beeped):
+        # The trace line of a confirmed scan is complete once its beeps went out
+        scan.beeped = beeped
+        scan_tracer.finish(scanner_name, pPort, scan, SCAN_ACK)
+
+    def predani():
+        """Hand the queued barcodes to the PLC one by one, while the reader keeps reading the port"""
+        try:
+            while True:
+                scan = scan_queue.get()
+                if scan is None:
+                    return
+                barcode = scan.barcode
+                metrics.set("scanner_queue_depth", len(scan_queue), scanner=scanner_name)
+
+                # Every scan goes to the journal first. It is written directly only when nothing
+                # older is waiting and the server is up, otherwise the forwarder delivers it later.
+                potrvzeni = None
+                if handshake_lock.acquire(blocking=False):
+                    try:
+                        entry_id = journal.append(pPort, barcode, scan.scanned_at)
+                        if not journal.has_older(pPort, entry_id) and endpoints.is_connected():
+                            potrvzeni = predani_do_opc(entry_id, scan, scanner_config, scanner_name, endpoints, ack_waiter, journal)
+                    finally:
+                        handshake_lock.release()
+                else:
+                    journal.append(pPort, barcode, scan.scanned_at)
+
+                if potrvzeni is None:
+                    log_and_print(f"{scanner_name}: OPC not available, barcode {barcode} kept in journal", type_of_log="WARNING")
+                    scan_done(scanner_name, pPort, scan, SCAN_JOURNALED)
+                    forwarder.wake()
+
+                if potrvzeni == True:
+                    log_and_print(f"{scanner_name}: Potvrzení ACK")
+                    output.ack()
+                    scan_publisher.publish(scanner_name, pPort, scan, SCAN_ACK)
+                    if duplicates is not None:
+                        duplicates.record(barcode)
+
+                    # Every server that got the barcode is reset, the one that confirmed first tells the beep count
+                    endpoints.reset(barcode_response_node)
+                    session = ack_waiter.session or endpoints.primary
+
+                    # Beeps are sent in the background, the next barcode can be read meanwhile
+                    pocet_pipnuti = cteni_z_opc(barcode_beep_count, session)
+                    output.beep(pocet_pipnuti or 0, done=lambda beeped, scan=scan: traced_beep(scan, beeped))
+
+                    log_and_print("Potvrzení - %s", potrvzeni, type_of_log="DEBUG")
+
+                if potrvzeni == False:
+                    scan_done(scanner_name, pPort, scan, SCAN_NOT_CONFIRMED)
+                    log_and_print("Potvrzení - %s", potrvzeni, type_of_log="DEBUG")
+        except Exception as ex:
+            handshake_errors.append(ex)
+            stop_event.set()
+
+    handshake = threading.Thread(target=predani, name=f"{scanner_name}-handshake", daemon=True)
+    handshake.start()
+
+    try:
+        with startup_profile.phase(f"{scanner_name} open port"):
+            ser = otevreni_portu(scanner_config, scanner_name, pTimeout, stop_event)
+        lost_at = None
+
+        while ser is not None and not shutdown_event.is_set() and not stop_event.is_set():
+            if port.ser is None:
+                port.attach(ser)
+                metrics.set("scanner_port_connected", 1, scanner=scanner_name)
+                if lost_at is None:
+                    log_and_print(f"{scanner_name} ({pPort}): Listening for barcodes...")
+                    startup_profile.scanner_ready(scanner_name)
+                else:
+                    metrics.observe("scanner_port_recovery_seconds", time.monotonic() - lost_at, scanner=scanner_name)
+                    log_and_print(f"{scanner_name} ({pPort}): Port reattached after {time.monotonic() - lost_at:.1f} s, listening for barcodes...")
+
+            # Everything buffered in the port is read at once; an unterminated frame is taken after the port timeout
+            try:
+                if cekani_na_data(ser, framer.pending_timeout(), stop_event):
+                    with metrics.timer("scanner_stage_seconds", scanner=scanner_name, stage="serial_read"):
+                        barcodes = framer.feed(ser.read(ser.in_waiting or 1))
+                else:
+                    barcodes = framer.flush()
+                arrivals = framer.arrivals
+            except (serial.SerialException, OSError) as e:
+                # Unplugged USB-serial adapter or a port gone away, the queue and the OPC side keep running meanwhile
+                log_and_print(f"{scanner_name} ({pPort}): Serial port lost: {e}", type_of_log="ERROR")
+                lost_at = time.monotonic()
+                port.detach()
+                framer.reset()
+                metrics.set("scanner_port_connected", 0, scanner=scanner_name)
+                ser = otevreni_portu(scanner_config, scanner_name, pTimeout, stop_event)
+                continue
+
+            for barcode, arrived in zip(barcodes, arrivals):
+                scan = Scan(barcode, arrived=arrived)
+                log_and_print(f"{scanner_name}: Scanned: {barcode}")
+                metrics.inc("scanner_scans_total", scanner=scanner_name)
+
+                # The same label scanned again right after its confirmation is answered here, the PLC already has it
+                if duplicates is not None and duplicates.is_duplicate(barcode):
+                    log_and_print(f"{scanner_name}: Duplicate {barcode} within {duplicates.window} s, answered {duplicate_response}")
+                    metrics.inc("scanner_duplicates_total", scanner=scanner_name)
+                    if duplicate_response == "ack":
+                        output.ack()
+                    elif duplicate_response == "nak":
+                        output.nak()
+                    scan_done(scanner_name, pPort, scan, SCAN_DUPLICATE)
+                    continue
+
+                lost = scan_queue.put(scan, stop_event)
+                metrics.set("scanner_queue_depth", len(scan_queue), scanner=scanner_name)
+                if lost is not None:
+                    log_and_print(f"{scanner_name}: Scan queue full ({scan_queue.maxsize}), barcode {lost.barcode} {'rejected' if scan_queue.policy == 'reject' else 'dropped'}", type_of_log="WARNING")
+                    metrics.inc("scanner_queue_dropped_total", scanner=scanner_name, policy=scan_queue.policy)
+                    scan_done(scanner_name, pPort, lost, SCAN_DROPPED)
+                    if scan_queue.policy == "reject":
+                        output.nak()
+
+        if handshake_errors:
+            raise handshake_errors[0]
+    except KeyboardInterrupt as ki:
+        log_and_print(text=f"Stopped - {ki}", type_of_log="ERROR")
+        heartbeat.unregister(barcode_health_check)
+        endpoints.write_all([(barcode_health_check, 0), (barcode_health_check_message, f"Stopped - {ki}")])
+    except Exception as ex:
+        log_and_print(text=f"Error - {ex}", type_of_log="ERROR")
+        heartbeat.unregister(barcode_health_check)
+        endpoints.write_all([(barcode_health_check, 0), (barcode_health_check_message, f"Stopped - {ex}")])
+    finally:
+        heartbeat.unregister(barcode_health_check)
+        scan_queue.close()
+        handshake.join()
+
+        # Scans the handshake did not get to are delivered by the forwarder after the next start
+        for scan in scan_queue.drain():
+            journal.append(pPort, scan.barcode, scan.scanned_at)
+            log_and_print(f"{scanner_name}: Barcode {scan.barcode} not handed over yet, kept in journal", type_of_log="WARNING")
+        metrics.set("scanner_queue_depth", 0, scanner=scanner_name)
+
+        forwarder.unregister(pPort)
+        for session in endpoints.sessions:
+            session.unsubscribe(barcode_response_node, ack_waiter.callback(session))
+        output.close(timeout=1)
+        port.detach()
+        metrics.set("scanner_port_connected", 0, scanner=scanner_name)
+        if own_stop_event:
+            stop_event.close()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Hot reload of scan_rs232.json
+#-------------------------------------------------------------------------------------------------------------------
+class ConfigWatcher:
+    """
+    Notices changes of scan_rs232.json by polling its modification time and size.
+
+    A worker process passes its shard as (index, count) and only gets the
+    scanners whose port belongs to it.
+    """
+    def __init__(self, path, shard=None):
+        self.path = path
+        self.shard = shard
+        self._stamp = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def poll(self):
+        """
+        Returns:
+            list: New scanner configurations if the file changed and is valid, otherwise None
+        """
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return None
+        self._stamp = stamp
+
+        try:
+            reload_config()
+        except Exception as ex:
+            log_and_print(funkce="ConfigWatcher", text=f"Keeping the running configuration, {self.path} is not valid: {ex}", type_of_log="ERROR")
+            return None
+
+        log_and_print(f"Configuration {self.path} changed, applying...")
+        logger.setLevel(getattr(logging, get_log_level(), logging.INFO))
+        return shard_scanners(get_scanner_configurations(), self.shard)
+
+def shard_of(scanner_config, count):
+    """
+    Index of the worker process serving a scanner
+
+    'worker' (1..count) pins the scanner to a worker, otherwise the port name
+    is hashed, so a port stays in its worker across restarts and config reloads
+    """
+    worker = scanner_config.get('worker', 0)
+    if 1 <= worker <= count:
+        return worker - 1
+    digest = hashlib.blake2b(scanner_config['port'].encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+def shard_scanners(scanners_config, shard):
+    """Scanners of one worker process, shard is (index, count) or None for all of them"""
+    if shard is None:
+        return scanners_config
+    index, count = shard
+    return [scanner_cfg for scanner_cfg in scanners_config if shard_of(scanner_cfg, count) == index]
+
+def porovnani_skeneru(running, scanners_config):
+    """
+    Compare running scanners with a new scanner list, scanners are matched by serial port
+
+    Args:
+        running: dict port -> scanner config of the running scanners
+        scanners_config: New list of scanner configurations
+
+    Returns:
+        tuple: (removed ports, configs of changed scanners, configs of added scanners)
+    """
+    wanted = {}
+    for scanner_cfg in scanners_config:
+        if scanner_cfg['port'] in wanted:
+            log_and_print(f"Port {scanner_cfg['port']} is configured twice, using its first entry", type_of_log="WARNING")
+            continue
+        wanted[scanner_cfg['port']] = scanner_cfg
+
+    removed = [port for port in running if port not in wanted]
+    changed = [cfg for port, cfg in wanted.items() if port in running and running[port] != cfg]
+    added = [cfg for port, cfg in wanted.items() if port not in running]
+    return removed, changed, added
+
+def nazev_skeneru(names, port):
+    """Scanner name of a port, kept while the port stays configured; new ports take the lowest free number"""
+    if port not in names:
+        used = set(names.values())
+        idx = 1
+        while f"Scanner-{idx}" in used:
+            idx += 1
+        names[port] = f"Scanner-{idx}"
+    return names[port]
+
+class RestartBackoff:
+    """
+    Delay before restarting a scanner or worker process that ended on its own.
+
+    The delay doubles with every restart up to `maximum` and falls back to
+    `minimum` once a restart kept running for `healthy_after` seconds.
+    """
+    def __init__(self, minimum=None, maximum=None, healthy_after=None):
+        self.minimum = restart_backoff_min if minimum is None else minimum
+        self.maximum = restart_backoff_max if maximum is None else maximum
+        self.healthy_after = restart_healthy_after if healthy_after is None else healthy_after
+        self._delay = self.minimum
+        self._started = time.monotonic()
+
+    def started(self):
+        self._started = time.monotonic()
+
+    def failed(self):
+        """Seconds to wait before the next start"""
+        if time.monotonic() - self._started >= self.healthy_after:
+            self._delay = self.minimum
+        delay = self._delay
+        self._delay = min(self._delay * 2, self.maximum)
+        return delay
+
+class ScannerPool:
+    """
+    Scanner threads of the thread runtime, one per serial port.
+
+    apply() stops, restarts or starts only the scanners whose configuration
+    changed; the other ports keep reading without interruption. restart_dead()
+    restarts the scanners that ended on their own, each with its own backoff.
+    """
+    def __init__(self, names=None):
+        self._workers = {}      # port -> {'config', 'name', 'thread', 'stop', 'backoff', 'restart_at'}
+        self._names = {} if names is None else names
+
+    def apply(self, scanners_config):
+        running = {port: worker['config'] for port, worker in self._workers.items()}
+        removed, changed, added = porovnani_skeneru(running, scanners_config)
+
+        health_nodes = {cfg['barcode_health_check'] for cfg in scanners_config}
+        for port in removed:
+            self._stop_worker(port, "removed from configuration", health_nodes)
+            self._names.pop(port, None)
+        for scanner_cfg in changed:
+            self._stop_worker(scanner_cfg['port'], "configuration changed", health_nodes)
+            self._start_worker(scanner_cfg)
+        for scanner_cfg in added:
+            self._start_worker(scanner_cfg)
+
+    def _start_worker(self, scanner_cfg):
+        port = scanner_cfg['port']
+        scanner_name = nazev_skeneru(self._names, port)
+        log_and_print(f"Initializing {scanner_name} on port {port}")
+
+        stop = WakeupEvent()
+        thread = threading.Thread(target=read, args=(scanner_cfg, scanner_name, stop), name=scanner_name)
+        self._workers[port] = {'config': scanner_cfg, 'name': scanner_name, 'thread': thread, 'stop': stop, 'backoff': RestartBackoff(), 'restart_at': None}
+        thread.start()
+
+    def _restart_worker(self, worker):
+        worker['stop'].close()
+        worker['stop'] = WakeupEvent()
+        worker['thread'] = threading.Thread(target=read, args=(worker['config'], worker['name'], worker['stop']), name=worker['name'])
+        worker['restart_at'] = None
+        worker['backoff'].started()
+        log_and_print(f"Restarting {worker['name']} on port {worker['config']['port']}")
+        worker['thread'].start()
+
+    def _stop_worker(self, port, reason, health_nodes=()):
+        worker = self._workers.pop(port)
+        log_and_print(f"Stopping {worker['name']} on port {port}: {reason}")
+        worker['stop'].set()
+        worker['thread'].join()
+        worker['stop'].close()
+
+        # Nobody beats these health nodes any more, tell the PLC why
+        scanner_cfg = worker['config']
+        if scanner_cfg['barcode_health_check'] not in health_nodes:
+            try:
+                endpoints = OpcEndpoints(scanner_cfg)
+            except ValueError:
+                return
+            endpoints.write_all([(scanner_cfg['barcode_health_check'], 0), (scanner_cfg['barcode_health_check_message'], f"Stopped - {reason}")])
+
+    def restart_dead(self):
+        """
+        Restart the scanner threads that ended on their own once their backoff delay passed
+
+        Returns:
+            float: Seconds until the next pending restart, None if nothing waits for one
+        """
+        now = time.monotonic()
+        next_restart = None
+        for worker in self._workers.values():
+            if worker['thread'].is_alive():
+                continue
+            if worker['restart_at'] is None:
+                delay = worker['backoff'].failed()
+                worker['restart_at'] = now + delay
+                log_and_print(f"Thread {worker['name']} is not alive, restarting in {delay:.0f} s", type_of_log="WARNING")
+            if worker['restart_at'] <= now:
+                self._restart_worker(worker)
+            else:
+                wait = worker['restart_at'] - now
+                next_restart = wait if next_restart is None else min(next_restart, wait)
+        return next_restart
+
+    def stop_all(self):
+        for worker in self._workers.values():
+            worker['stop'].set()
+        for port in list(self._workers):
+            worker = self._workers.pop(port)
+            worker['thread'].join()
+            worker['stop'].close()
+#-------------------------------------------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------------------------------------------
+# Asyncio runtime - one event loop serving all scanners
+#-------------------------------------------------------------------------------------------------------------------
+def _load_async_ua():
+    from asyncua import ua as async_ua
+    return async_ua
+
+class AsyncOpcSession:
+    """
+    asyncio counterpart of OpcSession built on asyncua (optional dependency).
+
+    One instance is shared by all scanner tasks of the event loop. It
+    reconnects with exponential backoff, keeps the session alive and
+    recreates data change subscriptions after a reconnect.
+    """
+    def __init__(self, url, timeout=None, keepalive_interval=None, backoff_min=None, backoff_max=None):
+        self.url = url
+        self.timeout = opc_timeout if timeout is None else timeout
+        self.keepalive_interval = opc_keepalive_interval if keepalive_interval is None else keepalive_interval
+        self.backoff_min = opc_reconnect_backoff_min if backoff_min is None else backoff_min
+        self.backoff_max = opc_reconnect_backoff_max if backoff_max is None else backoff_max
+
+        self._client = None
+        self._connected = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        self._monitored = {}            # NodeId -> list of data change callbacks
+        self._handles = {}              # NodeId -> monitored item handle in the current subscription
+        self._subscription = None
+        self._subscription_lock = asyncio.Lock()
+
+        # Health check nodes written by the heartbeat task of this server, see _heartbeat_async
+        self.heartbeat_nodes = {}
+
+        self.registry = NodeRegistry(_load_async_ua)
+        self._registry_lock = asyncio.Lock()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"OPC-{self.url}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._disconnect()
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    async def get_client(self, wait=None):
+        try:
+            await asyncio.wait_for(self._connected.wait(), self.timeout if wait is None else wait)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"OPC server {self.url} is not connected")
+        if self._client is None:
+            raise ConnectionError(f"OPC server {self.url} is not connected")
+        return self._client
+
+    def invalidate(self, reason=None):
+        if not self._connected.is_set():
+            return
+        self._connected.clear()
+        log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - connection lost: {reason}", type_of_log="WARNING")
+        self._wakeup.set()
+
+    async def subscribe(self, nodeid, callback):
+        """Call callback(value) on every data change of nodeid"""
+        from asyncua import ua as async_ua
+
+        key = async_ua.NodeId.from_string(nodeid) if isinstance(nodeid, str) else nodeid
+        self._monitored.setdefault(key, []).append(callback)
+
+        if self._connected.is_set():
+            try:
+                await self._monitor([key])
+            except Exception as ex:
+                log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - subscribe {nodeid} - {ex}", type_of_log="ERROR")
+                _handle_opc_error(self, ex)
+
+    async def unsubscribe(self, nodeid, callback):
+        from asyncua import ua as async_ua
+
+        key = async_ua.NodeId.from_string(nodeid) if isinstance(nodeid, str) else nodeid
+        callbacks = self._monitored.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callbacks:
+            return
+        self._monitored.pop(key, None)
+
+        async with self._subscription_lock:
+            handle = self._handles.pop(key, None)
+            if handle is not None and self._subscription is not None:
+                try:
+                    await self._subscription.unsubscribe(handle)
+                except Exception:
+                    pass
+
+    def is_subscribed(self, nodeid):
+        from asyncua import ua as async_ua
+
+        key = async_ua.NodeId.from_string(nodeid) if isinstance(nodeid, str) else nodeid
+        return self._connected.is_set() and key in self._handles
+
+    def datachange_notification(self, node, val, data):
+        for callback in list(self._monitored.get(node.nodeid, ())):
+            callback(val)
+
+    async def register_nodes(self, nodeids):
+        """Add nodes to the registry, they are resolved now if connected, otherwise on connect"""
+        self.registry.add(nodeids)
+
+        if self._connected.is_set():
+            try:
+                await self._resolve_nodes()
+            except Exception as ex:
+                log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - register nodes - {ex}", type_of_log="ERROR")
+                _handle_opc_error(self, ex)
+
+    async def _resolve_nodes(self):
+        from asyncua import ua as async_ua
+
+        async with self._registry_lock:
+            pending = self.registry.pending()
+            client = self._client
+            if not pending or client is None:
+                return
+
+            parsed = [nodeid for _, nodeid in pending]
+            registered = await client.uaclient.register_nodes(parsed)
+            results = await client.uaclient.read_attributes(parsed, async_ua.AttributeIds.DataType)
+            datatypes = [result.Value.Value if result.StatusCode is None or result.StatusCode.is_good() else None for result in results]
+            self.registry.update([node for node, _ in pending], registered, datatypes)
+
+    async def zapis_davka(self, hodnoty):
+        """Async zapis_do_opc_davka, returns True if every value was written"""
+        from asyncua import ua as async_ua
+
+        hodnoty = _hodnoty(hodnoty)
+        if not hodnoty:
+            return True
+
+        try:
+            nodeids = [self.registry.nodeid(nodeidrun) for nodeidrun, _, _ in hodnoty]
+            datavalues = [async_ua.DataValue(Value=async_ua.Variant(value, self.registry.variant_type(nodeidrun, value)), SourceTimestamp=timestamp) for nodeidrun, value, timestamp in hodnoty]
+
+            client = await self.get_client()
+            results = await client.uaclient.write_attributes(nodeids, datavalues, async_ua.AttributeIds.Value)
+        except Exception as ex:
+            log_and_print(funkce="AsyncOpcSession", text=", ".join(nodeidrun for nodeidrun, _, _ in hodnoty) + " - " + str(ex), type_of_log="ERROR")
+            _handle_opc_error(self, ex)
+            return False
+
+        ok = True
+        for (nodeidrun, value, _), result in zip(hodnoty, results):
+            if not result.is_good():
+                log_and_print(funkce="AsyncOpcSession", text=f"{nodeidrun} - {result}", type_of_log="ERROR")
+                metrics.inc("opc_errors_total", server=self.url)
+                ok = False
+        return ok
+
+    async def cteni(self, nodeidrun):
+        """Async cteni_z_opc, returns None on error"""
+        try:
+            client = await self.get_client()
+            return await client.get_node(self.registry.nodeid(nodeidrun)).read_value()
+        except Exception as ex:
+            log_and_print(funkce="AsyncOpcSession", text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+            _handle_opc_error(self, ex)
+            return None
+
+    async def cteni_davka(self, nodeids):
+        """Async cteni_z_opc_davka, None where the read failed"""
+        from asyncua import ua as async_ua
+
+        try:
+            client = await self.get_client()
+            results = await client.uaclient.read_attributes([self.registry.nodeid(nodeidrun) for nodeidrun in nodeids], async_ua.AttributeIds.Value)
+        except Exception as ex:
+            log_and_print(funkce="AsyncOpcSession", text=", ".join(nodeids) + " - " + str(ex), type_of_log="ERROR")
+            _handle_opc_error(self, ex)
+            return [None] * len(nodeids)
+
+        return [result.Value.Value if result.StatusCode is None or result.StatusCode.is_good() else None for result in results]
+
+    async def _monitor(self, keys):
+        async with self._subscription_lock:
+            keys = [key for key in keys if key not in self._handles]
+            if not keys:
+                return
+
+            client = self._client
+            if client is None:
+                raise ConnectionError(f"OPC server {self.url} is not connected")
+            if self._subscription is None:
+                self._subscription = await client.create_subscription(opc_subscription_period, self)
+
+            results = await self._subscription.subscribe_data_change([client.get_node(key) for key in keys])
+            for key, result in zip(keys, results):
+                if isinstance(result, int):
+                    self._handles[key] = result
+                else:
+                    log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - subscribe {key.to_string()} - {result}", type_of_log="ERROR")
+
+    async def _connect(self):
+        from asyncua import Client as AsyncClient
+
+        client = AsyncClient(self.url, timeout=self.timeout)
+        await client.connect()
+        self._client = client
+
+        # Before the session is announced, so the first requests already use the registry
+        try:
+            await self._resolve_nodes()
+        except Exception as ex:
+            # Not fatal, requests then use the parsed NodeIds and guessed types
+            log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - register nodes - {ex}", type_of_log="WARNING")
+        self._connected.set()
+
+        if self._monitored:
+            await self._monitor(list(self._monitored))
+
+    async def _disconnect(self):
+        self._subscription = None
+        self._handles.clear()
+        self.registry.clear()
+        client = self._client
+        self._client = None
+        self._connected.clear()
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def _keepalive(self):
+        from asyncua import ua as async_ua
+
+        await self._client.get_node(async_ua.NodeId(async_ua.ObjectIds.Server_ServerStatus_State)).read_value()
+
+    async def _run(self):
+        backoff = self.backoff_min
+
+        while True:
+            if not self._connected.is_set():
+                await self._disconnect()
+                try:
+                    with startup_profile.phase("OPC connect"):
+                        await self._connect()
+                    log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - connected")
+                    backoff = self.backoff_min
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    log_and_print(funkce="AsyncOpcSession", text=f"{self.url} - {ex} (retry in {backoff:.1f} s)", type_of_log="ERROR")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.keepalive_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self._connected.is_set():
+                try:
+                    await self._keepalive()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self.invalidate(ex)
+
+class AsyncAckWaiter(AckWaiter):
+    """asyncio counterpart of AckWaiter, notified from the event loop"""
+    def __init__(self):
+        super().__init__()
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class AsyncOpcEndpoints(OpcEndpoints):
+    """asyncio counterpart of OpcEndpoints, `get_session` returns the AsyncOpcSession of a URL"""
+    def __init__(self, scanner_config, get_session):
+        super().__init__(scanner_config, get_session)
+        self._background = set()
+
+    async def write(self, hodnoty, ack_waiter=None):
+        """Async OpcEndpoints.write, with nothing connected the primary server waits for its reconnect"""
+        sessions = self.connected() or [self.primary]
+        self._writes = {}
+        if self.mode == "failover" or len(sessions) < 2:
+            for session in sessions:
+                if ack_waiter is not None:
+                    ack_waiter.arm([session])
+                if await session.zapis_davka(hodnoty):
+                    self._writes = {True: session}
+                    return [session]
+            return []
+
+        if ack_waiter is not None:
+            ack_waiter.arm(sessions)
+        writes = self._writes = {asyncio.create_task(session.zapis_davka(hodnoty)): session for session in sessions}
+        pending = set(writes)
+        written = []
+        while pending and not written:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            written = [writes[write] for write in done if write.result()]
+        # Writes to the slower servers go on, the tasks are kept until they end
+        self._background.update(pending)
+        for write in pending:
+            write.add_done_callback(self._background.discard)
+        return written[:1]
+
+    async def written(self):
+        pending = [write for write in self._writes if write is not True and not write.done()]
+        if pending:
+            await asyncio.wait(pending)
+        return [session for write, session in self._writes.items() if write is True or (not write.cancelled() and write.result())]
+
+    async def reset(self, nodeid):
+        await asyncio.gather(*(session.zapis_davka([(nodeid, False)]) for session in await self.written()))
+
+    async def write_all(self, hodnoty):
+        await asyncio.gather(*(session.zapis_davka(hodnoty) for session in self.connected()))
+
+async def _heartbeat_async(session, heartbeat_nodes):
+    """
+    asyncio counterpart of HeartbeatScheduler
+
+    heartbeat_nodes maps barcode_health_check nodeid -> [scanner_name, counter or None,
+    message node, status callback or None, last status]
+    """
+    loop = asyncio.get_running_loop()
+    next_beat = loop.time() + health_check_interval
+
+    while True:
+        await asyncio.sleep(max(0.0, next_beat - loop.time()))
+
+        entries = [(nodeid, *entry) for nodeid, entry in heartbeat_nodes.items()]
+        if entries and session.is_connected():
+            start = time.perf_counter()
+
+            unknown = [entry[0] for entry in entries if entry[2] is None]
+            current = dict(zip(unknown, await session.cteni_davka(unknown))) if unknown else {}
+
+            counters = []
+            statuses = []
+            for nodeid, _, counter, message_node, status, last_status in entries:
+                if counter is None:
+                    counter = current.get(nodeid)
+                if isinstance(counter, int):
+                    counters.append((nodeid, _next_counter(counter, session.registry.declared_type(nodeid))))
+                if status is not None and message_node:
+                    text = status()
+                    if text != last_status:
+                        statuses.append((nodeid, message_node, text))
+
+            writes = counters + [(message_node, text) for _, message_node, text in statuses]
+            written = set(writes)
+            if writes and not await session.zapis_davka(writes):
+                # One bad node must not stop the heartbeat of the other scanners on the session
+                written = {write for write in writes if session.is_connected() and await session.zapis_davka([write])}
+            for nodeid, value in counters:
+                if nodeid in heartbeat_nodes and (nodeid, value) in written:
+                    heartbeat_nodes[nodeid][1] = value
+            for nodeid, message_node, text in statuses:
+                if nodeid in heartbeat_nodes and (message_node, text) in written:
+                    heartbeat_nodes[nodeid][4] = text
+
+            duration = time.perf_counter() - start
+            for _, scanner_name, *_ in entries:
+                metrics.observe("scanner_stage_seconds", duration, scanner=scanner_name, stage="health_check")
+
+        next_beat += health_check_interval
+        now = loop.time()
+        if next_beat <= now:
+            next_beat += ((now - next_beat) // health_check_interval + 1) * health_check_interval
+
+async def _output_async(port, output_queue, scanner_name):
+    """asyncio counterpart of SerialOutputScheduler, sends queued ((bytes, pause) sequence, done) items in order"""
+    while True:
+        sequence, done = await output_queue.get()
+        start = time.perf_counter()
+        sent = None
+        try:
+            for data, pause in sequence:
+                port.write(data)
+                if pause:
+                    await asyncio.sleep(pause)
+            sent = time.monotonic()
+        except Exception as ex:
+            log_and_print(f"{scanner_name}: Error writing to serial port: {ex}", type_of_log="ERROR")
+        if done is not None:
+            done(sent)
+
+        if any(data == BEL for data, _ in sequence):
+            metrics.observe("scanner_stage_seconds", time.perf_counter() - start, scanner=scanner_name, stage="beep")
+
+async def _cteni_potvrzeni_async(barcode_response_node, ack_waiter, sessions):
+    """One poll of barcode_response_node on every session, notes the one that confirmed"""
+    for session in sessions:
+        if await session.cteni(barcode_response_node) is True:
+            ack_waiter.session = session
+            return True
+    return False
+
+async def _cekani_na_potvrzeni_async(barcode_response_node, ack_waiter, ack_timeout, sessions):
+    """asyncio counterpart of cekani_na_potvrzeni"""
+    if any(session.is_subscribed(barcode_response_node) for session in sessions):
+        return await ack_waiter.wait(ack_timeout)
+
+    deadline = time.monotonic() + ack_timeout
+    potrvzeni = await _cteni_potvrzeni_async(barcode_response_node, ack_waiter, sessions)
+    while not potrvzeni and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        potrvzeni = await _cteni_potvrzeni_async(barcode_response_node, ack_waiter, sessions)
+    return potrvzeni
+
+async def _predani_do_opc_async(entry_id, scan, scanner_config, scanner_name, endpoints, ack_waiter, journal):
+    """asyncio counterpart of predani_do_opc, returns True/False (confirmed or not) or None (kept in journal)"""
+    barcode_response_node = scanner_config['barcode_response_node']
+
+    with metrics.timer("scanner_stage_seconds", scanner=scanner_name, stage="opc_write"):
+        written = await endpoints.write([(barcode_response_node, False), (scanner_config['barcode_node'], scan.barcode, source_timestamp(scan))], ack_waiter)
+    if not written:
+        if not endpoints.is_connected():
+            return None
+        journal.delete(entry_id)
+        log_and_print(f"{scanner_name}: Barcode {scan.barcode} rejected by the OPC server, dropped from journal", type_of_log="ERROR")
+        metrics.inc("scanner_rejected_total", scanner=scanner_name)
+        return False
+    journal.delete(entry_id)
+
+    start = scan.written = time.monotonic()
+    potrvzeni = await _cekani_na_potvrzeni_async(barcode_response_node, ack_waiter, scanner_config['ack_timeout'], written)
+    if potrvzeni:
+        scan.acked = time.monotonic()
+    metrics.observe("scanner_stage_seconds", time.monotonic() - start, scanner=scanner_name, stage="ack_wait")
+    if not potrvzeni:
+        metrics.inc("scanner_ack_timeouts_total", scanner=scanner_name)
+
+    log_and_print("%s: Čekání na potvrzení: %.1f ms", scanner_name, (time.monotonic() - start) * 1000, type_of_log="DEBUG")
+    return potrvzeni
+
+async def _predani_journalu_async(port, scanner_config, scanner_name, endpoints, ack_waiter, journal):
+    """
+    Forward the journaled barcodes of `port` in scan order, same as ScanForwarder._drain
+
+    Returns:
+        bool: True while barcodes are left in the journal (no server reachable)
+    """
+    while endpoints.is_connected():
+        entry = journal.oldest(port)
+        if entry is None:
+            return False
+        entry_id, barcode, created = entry
+        scan = Scan(barcode, created)
+
+        potrvzeni = await _predani_do_opc_async(entry_id, scan, scanner_config, scanner_name, endpoints, ack_waiter, journal)
+        if potrvzeni is None:
+            return True
+        if potrvzeni:
+            await endpoints.reset(scanner_config['barcode_response_node'])
+
+        scan_done(scanner_name, port, scan, scan_outcomes[potrvzeni])
+        log_and_print(f"{scanner_name}: Forwarded journaled barcode {barcode} ({time.time() - created:.1f} s old), ACK {potrvzeni}")
+    return True
+
+async def _zpracovani_async(port, output_queue, scan, entry_id, scanner_config, scanner_name, endpoints, ack_waiter, journal, duplicates=None):
+    """
+    Hand a journaled scan to the PLC, ACK and beep on the scanner once confirmed
+
+    Returns:
+        True/False/None: as _predani_do_opc_async, None when the scan stays in the journal
+    """
+    barcode = scan.barcode
+    barcode_response_node = scanner_config['barcode_response_node']
+    barcode_beep_count = scanner_config['barcode_beep_count']
+
+    potrvzeni = await _predani_do_opc_async(entry_id, scan, scanner_config, scanner_name, endpoints, ack_waiter, journal)
+
+    if potrvzeni is None:
+        log_and_print(f"{scanner_name}: OPC not available, barcode {barcode} kept in journal", type_of_log="WARNING")
+        scan_done(scanner_name, scanner_config['port'], scan, SCAN_JOURNALED)
+        return None
+
+    if potrvzeni:
+        log_and_print(f"{scanner_name}: Potvrzení ACK")
+        # Written right away, beeps of an earlier scan only pause between their own bytes
+        port.write(ACK)
+        scan_publisher.publish(scanner_name, scanner_config['port'], scan, SCAN_ACK)
+        if duplicates is not None:
+            duplicates.record(barcode)
+
+        # Every server that got the barcode is reset, the one that confirmed first tells the beep count
+        await endpoints.reset(barcode_response_node)
+        session = ack_waiter.session or endpoints.primary
+
+        def traced_beep(beeped):
+            # The trace line of a confirmed scan is complete once its beeps went out
+            scan.beeped = beeped
+            scan_tracer.finish(scanner_name, scanner_config['port'], scan, SCAN_ACK)
+
+        pocet_pipnuti = await session.cteni(barcode_beep_count)
+        if pocet_pipnuti:
+            output_queue.put_nowait(([(BEL, beep_interval)] * (pocet_pipnuti - 1) + [(BEL, 0)], traced_beep))
+        else:
+            traced_beep(None)
+    else:
+        scan_done(scanner_name, scanner_config['port'], scan, SCAN_NOT_CONFIRMED)
+
+    log_and_print("Potvrzení - %s", potrvzeni, type_of_log="DEBUG")
+    return potrvzeni
+
+async def read_async(scanner_config, scanner_name, get_session, stop_event=None):
+    """Asyncio version of read(), serves one scanner inside the shared event loop, `get_session` returns the session of a server URL"""
+    pPort = scanner_config['port']
+    barcode_response_node = scanner_config['barcode_response_node']
+    barcode_health_check = scanner_config['barcode_health_check']
+    barcode_health_check_message = scanner_config['barcode_health_check_message']
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        framer = BarcodeFramer(scanner_config)
+    except ValueError as e:
+        log_and_print(f"{scanner_name}: Invalid framing configuration: {e}", type_of_log="ERROR")
+        return
+    duplicates = duplicate_filter(scanner_config)
+    duplicate_response = scanner_config.get('duplicate_response', 'ack')
+
+    try:
+        scan_queue = ScanQueue(scanner_config.get('scan_queue_size', 16), scanner_config.get('scan_queue_policy', 'block'))
+        endpoints = AsyncOpcEndpoints(scanner_config, get_session)
+    except ValueError as e:
+        log_and_print(f"{scanner_name}: {e}", type_of_log="ERROR")
+        return
 
-from datetime import datetime
-from opcua import Client, ua
-from logging.handlers import TimedRotatingFileHandler
-from conf.conf import get_scanner_configurations, get_log_level, get_log_retention_days, get_version, update_local_config_from_remote
+    # The port is opened in the read loop below and opened again whenever it is lost
+    port = SerialPortHandle()
 
-global_barcode = ""
-server_url = "opc.tcp://0.0.0.0:4840"
+    def status():
+        return scan_queue.status() if port.ser is not None else f"Waiting for port {pPort}"
 
-continue_reading = True
+    ack_waiter = AsyncAckWaiter()
+    for session in endpoints.sessions:
+        await session.register_nodes([scanner_config[key] for key in scanner_node_keys])
+        await session.subscribe(barcode_response_node, ack_waiter.callback(session))
 
-logger_name = os.path.splitext(os.path.basename(__file__))[0]
+    data_ready = asyncio.Event()
+    if stop_event is not None:
+        loop.add_reader(stop_event.fileno(), data_ready.set)
+    for session in endpoints.sessions:
+        session.heartbeat_nodes[barcode_health_check] = [scanner_name, None, barcode_health_check_message, status, None]
+    output_queue = asyncio.Queue()
+    output_task = asyncio.create_task(_output_async(port, output_queue, scanner_name))
 
-#-------------------------------------------------------------------------------------------------------------------
-# Zapis do OPC serveru
-#-------------------------------------------------------------------------------------------------------------------
-def zapis_do_opc(nodeidrun, value):
-    log_and_print(funkce=inspect.currentframe().f_code.co_name, text="Začátek", type_of_log="DEBUG")
+    queued = asyncio.Event()
+    space = asyncio.Event()
 
-    #server_url = "opc.tcp://0.0.0.0:4840"
-    global server_url
+    # Every scan is journaled before the handover, the thread runtime shares the file
+    journal = get_scan_forwarder().journal
 
-    client = Client(server_url)
+    async def predani():
+        """Hand the queued barcodes to the PLC one by one, while the reader keeps reading the port"""
+        journaled = journal.oldest(pPort) is not None
+        while True:
+            # Journaled barcodes go before the new ones, once a server is reachable
+            if journaled and endpoints.is_connected():
+                journaled = await _predani_journalu_async(pPort, scanner_config, scanner_name, endpoints, ack_waiter, journal)
+            scan = scan_queue.take()
+            if scan is None:
+                queued.clear()
+                try:
+                    await asyncio.wait_for(queued.wait(), journal_retry_interval if journaled else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            space.set()
+            metrics.set("scanner_queue_depth", len(scan_queue), scanner=scanner_name)
 
-    try:
-        client.connect()
-    except Exception as ex:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
-    
-    if isinstance(value, bool):
-        variant_type = ua.VariantType.Boolean
-    elif isinstance(value, int):
-        variant_type = ua.VariantType.Int32
-    elif isinstance(value, float):
-        variant_type = ua.VariantType.Double
-    elif isinstance(value, str):
-        variant_type = ua.VariantType.String
-    else:
-        raise ValueError("Unsupported type")
+            # Every scan goes to the journal first. It is written directly only when nothing
+            # older is waiting and the server is up, otherwise it is forwarded from the journal later.
+            entry_id = journal.append(pPort, scan.barcode, scan.scanned_at)
+            if journaled or journal.has_older(pPort, entry_id) or not endpoints.is_connected():
+                journaled = True
+                log_and_print(f"{scanner_name}: OPC not available, barcode {scan.barcode} kept in journal", type_of_log="WARNING")
+                scan_done(scanner_name, pPort, scan, SCAN_JOURNALED)
+                continue
+            journaled = await _zpracovani_async(port, output_queue, scan, entry_id, scanner_config, scanner_name, endpoints, ack_waiter, journal, duplicates) is None
+
+    handshake_task = asyncio.create_task(predani(), name=f"{scanner_name}-handshake")
+    # A failed handshake wakes the reader, which then stops the scanner
+    handshake_task.add_done_callback(lambda task: data_ready.set())
 
     try:
-        node = client.get_node(nodeidrun)
+        with startup_profile.phase(f"{scanner_name} open port"):
+            ser = await otevreni_portu_async(scanner_config, scanner_name, stop_event)
+        lost_at = None
 
-        if value != '':
-            #node.set_value(ua.DataValue(ua.Variant(barcode, ua.VariantType.String)))
-            node.set_value(ua.DataValue(ua.Variant(value, variant_type)))
-            log_and_print(funkce=inspect.currentframe().f_code.co_name, text=str(value), type_of_log="DEBUG")
-    except Exception as ex:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+        while ser is not None and not (stop_event is not None and stop_event.is_set()):
+            if handshake_task.done():
+                handshake_task.result()
 
-    finally:
-    # Disconnect from the server
-        client.disconnect()     
-        #exit()
-#-------------------------------------------------------------------------------------------------------------------
+            if port.ser is None:
+                port.attach(ser)
+                loop.add_reader(ser.fileno(), data_ready.set)
+                metrics.set("scanner_port_connected", 1, scanner=scanner_name)
+                if lost_at is None:
+                    log_and_print(f"{scanner_name} ({pPort}): Listening for barcodes...")
+                    startup_profile.scanner_ready(scanner_name)
+                else:
+                    metrics.observe("scanner_port_recovery_seconds", time.monotonic() - lost_at, scanner=scanner_name)
+                    log_and_print(f"{scanner_name} ({pPort}): Port reattached after {time.monotonic() - lost_at:.1f} s, listening for barcodes...")
 
-#-------------------------------------------------------------------------------------------------------------------
-# Cteni z OPC serveru
-#-------------------------------------------------------------------------------------------------------------------
-def cteni_z_opc(nodeidrun):
-    log_and_print(funkce=inspect.currentframe().f_code.co_name, text="Začátek", type_of_log="DEBUG")
+            # An unterminated barcode is taken as is after the port timeout, same as readline()
+            try:
+                await asyncio.wait_for(data_ready.wait(), framer.pending_timeout())
+            except asyncio.TimeoutError:
+                pass
+            data_ready.clear()
 
-    #server_url = "opc.tcp://0.0.0.0:4840"
-    global server_url
+            try:
+                barcodes = framer.feed(ser.read(ser.in_waiting or 1))
+                arrivals = framer.arrivals
+            except (serial.SerialException, OSError) as e:
+                # Unplugged USB-serial adapter or a port gone away, the queue and the OPC side keep running meanwhile
+                log_and_print(f"{scanner_name} ({pPort}): Serial port lost: {e}", type_of_log="ERROR")
+                lost_at = time.monotonic()
+                loop.remove_reader(ser.fileno())
+                port.detach()
+                framer.reset()
+                metrics.set("scanner_port_connected", 0, scanner=scanner_name)
+                ser = await otevreni_portu_async(scanner_config, scanner_name, stop_event)
+                continue
+            barcodes += framer.flush()
+            arrivals += framer.arrivals
 
-    ret = None
+            for barcode, arrived in zip(barcodes, arrivals):
+                scan = Scan(barcode, arrived=arrived)
+                log_and_print(f"{scanner_name}: Scanned: {barcode}")
+                metrics.inc("scanner_scans_total", scanner=scanner_name)
 
-    client = Client(server_url)
+                if duplicates is not None and duplicates.is_duplicate(barcode):
+                    log_and_print(f"{scanner_name}: Duplicate {barcode} within {duplicates.window} s, answered {duplicate_response}")
+                    metrics.inc("scanner_duplicates_total", scanner=scanner_name)
+                    if duplicate_response == "ack":
+                        port.write(ACK)
+                    elif duplicate_response == "nak":
+                        port.write(NAK)
+                    scan_done(scanner_name, pPort, scan, SCAN_DUPLICATE)
+                    continue
 
-    try:
-        client.connect()
+                is_queued, lost = scan_queue.offer(scan)
+                while not is_queued and lost is None:
+                    # Policy 'block': the port is not read until the handshake takes a barcode
+                    space.clear()
+                    await space.wait()
+                    is_queued, lost = scan_queue.offer(scan)
+                queued.set()
+
+                metrics.set("scanner_queue_depth", len(scan_queue), scanner=scanner_name)
+                if lost is not None:
+                    log_and_print(f"{scanner_name}: Scan queue full ({scan_queue.maxsize}), barcode {lost.barcode} {'rejected' if scan_queue.policy == 'reject' else 'dropped'}", type_of_log="WARNING")
+                    metrics.inc("scanner_queue_dropped_total", scanner=scanner_name, policy=scan_queue.policy)
+                    scan_done(scanner_name, pPort, lost, SCAN_DROPPED)
+                    if scan_queue.policy == "reject":
+                        port.write(NAK)
+    except asyncio.CancelledError:
+        log_and_print(text=f"{scanner_name}: Stopped", type_of_log="ERROR")
+        for session in endpoints.sessions:
+            session.heartbeat_nodes.pop(barcode_health_check, None)
+        await endpoints.write_all([(barcode_health_check, 0), (barcode_health_check_message, "Stopped")])
+        raise
     except Exception as ex:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+        log_and_print(text=f"Error - {ex}", type_of_log="ERROR")
+        for session in endpoints.sessions:
+            session.heartbeat_nodes.pop(barcode_health_check, None)
+        await endpoints.write_all([(barcode_health_check, 0), (barcode_health_check_message, f"Stopped - {ex}")])
+    finally:
+        for session in endpoints.sessions:
+            session.heartbeat_nodes.pop(barcode_health_check, None)
+        # wait_for() before Python 3.12 loses the cancellation when the ACK arrives at the same moment,
+        # the handshake would then wait for the next barcode forever
+        while not handshake_task.done():
+            handshake_task.cancel()
+            await asyncio.wait({handshake_task}, timeout=0.1)
+        # Scans the handshake did not get to are delivered after the next start
+        for scan in scan_queue.drain():
+            journal.append(pPort, scan.barcode, scan.scanned_at)
+            log_and_print(f"{scanner_name}: Barcode {scan.barcode} not handed over yet, kept in journal", type_of_log="WARNING")
+        metrics.set("scanner_queue_depth", 0, scanner=scanner_name)
+        output_task.cancel()
+        if port.ser is not None:
+            loop.remove_reader(port.ser.fileno())
+        if stop_event is not None:
+            loop.remove_reader(stop_event.fileno())
+        for session in endpoints.sessions:
+            await session.unsubscribe(barcode_response_node, ack_waiter.callback(session))
+        port.detach()
+        metrics.set("scanner_port_connected", 0, scanner=scanner_name)
+
+async def run_async(scanners_config, config_watcher=None, names=None):
+    """Serve all scanners from one event loop, with one shared asyncua session and heartbeat task per OPC server"""
+    global _connection_status_codes
 
     try:
-        node = client.get_node(nodeidrun)
+        with startup_profile.phase("import asyncua"):
+            import asyncua
+    except ImportError:
+        log_and_print(text="Runtime 'asyncio' needs the asyncua package (pip install asyncua)", type_of_log="ERROR")
+        return
+    _connection_status_codes = _status_codes(asyncua.ua)
 
-        ret = node.get_value()
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=str(ret), type_of_log="DEBUG")
-    except Exception as ex:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=nodeidrun + " - " + str(ex), type_of_log="ERROR")
+    sessions = {}           # server URL -> AsyncOpcSession
+    heartbeat_tasks = []
+
+    def start_session(session):
+        session.start()
+        heartbeat_tasks.append(asyncio.create_task(_heartbeat_async(session, session.heartbeat_nodes), name=f"Heartbeat-{session.url}"))
+
+    def get_session(url):
+        """Session of `url`, a server first named by a reloaded configuration gets its own"""
+        session = sessions.get(url)
+        if session is None:
+            session = sessions[url] = AsyncOpcSession(url)
+            start_session(session)
+        return session
+
+    # The first connect of every server resolves all nodes configured for it
+    for url, nodeids in nodes_by_server(scanners_config).items():
+        sessions[url] = AsyncOpcSession(url)
+        await sessions[url].register_nodes(nodeids)
+        start_session(sessions[url])
+
+    workers = {}        # port -> (scanner config, task, stop event)
+    restarts = {}       # port -> [backoff, monotonic time of the pending restart or None]
+    if names is None:
+        names = {}
+
+    def start_worker(scanner_cfg):
+        scanner_name = nazev_skeneru(names, scanner_cfg['port'])
+        log_and_print(f"Initializing {scanner_name} on port {scanner_cfg['port']}")
+        stop = WakeupEvent()
+        task = asyncio.create_task(read_async(scanner_cfg, scanner_name, get_session, stop), name=scanner_name)
+        workers[scanner_cfg['port']] = (scanner_cfg, task, stop)
+
+    def restart_dead():
+        """Same as ScannerPool.restart_dead(), returns seconds until the next pending restart"""
+        now = time.monotonic()
+        next_restart = None
+        for port, (scanner_cfg, task, stop) in list(workers.items()):
+            if not task.done():
+                continue
+            backoff, restart_at = restarts.setdefault(port, [RestartBackoff(), None])
+            if restart_at is None:
+                delay = backoff.failed()
+                restart_at = restarts[port][1] = now + delay
+                log_and_print(f"Task {task.get_name()} is not alive, restarting in {delay:.0f} s", type_of_log="WARNING")
+            if restart_at <= now:
+                stop.close()
+                restarts[port][1] = None
+                backoff.started()
+                log_and_print(f"Restarting {task.get_name()} on port {port}")
+                start_worker(scanner_cfg)
+            else:
+                wait = restart_at - now
+                next_restart = wait if next_restart is None else min(next_restart, wait)
+        return next_restart
+
+    async def stop_worker(port, reason, health_nodes):
+        restarts.pop(port, None)
+        scanner_cfg, task, stop = workers.pop(port)
+        log_and_print(f"Stopping {task.get_name()} on port {port}: {reason}")
+        stop.set()
+        await asyncio.gather(task, return_exceptions=True)
+        stop.close()
+        if scanner_cfg['barcode_health_check'] not in health_nodes:
+            try:
+                endpoints = AsyncOpcEndpoints(scanner_cfg, get_session)
+            except ValueError:
+                return
+            await endpoints.write_all([(scanner_cfg['barcode_health_check'], 0), (scanner_cfg['barcode_health_check_message'], f"Stopped - {reason}")])
+
+    async def apply(scanners_config):
+        running = {port: worker[0] for port, worker in workers.items()}
+        removed, changed, added = porovnani_skeneru(running, scanners_config)
+        health_nodes = {cfg['barcode_health_check'] for cfg in scanners_config}
+        for port in removed:
+            await stop_worker(port, "removed from configuration", health_nodes)
+            names.pop(port, None)
+        for scanner_cfg in changed:
+            await stop_worker(scanner_cfg['port'], "configuration changed", health_nodes)
+            start_worker(scanner_cfg)
+        for scanner_cfg in added:
+            start_worker(scanner_cfg)
+
+    await apply(scanners_config)
+    if config_watcher is None:
+        config_watcher = ConfigWatcher(get_config_path())
+
+    loop = asyncio.get_running_loop()
+    shutdown = asyncio.Event()
+    loop.add_reader(shutdown_event.fileno(), shutdown.set)
+    shutdown_task = asyncio.create_task(shutdown.wait(), name="Shutdown")
 
+    try:
+        next_restart = None
+        while not shutdown_event.is_set():
+            # Same as the thread runtime: a scanner that stops is restarted on its own, the others keep reading
+            timeout = config_reload_interval if next_restart is None else min(config_reload_interval, next_restart)
+            tasks = [worker[1] for worker in workers.values() if not worker[1].done()]
+            await asyncio.wait(tasks + [shutdown_task], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if shutdown_event.is_set():
+                break
+            next_restart = restart_dead()
+
+            # Only the scanners whose entry changed are restarted
+            new_config = config_watcher.poll()
+            if new_config is not None:
+                await apply(new_config)
     finally:
-    # Disconnect from the server
-        client.disconnect()     
-        #exit()
-    return ret
+        loop.remove_reader(shutdown_event.fileno())
+        shutdown_task.cancel()
+        tasks = [worker[1] for worker in workers.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _, _, stop in workers.values():
+            stop.close()
+        for task in heartbeat_tasks:
+            task.cancel()
+        await asyncio.gather(*heartbeat_tasks, return_exceptions=True)
+        # No scanner targets on this runtime, the forwarder thread only trims and compacts the journal
+        close_scan_forwarder()
+        for session in sessions.values():
+            await session.stop()
 #-------------------------------------------------------------------------------------------------------------------
 
 #-------------------------------------------------------------------------------------------------------------------
-# Log and print taxt and messages at the same time
+# Running the scanners - in this process or sharded over worker processes
 #-------------------------------------------------------------------------------------------------------------------
-def log_and_print(text: str, funkce: str=None, type_of_log: str="INFO"):
-    print(text)
+def run_threads(scanners_config, config_watcher, names=None):
+    """Serve every scanner from its own thread until shutdown is requested"""
+    # Open the shared OPC sessions before the scanners need them, the first connect resolves all configured nodes
+    for url, nodeids in nodes_by_server(scanners_config).items():
+        get_opc_session(url).register_nodes(nodeids)
 
-    if funkce is not None:
-        text = funkce + " : " + text
+    log_and_print(f"Starting {len(scanners_config)} scanner(s)...")
 
-    if type_of_log == "INFO":
-        logger.info(text)
-    elif type_of_log == "DEBUG":
-        logger.debug(text)
-    elif type_of_log == "WARNING":
-        logger.warning(text)
-    elif type_of_log == "ERROR":
-        logger.error(text)
-    else:
-        logger.info(text)
-#------------------------------------------------------------------------------------------------------------------- 
+    # Create and start threads for all scanners
+    scanner_pool = ScannerPool(names)
+    scanner_pool.apply(scanners_config)
 
-#------------------------------------------------------------------------------------------------------------------- 
-# Get the current date and time in the format YYYY_MM_DD__HH_MM_SS
-#------------------------------------------------------------------------------------------------------------------- 
-def actual_date_time():
-    """
-    Returns the current date and time in the format YYYY_MM_DD__HH_MM_SS
-    """
-    curr_time = datetime.now()
-    return curr_time.strftime('%Y_%m_%d__%H_%M_%S_%f')
-#------------------------------------------------------------------------------------------------------------------- 
+    try:
+        next_restart = None
+        while True:
+            # Sleeps until shutdown is requested, the next config check or the next pending restart
+            timeout = config_reload_interval if next_restart is None else min(config_reload_interval, next_restart)
+            if shutdown_event.wait(timeout):
+                break
 
-#-------------------------------------------------------------------------------------------------------------------
-# Return the path of the script
-# This function is used to get the directory of the script, which is useful for loading configuration
-#-------------------------------------------------------------------------------------------------------------------
-def get_script_path():
-    return os.path.dirname(os.path.realpath(sys.argv[0]))
-#-------------------------------------------------------------------------------------------------------------------
+            # A scanner thread that ended on its own is restarted, the other scanners keep reading
+            next_restart = scanner_pool.restart_dead()
 
-#-------------------------------------------------------------------------------------------------------------------
-# Function to clean up old log files
-#-------------------------------------------------------------------------------------------------------------------
-def cleanup_old_logs(log_dir, days_to_keep=30):
+            # Only the scanners whose entry changed are restarted
+            new_config = config_watcher.poll()
+            if new_config is not None:
+                scanner_pool.apply(new_config)
+    finally:
+        # Wait for all scanner threads to finish
+        scanner_pool.stop_all()
+
+        close_heartbeat_scheduler()
+        close_scan_forwarder()
+        close_opc_sessions()
+
+def run_scanners(runtime, scanners_config, config_watcher, names=None):
+    """Serve the scanners on the selected runtime until shutdown is requested"""
+    if runtime == "asyncio":
+        log_and_print(f"Starting {len(scanners_config)} scanner(s) on the asyncio runtime...")
+        asyncio.run(run_async(scanners_config, config_watcher, names))
+    else:
+        run_threads(scanners_config, config_watcher, names)
+
+def worker_main(shard, options, log_queue):
     """
-    Delete log files older than specified number of days
-    
+    Entry point of a worker process, serves the serial ports of one shard
+
     Args:
-        log_dir: Directory containing log files
-        days_to_keep: Number of days to keep log files (default: 30)
+        shard: (index, count) of this worker
+        options: dict with runtime, names, metrics_port, scan_socket, scan_trace and startup_profile from the supervisor
+        log_queue: multiprocessing queue read by the supervisor's log handlers
     """
-    try:
-        from datetime import timedelta
-        
-        if not os.path.exists(log_dir):
-            return
-        
-        # Calculate the cutoff date
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        cutoff_timestamp = cutoff_date.timestamp()
-        
-        deleted_count = 0
-        
-        # Iterate through all files in log directory
-        for filename in os.listdir(log_dir):
-            if filename.endswith('.log'):
-                file_path = os.path.join(log_dir, filename)
-                
-                # Get file modification time
-                file_mtime = os.path.getmtime(file_path)
-                
-                # Delete if older than cutoff date
-                if file_mtime < cutoff_timestamp:
-                    try:
-                        os.remove(file_path)
-                        deleted_count += 1
-                        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Deleted old log file: {filename}", type_of_log="DEBUG")
-                    except Exception as e:
-                        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Failed to delete {filename}: {e}", type_of_log="WARNING")
-        
-        if deleted_count > 0:
-            log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Cleaned up {deleted_count} old log file(s)", type_of_log="INFO")
-            
-    except Exception as e:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Error during log cleanup: {e}", type_of_log="ERROR")
-#-------------------------------------------------------------------------------------------------------------------
+    # Ctrl+C reaches the whole process group, the supervisor stops its workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _shutdown_signal)
+    install_diagnostics(os.path.join(get_script_path(), "log"))
 
-#-------------------------------------------------------------------------------------------------------------------
-# Function to load configuration from JSON file
-#-------------------------------------------------------------------------------------------------------------------
-def load_config(config_file=None):
-    """Load configuration from JSON file with default values"""
-    if config_file is None:
-        script_dir = get_script_path()
-        # First try conf subdirectory, then script directory (backward compatibility)
-        config_file = os.path.join(script_dir, 'conf', 'scan_rs232.json')
-        if not os.path.exists(config_file):
-            config_file = os.path.join(script_dir, 'scan_rs232.json')
-    
-    try:
-        with open(config_file) as f:
-            config_data = json.load(f)
-            
-            # Extract scanner configurations and log retention days
-            scanner_configs = config_data.get('scanner_configurations', [])
-            log_retention_days = config_data.get('log_retention_days', 30)
-            log_level = config_data.get('log_level', 'INFO').upper()
-            
-            # If scanner_configurations key doesn't exist, check if it's direct array or single object (backward compatibility)
-            if not scanner_configs:
-                if isinstance(config_data, list):
-                    scanner_configs = config_data
-                else:
-                    scanner_configs = [config_data]
-            
-            scanners = []
-            for idx, scanner_config in enumerate(scanner_configs):
-                scanner = {
-                    'port': scanner_config.get('port', '/dev/ttyS0'),
-                    'baudrate': scanner_config.get('baudrate', 9600),
-                    'timeout': scanner_config.get('timeout', 10),
-                    'rtscts': scanner_config.get('rtscts', False),
-                    'dsrdtr': scanner_config.get('dsrdtr', False),
-                    'barcode_node': scanner_config.get('barcode_node', f'ns=1;i={100001 + idx * 5}'),
-                    'barcode_response_node': scanner_config.get('barcode_response_node', f'ns=1;i={100002 + idx * 5}'),
-                    'barcode_beep_count': scanner_config.get('barcode_beep_count', f'ns=1;i={100003 + idx * 5}'),
-                    'barcode_health_check': scanner_config.get('barcode_health_check', f'ns=1;i={100004 + idx * 5}'),
-                    'barcode_health_check_message': scanner_config.get('barcode_health_check_message', f'ns=1;i={100005 + idx * 5}')
-                }
-                scanners.append(scanner)
-            
-            log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Configuration loaded: {len(scanners)} scanner(s) from {config_file}", type_of_log="DEBUG")
-            return {
-                'scanners': scanners,
-                'log_retention_days': log_retention_days,
-                'log_level': log_level
-            }
-    except FileNotFoundError:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Config file not found: {config_file}", type_of_log="WARNING")
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text="Using default configuration values", type_of_log="INFO")
-        return {
-            'log_level': 'INFO',
-            'scanners': [{
-                'port': '/dev/ttyS0',
-                'baudrate': 9600,
-                'timeout': 10,
-                'rtscts': False,
-                'dsrdtr': False,
-                'barcode_node': 'ns=1;i=100001',
-                'barcode_response_node': 'ns=1;i=100002',
-                'barcode_beep_count': 'ns=1;i=100003',
-                'barcode_health_check': 'ns=1;i=100004',
-                'barcode_health_check_message': 'ns=1;i=100005'
-            }],
-            'log_retention_days': 30          
-        }
-    except json.JSONDecodeError as e:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Error decoding JSON config: {e}", type_of_log="ERROR")
-        sys.exit(1)
-    except Exception as e:
-        log_and_print(funkce=inspect.currentframe().f_code.co_name, text=f"Error reading configuration: {e}", type_of_log="ERROR")
-        sys.exit(1)
-#-------------------------------------------------------------------------------------------------------------------
+    index, count = shard
+    worker_name = multiprocessing.current_process().name
 
-#-------------------------------------------------------------------------------------------------------------------
-# Function to read from the serial port and process scanned barcodes
-#-------------------------------------------------------------------------------------------------------------------
-def read(scanner_config, scanner_name="Scanner"):
-    global continue_reading
+    handler = QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter(f"{worker_name}: %(message)s"))
+    logger.addHandler(handler)
+    logging.getLogger('opcua').setLevel(logging.ERROR)
 
-    pPort = scanner_config['port']
-    pBudrate = scanner_config['baudrate']
-    pTimeout = scanner_config['timeout']
-    pRtscts = scanner_config['rtscts']
-    pDsrdtr = scanner_config['dsrdtr']
-    barcode_node = scanner_config['barcode_node']
-    barcode_response_node = scanner_config['barcode_response_node']
-    barcode_beep_count = scanner_config['barcode_beep_count']
-    barcode_health_check = scanner_config['barcode_health_check']
-    barcode_health_check_message = scanner_config['barcode_health_check_message']
+    # A supervisor that died without stopping its workers must not leave the serial ports open
+    def watch_supervisor():
+        multiprocessing.connection.wait([multiprocessing.parent_process().sentinel])
+        request_shutdown()
 
-    try:
-        # Zde to chce nastavit práva pro skupinu dialout
-        # sudo usermod -a -G dialout $USER
-        # viz poznamky.txt -> Připojení scanneru
-        # Momentálnš rtscts a dsrdtr ponechat false
+    threading.Thread(target=watch_supervisor, name="WatchSupervisor", daemon=True).start()
 
-        ser = serial.Serial(pPort, baudrate=pBudrate, timeout=pTimeout, rtscts=pRtscts, dsrdtr=pDsrdtr)
-            
-        log_and_print(f"{scanner_name} ({pPort}): Listening for barcodes...")
-    except serial.SerialException as e:
-        log_and_print(f"{scanner_name} ({pPort}): Error opening serial port: {e}", type_of_log="ERROR")
-        return
+    global server_url
 
-    try:
+    config_watcher = ConfigWatcher(get_config_path(), shard)
+    with startup_profile.phase("load config"):
+        scanners_config = shard_scanners(get_scanner_configurations(), shard)
+        server_url = get_server_url()
+    logger.setLevel(getattr(logging, get_log_level(), logging.INFO))
 
-        health_timer_count = 0
+    runtime = options['runtime']
+    if runtime != "asyncio":
+        threading.Thread(target=_load_opcua, name="ImportOpcua", daemon=True).start()
 
-        while continue_reading:
-            if ser.in_waiting:               
+    if options['metrics_port']:
+        with startup_profile.phase("metrics server"):
+            start_metrics_server(options['metrics_port'] + 1 + index)
+    if options['scan_socket']:
+        # Every worker publishes its own ports: scans.sock -> scans-1.sock, scans-2.sock, ...
+        base, ext = os.path.splitext(options['scan_socket'])
+        scan_publisher.start(f"{base}-{index + 1}{ext}")
+    if options['scan_trace']:
+        scan_tracer.start(os.path.join(get_script_path(), "log", f"{logger_name}_trace-{index + 1}.csv"))
 
-                barcode = ser.readline().decode('utf-8').strip()
-                log_and_print(f"{scanner_name}: Scanned: {barcode}")
+    scanner_count = len({scanner_cfg['port'] for scanner_cfg in scanners_config})
+    threading.Thread(target=report_startup, args=(scanner_count, options['startup_profile']), name="StartupProfile", daemon=True).start()
 
-                zapis_do_opc(barcode_response_node, False) 
-                zapis_do_opc(barcode_node, barcode)    
+    log_and_print(f"Shard {index + 1}/{count}: {', '.join(scanner_cfg['port'] for scanner_cfg in scanners_config) or 'no ports'}")
+    try:
+        run_scanners(runtime, scanners_config, config_watcher, dict(options['names']))
+    finally:
+        scan_publisher.stop()
+        scan_tracer.stop()
+    log_and_print("Stopped")
 
-                potrvzeni = False
+class Supervisor:
+    """
+    Worker processes of the multi-process mode, each one serving the serial
+    ports of its shard (shard_of) with its own OPC session.
 
-                pocet = 0
-                while potrvzeni is False and pocet < 20:
-                    potrvzeni = cteni_z_opc(barcode_response_node)
-                    time.sleep(0.1)
-                    pocet = pocet + 1
+    A worker that exits on its own is restarted with its own backoff while
+    the other workers keep reading. stop() asks all workers to finish with
+    SIGTERM and kills the ones still running after worker_stop_timeout.
+    """
+    def __init__(self, count, options, handlers):
+        self.count = count
+        self.options = options
+        self._context = multiprocessing.get_context("spawn")
+        self._log_queue = self._context.Queue()
+        self._listener = QueueListener(self._log_queue, *handlers, respect_handler_level=True)
+        self._workers = {}      # shard index -> {'process', 'backoff', 'restart_at'}
 
-                log_and_print(f"{scanner_name}: Počet: {pocet}", type_of_log="DEBUG")
+    def start(self):
+        self._listener.start()
+        for index in range(self.count):
+            self._workers[index] = {'process': None, 'backoff': RestartBackoff(), 'restart_at': None}
+            self._start_worker(index)
 
-                if potrvzeni == True:
-                    bytestosend = bytes([0x06])
+    def _start_worker(self, index):
+        worker = self._workers[index]
+        process = self._context.Process(target=worker_main, args=((index, self.count), self.options, self._log_queue), name=f"Worker-{index + 1}")
+        process.start()
+        worker.update(process=process, restart_at=None)
+        worker['backoff'].started()
+        log_and_print(f"Started {process.name} (pid {process.pid}) for shard {index + 1}/{self.count}")
 
-                    log_and_print(f"{scanner_name}: Potvrzení ACK")
-                    ser.write(bytestosend) 
+    def run(self):
+        """Supervise the workers until shutdown is requested"""
+        next_restart = None
+        while not shutdown_event.is_set():
+            # Wakes up as soon as a worker exits or shutdown is requested
+            sentinels = [worker['process'].sentinel for worker in self._workers.values() if worker['restart_at'] is None]
+            multiprocessing.connection.wait(sentinels + [shutdown_event.fileno()], timeout=next_restart)
+            if shutdown_event.is_set():
+                break
+            next_restart = self.restart_dead()
 
-                    zapis_do_opc(barcode_response_node, False) 
+    def restart_dead(self):
+        """
+        Restart the worker processes that exited on their own once their backoff delay passed
 
-                    pocet_pipnuti = cteni_z_opc(barcode_beep_count)
-                    for i in range(pocet_pipnuti):
-                        bytestosend = bytes([0x07])
-                        ser.write(bytestosend)
-                        time.sleep(0.5)
+        Returns:
+            float: Seconds until the next pending restart, None if nothing waits for one
+        """
+        now = time.monotonic()
+        next_restart = None
+        for index, worker in self._workers.items():
+            process = worker['process']
+            if process.is_alive():
+                continue
+            if worker['restart_at'] is None:
+                process.join()
+                delay = worker['backoff'].failed()
+                worker['restart_at'] = now + delay
+                log_and_print(f"{process.name} exited with code {process.exitcode}, restarting in {delay:.0f} s", type_of_log="WARNING")
+            if worker['restart_at'] <= now:
+                metrics.inc("supervisor_worker_restarts_total", worker=process.name)
+                self._start_worker(index)
+            else:
+                wait = worker['restart_at'] - now
+                next_restart = wait if next_restart is None else min(next_restart, wait)
+        return next_restart
 
-                    log_and_print(text=f"Potvrzení - {potrvzeni}", type_of_log="DEBUG")
+    def forward(self, signum):
+        """Pass a diagnostics signal on to the running workers"""
+        for worker in self._workers.values():
+            process = worker['process']
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signum)
 
-                if potrvzeni == False:
-                    log_and_print(text=f"Potvrzení - {potrvzeni}", type_of_log="DEBUG")
-            
-            # Write to opc tag health_check every 10 seconds
-            if health_timer_count >= 100:
-                health_check = cteni_z_opc(barcode_health_check)
-                health_check += 1
-                zapis_do_opc(barcode_health_check, health_check)
-                health_timer_count = 0
+    def stop(self):
+        processes = [worker['process'] for worker in self._workers.values()]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
 
-            health_timer_count += 1
+        deadline = time.monotonic() + worker_stop_timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                log_and_print(f"{process.name} did not stop within {worker_stop_timeout:.0f} s, killing it", type_of_log="WARNING")
+                process.kill()
+                process.join()
 
-            time.sleep(0.1)  # Prevent busy waiting
-    except KeyboardInterrupt as ki:
-        log_and_print(text=f"Stopped - {ki}", type_of_log="ERROR")
-        zapis_do_opc(barcode_health_check, 0)
-        zapis_do_opc(barcode_health_check_message, f"Stopped - {ki}")
-    except Exception as ex:
-        log_and_print(text=f"Error - {ex}", type_of_log="ERROR")
-        zapis_do_opc(barcode_health_check, 0)
-        zapis_do_opc(barcode_health_check_message, f"Stopped - {ki}")
-    finally:
-        ser.close()
+        self._listener.stop()
+        self._log_queue.close()
 #-------------------------------------------------------------------------------------------------------------------
 
 #-------------------------------------------------------------------------------------------------------------------
 # Main function to start the scanner thread
 #-------------------------------------------------------------------------------------------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barcode scanner (RS232) to OPC UA gateway")
+    parser.add_argument("--no-remote", action="store_true", help="Do not update scan_rs232.json from the remote API (benchmarks, offline tests)")
+    parser.add_argument("--runtime", choices=("threads", "asyncio"), help="threads: one thread per scanner, asyncio: one event loop for all scanners (needs asyncua, default: 'runtime' from scan_rs232.json)")
+    parser.add_argument("--startup-profile", action="store_true", help="Print the time spent in each startup phase once all scanners are ready")
+    parser.add_argument("--workers", type=int, help="Spread the serial ports over this many worker processes (default: 'workers' from scan_rs232.json, 1 keeps all ports in this process)")
+    parser.add_argument("--soak", type=float, metavar="HOURS", help="Soak run: serve simulated pty scanners against a local OPC UA stand-in for HOURS and write a memory/fd/thread growth report to log/ (implies --no-remote, one process)")
+    parser.add_argument("--soak-scanners", type=int, default=4, help="Simulated scanners of the soak run (default: 4)")
+    parser.add_argument("--soak-rate", type=float, default=1.0, help="Maximum scans per second per simulated scanner (default: 1)")
+    parser.add_argument("--soak-interval", type=float, default=60.0, help="Seconds between two tracemalloc/fd/thread samples of the soak run (default: 60)")
+    parser.add_argument("--soak-unplug", type=float, default=0.0, help="Unplug and reconnect one simulated scanner every this many seconds (default: 0, never)")
+    args = parser.parse_args()
+    startup_profile.record("module import", _process_start, time.perf_counter())
+
     #---------------------------------------------------------
     # Setting for logging
     #---------------------------------------------------------
-    logger = logging.getLogger(logger_name)
+    logging_start = time.perf_counter()
     logger.setLevel(logging.DEBUG)
 
     actual_dir = get_script_path()
@@ -410,19 +3994,35 @@ if __name__ == "__main__":
         datefmt="%Y-%m-%d %H:%M:%S"
     )
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    setup_logging([handler, console_handler])
+    startup_profile.record("logging setup", logging_start, time.perf_counter())
     #-------------------------------------------------
 
     log_and_print(text='-----------------------------------------------------')
     log_and_print(text="Začátek")
 
-    update_local_config_from_remote()
+    soak = args.soak is not None
+    if not args.no_remote and not soak:
+        if not os.path.exists(get_config_path()):
+            # Nothing to start from yet, the very first start has to wait for the API
+            update_local_config_from_remote()
+        # Start from the local config, remote changes arrive through the config watcher
+        start_remote_config_refresh()
+
+    # Watch the file from before it is read, so a refresh finishing meanwhile is not missed
+    config_watcher = ConfigWatcher(get_config_path())
 
     # Load configuration from conf module
-    scanners_config = get_scanner_configurations()
-    log_retention_days = get_log_retention_days()
-    log_level = get_log_level()
-    version = get_version()
+    with startup_profile.phase("load config"):
+        scanners_config = get_scanner_configurations()
+        server_url = get_server_url()
+        log_retention_days = get_log_retention_days()
+        log_level = get_log_level()
+        version = get_version()
     
     # Convert string log level to logging constant
     numeric_level = getattr(logging, log_level, logging.INFO)
@@ -431,44 +4031,104 @@ if __name__ == "__main__":
     logging.getLogger('opcua').setLevel(logging.ERROR)
     logging.getLogger(logger_name).setLevel(numeric_level)
 
+    if get_log_format() == "json":
+        handler.setFormatter(JsonLinesFormatter())
+    if not get_log_console():
+        console_handler.setLevel(logging.CRITICAL + 1)
+
+    runtime = args.runtime or get_runtime()
+    # tracemalloc of a soak run only sees this process
+    workers = 1 if soak else max(1, args.workers or get_workers())
+
+    # Ctrl+C and the service manager both go through request_shutdown, the loops below stop everything in order
+    signal.signal(signal.SIGINT, _shutdown_signal)
+    signal.signal(signal.SIGTERM, _shutdown_signal)
+
+    # SIGUSR1/SIGUSR2 of the supervisor reach its workers too
+    supervisor = None
+
+    def forward_to_workers(signum):
+        if supervisor is not None:
+            supervisor.forward(signum)
+
+    install_diagnostics(log_dir, forward_to_workers)
+
+    # The independent startup steps run next to each other, the scanners do not wait for them
+    if runtime != "asyncio" and workers == 1:
+        threading.Thread(target=_load_opcua, name="ImportOpcua", daemon=True).start()
+
+    def cleanup_in_background():
+        with startup_profile.phase("log cleanup"):
+            cleanup_old_logs(log_dir, log_retention_days)
+
     # Clean up old log files
-    cleanup_old_logs(log_dir, log_retention_days)
+    threading.Thread(target=cleanup_in_background, name="LogCleanup", daemon=True).start()
 
-    log_and_print(f"Starting {len(scanners_config)} scanner(s)...")
+    # A soak run may share the machine with the real service, it keeps off its port
+    metrics_port = 0 if soak else get_metrics_port()
+    if metrics_port:
+        with startup_profile.phase("metrics server"):
+            start_metrics_server(metrics_port)
 
-    # Create and start threads for all scanners
-    scanner_threads = []
-    for idx, scanner_cfg in enumerate(scanners_config):
-        scanner_name = f"Scanner-{idx+1}"
-        log_and_print(f"Initializing {scanner_name} on port {scanner_cfg['port']}")
-        thread = threading.Thread(target=read, args=(scanner_cfg, scanner_name), name=scanner_name)
-        scanner_threads.append(thread)
-        thread.start()
+    if soak:
+        import shutil
+        import tempfile
+        from bench.soak import run_soak
+
+        # Never the journal of the real service, its trimming would drop their undelivered scans
+        soak_dir = tempfile.mkdtemp(prefix="scan_rs232_soak_")
+        journal_path = os.path.join(soak_dir, "scan_journal.sqlite3")
+
+        def run_soak_service(soak_configs, soak_watcher):
+            configs = [scanner_with_defaults(scanner_cfg, idx) for idx, scanner_cfg in enumerate(soak_configs)]
+            if get_scan_trace():
+                scan_tracer.start(os.path.join(log_dir, f"{logger_name}_soak_trace.csv"))
+            try:
+                run_scanners(runtime, configs, soak_watcher)
+            finally:
+                scan_tracer.stop()
 
-    while True:
         try:
-            # Keep the main thread alive and check if all scanner threads are still running
-            all_alive = True
-            for thread in scanner_threads:
-                thread.join(timeout=1)
-                if not thread.is_alive():
-                    log_and_print(f"Thread {thread.name} is not alive", type_of_log="WARNING")
-                    all_alive = False
-            
-            if not all_alive:
-                continue_reading = False              
-                break
-        except KeyboardInterrupt as ki:
-            print()
-            log_and_print(f"Error in while cycle {ki} Exiting...", type_of_log="ERROR")
-            continue_reading = False
-            break
+            # The OPC stand-in gets a free port, not the one of a local OPC server
+            run_soak(
+                run_soak_service, request_shutdown, log_and_print, args.soak,
+                scanners=args.soak_scanners, rate=args.soak_rate, interval=args.soak_interval, unplug_every=args.soak_unplug,
+                report_path=os.path.join(log_dir, f"{logger_name}_soak_{actual_date_time()}.json"),
+                info={'version': version, 'runtime': runtime, 'python': sys.version.split()[0]},
+            )
+        finally:
+            shutil.rmtree(soak_dir, ignore_errors=True)
+    elif workers > 1:
+        # Names follow the whole scanner list, so they do not depend on which worker serves a port
+        names = {}
+        for scanner_cfg in scanners_config:
+            nazev_skeneru(names, scanner_cfg['port'])
+
+        log_and_print(f"Starting {workers} worker processes for {len(scanners_config)} scanner(s) on the {runtime} runtime...")
+        supervisor = Supervisor(workers, {'runtime': runtime, 'names': names, 'metrics_port': metrics_port, 'scan_socket': get_scan_socket(), 'scan_trace': get_scan_trace(), 'startup_profile': args.startup_profile}, [handler, console_handler])
+        supervisor.start()
+        try:
+            supervisor.run()
+        finally:
+            supervisor.stop()
+    else:
+        scanner_count = len({scanner_cfg['port'] for scanner_cfg in scanners_config})
+        threading.Thread(target=report_startup, args=(scanner_count, args.startup_profile), name="StartupProfile", daemon=True).start()
+
+        scan_socket = get_scan_socket()
+        if scan_socket:
+            scan_publisher.start(scan_socket)
+        if get_scan_trace():
+            scan_tracer.start(os.path.join(log_dir, f"{logger_name}_trace.csv"))
+        try:
+            run_scanners(runtime, scanners_config, config_watcher)
+        finally:
+            scan_publisher.stop()
+            scan_tracer.stop()
 
-    # Wait for all scanner threads to finish
-    for thread in scanner_threads:
-        thread.join()
+    stop_remote_config_refresh()
 
-    log_and_print("Konec", actual_date_time())
+    log_and_print("Konec", funkce=actual_date_time())
     log_and_print('-----------------------------------------------------')
 #-------------------------------------------------------------------------------------------------------------------
     #read(pPort=pPort, pBudrate=pBudrate, pTimeout=pTimeout)
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""conf.conf against a local stand-in of the remote config API"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conf import conf
+
+DEVICE = "test-gw"
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        api = self.server.api
+        api.requests.append((self.path, self.headers.get('If-None-Match')))
+        document = api.documents.get(self.path.split("?")[0])
+        if document is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{api.version}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ApiStandIn:
+    def __init__(self):
+        self.version = 1
+        self.requests = []
+        self.documents = {
+            "/getConfigScanner": {"scanner_configurations": [{"port": "/dev/ttyUSB0"}]},
+            "/getConfigRoot": {"log_level": "DEBUG", "log_retention_days": "7"},
+        }
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ApiHandler)
+        self.server.api = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    stand_in = ApiStandIn()
+    monkeypatch.setattr(conf, "get_conf_path", lambda: str(tmp_path))
+    monkeypatch.setattr(conf, "API_BASE_URL", stand_in.url)
+    monkeypatch.setattr(conf, "_config", None)
+    monkeypatch.setattr(conf, "_remote_cache", None)
+    monkeypatch.setattr(conf, "_api_connections", [])
+    yield stand_in
+    for connection in conf._api_connections:
+        connection.close()
+    stand_in.close()
+
+def write_local(tmp_path, data):
+    with open(tmp_path / "scan_rs232.json", "w") as f:
+        json.dump(data, f)
+
+def read_local(tmp_path):
+    with open(tmp_path / "scan_rs232.json") as f:
+        return json.load(f)
+
+def test_api_get_revalidates_with_etag(api, tmp_path):
+    first = conf._api_get("/getConfigRoot?name=x")
+    second = conf._api_get("/getConfigRoot?name=x")
+
+    assert first == second == api.documents["/getConfigRoot"]
+    assert api.requests == [("/getConfigRoot?name=x", None), ("/getConfigRoot?name=x", '"1"')]
+    with open(tmp_path / "remote_cache.json") as f:
+        assert json.load(f)["/getConfigRoot?name=x"]["etag"] == '"1"'
+
+def test_api_get_takes_changed_document(api):
+    conf._api_get("/getConfigRoot?name=x")
+    api.version = 2
+    api.documents["/getConfigRoot"] = {"log_level": "ERROR", "log_retention_days": 1}
+
+    assert conf._api_get("/getConfigRoot?name=x") == {"log_level": "ERROR", "log_retention_days": 1}
+
+def test_api_get_cache_survives_restart(api):
+    conf._api_get("/getConfigRoot?name=x")
+    conf._remote_cache = None
+
+    assert conf._api_get("/getConfigRoot?name=x") == api.documents["/getConfigRoot"]
+    assert api.requests[-1][1] == '"1"'
+
+def test_api_get_raises_on_http_error(api):
+    with pytest.raises(Exception, match="HTTP 404"):
+        conf._api_get("/missing")
+
+def test_update_keeps_local_settings(api, tmp_path):
+    write_local(tmp_path, {
+        "log_level": "INFO",
+        "log_retention_days": 30,
+        "runtime": "asyncio",
+        "workers": 4,
+        "metrics_port": 0,
+        "remote_refresh_interval": 60,
+        "scanner_configurations": [{"port": "/dev/ttyS0"}],
+    })
+
+    assert conf.update_local_config_from_remote(DEVICE)
+
+    data = read_local(tmp_path)
+    assert data["runtime"] == "asyncio"
+    assert data["workers"] == 4
+    assert data["metrics_port"] == 0
+    assert data["remote_refresh_interval"] == 60
+    assert data["log_level"] == "DEBUG"
+    assert data["log_retention_days"] == 7
+    assert data["scanner_configurations"] == [{"port": "/dev/ttyUSB0"}]
+    assert conf.get_runtime() == "asyncio"
+    assert conf.get_workers() == 4
+
+def test_update_leaves_unchanged_file_alone(api, tmp_path):
+    write_local(tmp_path, {"runtime": "asyncio"})
+    assert conf.update_local_config_from_remote(DEVICE)
+    written = os.stat(tmp_path / "scan_rs232.json").st_mtime_ns
+    os.remove(tmp_path / "scan_rs232.json.backup")
+
+    assert conf.update_local_config_from_remote(DEVICE)
+    assert os.stat(tmp_path / "scan_rs232.json").st_mtime_ns == written
+    assert not os.path.exists(tmp_path / "scan_rs232.json.backup")
+
+def test_update_without_local_file(api, tmp_path):
+    assert conf.update_local_config_from_remote(DEVICE)
+    assert read_local(tmp_path)["scanner_configurations"] == [{"port": "/dev/ttyUSB0"}]
+
+def test_update_copies_opc_servers(api, tmp_path):
+    api.documents["/getConfigRoot"]["server_url"] = "opc.tcp://plc:4840"
+    api.documents["/getConfigScanner"]["opc_redundancy"] = "parallel"
+
+    assert conf.update_local_config_from_remote(DEVICE)
+
+    data = read_local(tmp_path)
+    assert data["server_url"] == "opc.tcp://plc:4840"
+    assert data["opc_redundancy"] == "parallel"
+    assert conf.get_scanner_configurations()[0]["server_url"] == "opc.tcp://plc:4840"
+
+def test_update_fails_without_api(api, tmp_path):
+    write_local(tmp_path, {"runtime": "asyncio"})
+    api.close()
+    conf._api_connections.clear()
+
+    assert not conf.update_local_config_from_remote(DEVICE, timeout=1)
+    assert read_local(tmp_path) == {"runtime": "asyncio"}
+
+def test_scanner_defaults_from_top_level():
+    root = {"server_url": "opc.tcp://a:4840", "standby_server_urls": "opc.tcp://b:4840"}
+
+    scanner = conf.scanner_with_defaults({"port": "/dev/ttyS1"}, 0, root)
+    own = conf.scanner_with_defaults({"port": "/dev/ttyS2", "server_url": "opc.tcp://c:4840", "opc_redundancy": "Parallel"}, 1, root)
+
+    assert scanner["server_url"] == "opc.tcp://a:4840"
+    assert scanner["standby_server_urls"] == ["opc.tcp://b:4840"]
+    assert scanner["opc_redundancy"] == "failover"
+    assert own["server_url"] == "opc.tcp://c:4840"
+    assert own["opc_redundancy"] == "parallel"
@@ -0,0 +1,36 @@
+"""DuplicateFilter: repeated scans answered without going to OPC"""
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+
+from scan_rs232 import DuplicateFilter, duplicate_filter
+
+def test_repeat_within_window():
+    duplicates = DuplicateFilter(0.2)
+    assert not duplicates.is_duplicate("A")
+    duplicates.record("A")
+    assert duplicates.is_duplicate("A")
+    assert not duplicates.is_duplicate("B")
+
+def test_window_not_extended_by_duplicates():
+    duplicates = DuplicateFilter(0.1)
+    duplicates.record("A")
+    time.sleep(0.06)
+    assert duplicates.is_duplicate("A")
+    time.sleep(0.06)
+    assert not duplicates.is_duplicate("A")
+
+def test_oldest_evicted_above_max_size():
+    duplicates = DuplicateFilter(10, max_size=2)
+    for barcode in ("A", "B", "C"):
+        duplicates.record(barcode)
+    assert not duplicates.is_duplicate("A")
+    assert duplicates.is_duplicate("B")
+    assert duplicates.is_duplicate("C")
+
+def test_off_without_window():
+    assert duplicate_filter({}) is None
+    assert duplicate_filter({'duplicate_window': 0}) is None
+    assert duplicate_filter({'duplicate_window': 2, 'duplicate_cache_size': 8}).max_size == 8
@@ -0,0 +1,67 @@
+"""BarcodeFramer: splitting the serial byte stream into barcodes"""
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+
+from scan_rs232 import BarcodeFramer
+
+def framer(**config):
+    config.setdefault('port', '/dev/ttyS0')
+    config.setdefault('timeout', 0.1)
+    return BarcodeFramer(config)
+
+def test_frames_split_over_reads():
+    f = framer()
+    assert f.feed(b"ABC") == []
+    assert f.feed(b"123\nDEF") == ["ABC123"]
+    assert f.feed(b"456\n") == ["DEF456"]
+
+def test_batch_in_one_read():
+    f = framer(frame_terminator="\r\n")
+    assert f.feed(b"A1\r\nB2\r\nC3\r\n") == ["A1", "B2", "C3"]
+    assert len(f.arrivals) == 3
+
+def test_empty_frames_skipped():
+    assert framer().feed(b"\n\nX\n\n") == ["X"]
+
+def test_prefix_drops_noise():
+    f = framer(frame_prefix="\x02", frame_terminator="\x03")
+    assert f.feed(b"noise\x02CODE1\x03junk\x02CO") == ["CODE1"]
+    assert f.feed(b"DE2\x03") == ["CODE2"]
+
+def test_fixed_length_frames():
+    f = framer(frame_terminator="", frame_length=4)
+    assert f.feed(b"ABCDEFGH") == ["ABCD", "EFGH"]
+    assert f.feed(b"IJ") == []
+    assert f.feed(b"KL") == ["IJKL"]
+
+def test_fixed_length_with_optional_terminator():
+    assert framer(frame_length=3).feed(b"ABC\nDEF") == ["ABC", "DEF"]
+
+def test_aim_id_stripped():
+    assert framer(aim_id=True).feed(b"]C1CODE128\n") == ["CODE128"]
+
+def test_invalid_bytes_replaced():
+    assert framer().feed(b"A\xffB\n") == ["A�B"]
+
+def test_unterminated_frame_flushed_after_timeout():
+    f = framer(timeout=0.05)
+    assert f.feed(b"PARTIAL") == []
+    assert f.flush() == []
+    assert 0 < f.pending_timeout() <= 0.05
+
+    time.sleep(0.06)
+    assert f.flush() == ["PARTIAL"]
+    assert f.pending_timeout() is None
+
+def test_reset_drops_partial_frame():
+    f = framer()
+    f.feed(b"LOST")
+    f.reset()
+    assert f.feed(b"NEW\n") == ["NEW"]
+
+def test_needs_terminator_or_length():
+    with pytest.raises(ValueError):
+        framer(frame_terminator="")
@@ -0,0 +1,134 @@
+"""Handing a journaled barcode to the OPC servers of a scanner and waiting for the ACK"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("serial")
+
+from scan_rs232 import AckWaiter, AsyncAckWaiter, BarcodeJournal, Scan, _predani_do_opc_async, _predani_journalu_async, predani_do_opc
+from conf.conf import scanner_with_defaults
+
+class Server:
+    """Stand-in for one OPC server of OpcEndpoints, confirms through the AckWaiter"""
+    def __init__(self, name, connected=True, accepts=True):
+        self.name = name
+        self.connected = connected
+        self.accepts = accepts
+
+    def is_connected(self):
+        return self.connected
+
+    def is_subscribed(self, nodeid):
+        return True
+
+class Endpoints:
+    """Failover over `servers`, the PLC of `confirming` sets the response node"""
+    def __init__(self, servers, ack_waiter, confirming=None):
+        self.servers = servers
+        self.primary = servers[0]
+        self.ack_waiter = ack_waiter
+        self.confirming = confirming or []
+
+    def is_connected(self):
+        return any(server.connected for server in self.servers)
+
+    def write(self, hodnoty, ack_waiter=None):
+        for server in self.servers:
+            if server.connected:
+                ack_waiter.arm([server])
+                if server.accepts:
+                    for plc in self.confirming:
+                        self.ack_waiter.notify(True, plc)
+                    return [server]
+                # A refused write leaves the session connected
+        return []
+
+class AsyncEndpoints(Endpoints):
+    """AsyncOpcEndpoints stand-in"""
+    async def write(self, hodnoty, ack_waiter=None):
+        return super().write(hodnoty, ack_waiter)
+
+    async def reset(self, nodeid):
+        pass
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = BarcodeJournal(str(tmp_path / "journal.sqlite3"))
+    yield journal
+    journal.close()
+
+@pytest.fixture
+def scanner_config():
+    config = scanner_with_defaults({'port': '/dev/ttyS0'})
+    config['ack_timeout'] = 0.2
+    return config
+
+def handover(journal, scanner_config, endpoints, ack_waiter):
+    entry_id = journal.append('/dev/ttyS0', "CODE", 100.0)
+    return predani_do_opc(entry_id, Scan("CODE", 100.0), scanner_config, "Test", endpoints, ack_waiter, journal)
+
+def test_confirmed(journal, scanner_config):
+    ack_waiter = AckWaiter()
+    server = Server("primary")
+    assert handover(journal, scanner_config, Endpoints([server], ack_waiter, [server]), ack_waiter) is True
+    assert ack_waiter.session is server
+    assert journal.oldest('/dev/ttyS0') is None
+
+def test_ack_of_another_server_ignored(journal, scanner_config):
+    ack_waiter = AckWaiter()
+    primary, standby = Server("primary"), Server("standby")
+    # A late ACK of the standby for an earlier barcode must not confirm this one
+    assert handover(journal, scanner_config, Endpoints([primary, standby], ack_waiter, [standby]), ack_waiter) is False
+    assert ack_waiter.session is None
+
+def test_no_server_keeps_barcode(journal, scanner_config):
+    ack_waiter = AckWaiter()
+    endpoints = Endpoints([Server("primary", connected=False)], ack_waiter)
+    assert handover(journal, scanner_config, endpoints, ack_waiter) is None
+    assert journal.oldest('/dev/ttyS0')[1] == "CODE"
+
+def test_rejected_write_drops_barcode(journal, scanner_config):
+    ack_waiter = AckWaiter()
+    endpoints = Endpoints([Server("primary", accepts=False)], ack_waiter)
+    assert handover(journal, scanner_config, endpoints, ack_waiter) is False
+    # The next scan of the port is not stuck behind it
+    assert journal.oldest('/dev/ttyS0') is None
+
+def test_first_ack_wins():
+    ack_waiter = AckWaiter()
+    primary, standby = Server("primary"), Server("standby")
+    ack_waiter.arm([primary, standby])
+    ack_waiter.notify(False, primary)
+    ack_waiter.notify(True, standby)
+    ack_waiter.notify(True, primary)
+    assert ack_waiter.wait(0) and ack_waiter.session is standby
+
+    ack_waiter.arm([primary])
+    assert not ack_waiter.wait(0) and ack_waiter.session is None
+
+def test_async_no_server_keeps_barcode(journal, scanner_config):
+    async def main():
+        ack_waiter = AsyncAckWaiter()
+        endpoints = AsyncEndpoints([Server("primary", connected=False)], ack_waiter)
+        entry_id = journal.append('/dev/ttyS0', "CODE", 100.0)
+        return await _predani_do_opc_async(entry_id, Scan("CODE", 100.0), scanner_config, "Test", endpoints, ack_waiter, journal)
+
+    # No wait for an ACK that cannot come, the barcode stays for the forwarder
+    assert asyncio.run(asyncio.wait_for(main(), 0.1)) is None
+    assert journal.oldest('/dev/ttyS0')[1] == "CODE"
+
+def test_async_journal_forwarded_once_connected(journal, scanner_config):
+    server = Server("primary", connected=False)
+
+    async def main():
+        ack_waiter = AsyncAckWaiter()
+        endpoints = AsyncEndpoints([server], ack_waiter, [server])
+        for barcode in ("A", "B"):
+            journal.append('/dev/ttyS0', barcode, 100.0)
+        left = [await _predani_journalu_async('/dev/ttyS0', scanner_config, "Test", endpoints, ack_waiter, journal)]
+        server.connected = True
+        left.append(await _predani_journalu_async('/dev/ttyS0', scanner_config, "Test", endpoints, ack_waiter, journal))
+        return left
+
+    assert asyncio.run(main()) == [True, False]
+    assert journal.oldest('/dev/ttyS0') is None
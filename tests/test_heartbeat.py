@@ -0,0 +1,66 @@
+"""HeartbeatScheduler: counter range of the declared type, one bad node per session"""
+import pytest
+
+pytest.importorskip("serial")
+ua = pytest.importorskip("opcua").ua
+
+import scan_rs232
+from scan_rs232 import HeartbeatScheduler, NodeRegistry
+
+class Session:
+    url = "opc.tcp://test:4840"
+
+    def __init__(self, values, bad=()):
+        self.registry = NodeRegistry(lambda: ua)
+        self.registry.add(values)
+        self.values = dict(values)
+        self.bad = set(bad)
+
+    def is_connected(self):
+        return True
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session({"ns=1;i=1": 65535, "ns=1;i=2": 10})
+
+    def zapis(hodnoty, session):
+        if any(nodeid in session.bad for nodeid, _ in hodnoty):
+            return False
+        session.values.update(hodnoty)
+        return True
+
+    monkeypatch.setattr(scan_rs232, "zapis_do_opc_davka", zapis)
+    monkeypatch.setattr(scan_rs232, "cteni_z_opc_davka", lambda nodeids, session: [session.values[nodeid] for nodeid in nodeids])
+    return session
+
+@pytest.mark.parametrize("datatype, value, expected", [
+    (ua.NodeId(3, 0), 255, 0),              # Byte
+    (ua.NodeId(4, 0), 32767, 0),            # Int16
+    (ua.NodeId(5, 0), 65535, 0),            # UInt16
+    (ua.NodeId(5, 0), 7, 8),
+    (ua.NodeId(6, 0), 2**31 - 1, 0),        # Int32
+    (ua.NodeId(7, 0), 2**31 - 1, 2**31),    # UInt32
+    (None, 2**31 - 1, 0),                   # not known, same as Int32
+])
+def test_counter_wraps_to_declared_type(datatype, value, expected):
+    registry = NodeRegistry(lambda: ua)
+    registry.add(["ns=1;i=1"])
+    registry.update(["ns=1;i=1"], [None], [datatype])
+    assert scan_rs232._next_counter(value, registry.declared_type("ns=1;i=1")) == expected
+
+def test_uint16_counter_wraps(session):
+    session.registry.update(["ns=1;i=1"], [None], [ua.NodeId(5, 0)])
+    heartbeat = HeartbeatScheduler(interval=1)
+    heartbeat.register("ns=1;i=1", session)
+    heartbeat._beat()
+    heartbeat._beat()
+    assert session.values["ns=1;i=1"] == 1
+
+def test_bad_node_does_not_stop_others(session):
+    session.bad.add("ns=1;i=1")
+    heartbeat = HeartbeatScheduler(interval=1)
+    heartbeat.register("ns=1;i=1", session, "Scanner 1")
+    heartbeat.register("ns=1;i=2", session, "Scanner 2")
+    heartbeat._beat()
+    heartbeat._beat()
+    assert session.values == {"ns=1;i=1": 65535, "ns=1;i=2": 12}
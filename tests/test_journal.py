@@ -0,0 +1,78 @@
+"""BarcodeJournal: the on-disk store-and-forward journal"""
+import pytest
+
+pytest.importorskip("serial")
+
+from scan_rs232 import BarcodeJournal
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = BarcodeJournal(str(tmp_path / "data" / "journal.sqlite3"), max_rows=5, trim_every=2)
+    yield journal
+    journal.close()
+
+def test_oldest_per_port_in_scan_order(journal):
+    first = journal.append("/dev/ttyS0", "A", 100.0)
+    journal.append("/dev/ttyS1", "X", 101.0)
+    second = journal.append("/dev/ttyS0", "B", 102.0)
+
+    assert journal.oldest("/dev/ttyS0") == (first, "A", 100.0)
+    journal.delete(first)
+    assert journal.oldest("/dev/ttyS0") == (second, "B", 102.0)
+    journal.delete(second)
+    assert journal.oldest("/dev/ttyS0") is None
+    assert journal.oldest("/dev/ttyS1")[1] == "X"
+
+def test_has_older(journal):
+    first = journal.append("/dev/ttyS0", "A")
+    other = journal.append("/dev/ttyS1", "X")
+    second = journal.append("/dev/ttyS0", "B")
+
+    assert not journal.has_older("/dev/ttyS0", first)
+    assert not journal.has_older("/dev/ttyS1", other)
+    assert journal.has_older("/dev/ttyS0", second)
+    journal.delete(first)
+    assert not journal.has_older("/dev/ttyS0", second)
+
+def rows(journal):
+    return journal._conn.execute("SELECT barcode FROM scans ORDER BY id").fetchall()
+
+def test_trim_drops_oldest(journal):
+    for idx in range(8):
+        journal.append("/dev/ttyS0", f"B{idx}")
+    assert [barcode for barcode, in rows(journal)] == [f"B{idx}" for idx in range(3, 8)]
+
+def test_size_checked_every_trim_every_appends(journal):
+    for idx in range(7):
+        journal.append("/dev/ttyS0", f"B{idx}")
+    # Checked at the 6th append, the 7th is above max_rows until the next check
+    assert len(rows(journal)) == 6
+    journal.compact()
+    assert len(rows(journal)) == 5
+
+def test_survives_reopen(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = BarcodeJournal(path)
+    entry_id = journal.append("/dev/ttyS0", "KEPT", 123.0)
+    journal.close()
+
+    journal = BarcodeJournal(path)
+    try:
+        assert journal.oldest("/dev/ttyS0") == (entry_id, "KEPT", 123.0)
+    finally:
+        journal.close()
+
+def test_trim_keeps_ports_of_other_workers(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    other = BarcodeJournal(path)
+    journal = BarcodeJournal(path, max_rows=2, trim_every=1)
+    try:
+        for idx in range(3):
+            other.append("/dev/ttyS1", f"X{idx}")
+        for idx in range(4):
+            journal.append("/dev/ttyS0", f"B{idx}")
+        journal.compact()
+        assert [barcode for barcode, in rows(journal)] == ["X0", "X1", "X2", "B2", "B3"]
+    finally:
+        journal.close()
+        other.close()
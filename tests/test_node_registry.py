@@ -0,0 +1,39 @@
+"""NodeRegistry: Variant types of the configured nodes"""
+import pytest
+
+pytest.importorskip("serial")
+ua = pytest.importorskip("opcua").ua
+
+from scan_rs232 import NodeRegistry
+
+@pytest.fixture
+def registry():
+    registry = NodeRegistry(lambda: ua)
+    registry.add(["ns=1;i=1", "ns=1;i=2"])
+    return registry
+
+def test_declared_scalar_type_used(registry):
+    registry.update(["ns=1;i=1", "ns=1;i=2"], [None, None], [ua.NodeId(5, 0), ua.NodeId(12, 0)])
+    assert registry.variant_type("ns=1;i=1", 7) == ua.VariantType.UInt16
+    assert registry.variant_type("ns=1;i=2", "abc") == ua.VariantType.String
+
+@pytest.mark.parametrize("datatype", [
+    ua.NodeId(22, 0),       # Structure
+    ua.NodeId(23, 0),       # DataValue
+    ua.NodeId(24, 0),       # BaseDataType
+    ua.NodeId(25, 0),       # DiagnosticInfo
+    ua.NodeId(26, 0),       # Number
+    ua.NodeId(3002, 2),     # custom type
+    None,                   # DataType not readable
+])
+def test_abstract_type_guessed_from_value(registry, datatype):
+    registry.update(["ns=1;i=1"], [None], [datatype])
+    assert registry.variant_type("ns=1;i=1", "abc") == ua.VariantType.String
+    assert registry.variant_type("ns=1;i=1", 3) == ua.VariantType.Int32
+
+def test_clear_forgets_types(registry):
+    registry.update(["ns=1;i=1"], [ua.NodeId(99, 1)], [ua.NodeId(5, 0)])
+    assert registry.nodeid("ns=1;i=1") == ua.NodeId(99, 1)
+    registry.clear()
+    assert registry.nodeid("ns=1;i=1") == ua.NodeId(1, 1)
+    assert registry.variant_type("ns=1;i=1", 7) == ua.VariantType.Int32
@@ -0,0 +1,46 @@
+"""_handle_opc_error: which failures drop the shared OPC session"""
+import concurrent.futures
+import struct
+
+import pytest
+
+pytest.importorskip("serial")
+ua = pytest.importorskip("opcua").ua
+
+import scan_rs232
+
+class Session:
+    url = "opc.tcp://test:4840"
+
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, reason=None):
+        self.invalidated.append(reason)
+
+@pytest.fixture(autouse=True)
+def status_codes(monkeypatch):
+    monkeypatch.setattr(scan_rs232, "_connection_status_codes", scan_rs232._status_codes(ua))
+
+@pytest.mark.parametrize("ex", [
+    BrokenPipeError(32, "Broken pipe"),
+    ConnectionError("OPC server is not connected"),
+    concurrent.futures.TimeoutError(),
+    ua.UaStatusCodeError(ua.StatusCodes.BadSessionIdInvalid),
+])
+def test_connection_errors_invalidate(ex):
+    session = Session()
+    scan_rs232._handle_opc_error(session, ex)
+    assert session.invalidated == [ex]
+
+@pytest.mark.parametrize("ex", [
+    struct.error("ushort format requires 0 <= number <= 65535"),
+    ValueError("Unsupported type"),
+    AttributeError("'str' object has no attribute 'VariantType'"),
+    TypeError("bad value"),
+    ua.UaStatusCodeError(ua.StatusCodes.BadNotWritable),
+])
+def test_request_errors_keep_session(ex):
+    session = Session()
+    scan_rs232._handle_opc_error(session, ex)
+    assert session.invalidated == []
@@ -0,0 +1,100 @@
+"""Opening, losing and reopening serial ports, with bench.sim.PtyScanner as the scanner"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("serial")
+
+import scan_rs232
+from bench.sim import PtyScanner
+from conf.conf import scanner_with_defaults
+
+@pytest.fixture
+def scanner(tmp_path):
+    scanner = PtyScanner("Test", link=str(tmp_path / "scanner"))
+    yield scanner
+    scanner.close()
+
+@pytest.fixture
+def fast_reopen(monkeypatch):
+    monkeypatch.setattr(scan_rs232, "port_reopen_min", 0.05)
+    monkeypatch.setattr(scan_rs232, "port_reopen_max", 0.2)
+    monkeypatch.setattr(scan_rs232, "port_poll_interval", 0.05)
+
+def open_later(scanner_config, stop_event=None):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('ser', scan_rs232.otevreni_portu(scanner_config, "Test", 0.2, stop_event)), daemon=True)
+    thread.start()
+    return thread, result
+
+def read_barcode(ser, scanner, barcode):
+    scanner.scan(barcode)
+    framer = scan_rs232.BarcodeFramer({'port': scanner.port, 'timeout': 0.2, 'frame_terminator': '\r\n'})
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        if scan_rs232.cekani_na_data(ser, 0.1):
+            barcodes = framer.feed(ser.read(ser.in_waiting or 1))
+            if barcodes:
+                return barcodes
+    return []
+
+def test_open_reads_barcode(scanner):
+    ser = scan_rs232.otevreni_portu(scanner_with_defaults({'port': scanner.port}), "Test", 0.2)
+    try:
+        assert read_barcode(ser, scanner, "ABC123") == ["ABC123"]
+    finally:
+        ser.close()
+
+def test_missing_port_opened_when_it_appears(scanner, fast_reopen):
+    scanner.unplug()
+    thread, result = open_later(scanner_with_defaults({'port': scanner.link}))
+    time.sleep(0.3)
+    assert thread.is_alive()
+
+    scanner.plug()
+    thread.join(2)
+    assert not thread.is_alive()
+    try:
+        assert read_barcode(result['ser'], scanner, "AFTER-PLUG") == ["AFTER-PLUG"]
+    finally:
+        result['ser'].close()
+
+def test_unplugged_port_fails_and_reopens(scanner, fast_reopen):
+    scanner_config = scanner_with_defaults({'port': scanner.link})
+    ser = scan_rs232.otevreni_portu(scanner_config, "Test", 0.2)
+    handle = scan_rs232.SerialPortHandle()
+    handle.attach(ser)
+
+    scanner.unplug()
+    with pytest.raises((scan_rs232.serial.SerialException, OSError)):
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            scan_rs232.cekani_na_data(ser, 0.1)
+            ser.read(ser.in_waiting or 1)
+    handle.detach()
+    assert handle.write(scan_rs232.ACK) == 0
+
+    thread, result = open_later(scanner_config)
+    time.sleep(0.2)
+    scanner.plug()
+    thread.join(2)
+    handle.attach(result['ser'])
+    try:
+        assert read_barcode(handle.ser, scanner, "REATTACHED") == ["REATTACHED"]
+        handle.write(scan_rs232.ACK)
+        assert scanner.wait_ack(2) is not None
+    finally:
+        handle.detach()
+
+def test_stop_ends_waiting_for_missing_port(tmp_path, fast_reopen):
+    stop = scan_rs232.WakeupEvent()
+    try:
+        thread, result = open_later(scanner_with_defaults({'port': str(tmp_path / "missing")}), stop)
+        time.sleep(0.2)
+        stop.set()
+        thread.join(2)
+        assert not thread.is_alive()
+        assert result['ser'] is None
+    finally:
+        stop.close()
@@ -0,0 +1,62 @@
+"""ScanQueue: the queue between the port reader and the OPC handshake"""
+import threading
+
+import pytest
+
+pytest.importorskip("serial")
+
+from scan_rs232 import Scan, ScanQueue
+
+def scans(*barcodes):
+    return [Scan(barcode) for barcode in barcodes]
+
+def test_block_refuses_when_full():
+    queue = ScanQueue(2, "block")
+    a, b, c = scans("A", "B", "C")
+    assert queue.offer(a) == (True, None)
+    assert queue.offer(b) == (True, None)
+    assert queue.offer(c) == (False, None)
+    assert queue.dropped == 0
+    assert [queue.take().barcode, queue.take().barcode, queue.take()] == ["A", "B", None]
+
+def test_drop_oldest():
+    queue = ScanQueue(2, "drop_oldest")
+    a, b, c = scans("A", "B", "C")
+    queue.offer(a)
+    queue.offer(b)
+    assert queue.offer(c) == (True, a)
+    assert queue.dropped == 1
+    assert [scan.barcode for scan in queue.drain()] == ["B", "C"]
+
+def test_reject():
+    queue = ScanQueue(1, "reject")
+    a, b = scans("A", "B")
+    queue.offer(a)
+    assert queue.offer(b) == (False, b)
+    assert queue.status() == "Running - queue 1/1, dropped 1"
+
+def test_put_waits_for_space():
+    queue = ScanQueue(1, "block")
+    a, b = scans("A", "B")
+    queue.put(a)
+    putter = threading.Thread(target=queue.put, args=(b,))
+    putter.start()
+    putter.join(0.3)
+    assert putter.is_alive()
+
+    assert queue.get().barcode == "A"
+    putter.join(2)
+    assert queue.get().barcode == "B"
+
+def test_put_keeps_scan_for_drain_when_closed():
+    queue = ScanQueue(1, "block")
+    a, b = scans("A", "B")
+    queue.put(a)
+    queue.close()
+    assert queue.put(b) is None
+    assert queue.get() is None
+    assert [scan.barcode for scan in queue.drain()] == ["A", "B"]
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ScanQueue(4, "fifo")